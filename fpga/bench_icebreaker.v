@@ -0,0 +1,168 @@
+/* iCEBreaker buttons and LEDs for bench_top */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* BTN1 starts a run, BTN2 steps the RAID type and BTN3 the access pattern.
+* Until a run finishes LED1-3 show the RAID type step, LED4-5 the read mix
+* step and the green LED random addressing. The red LED is on while running.
+* Once done LED1-4 show cycles per operation a nibble at a time, low nibble
+* first, with LED5 marking the low nibble. The four drives go on the PMOD 1A
+* and 1B headers. */
+
+module bench_icebreaker (
+		input		reset,	/* Active low button */
+		input		clk,
+
+		input		BTN1,
+		input		BTN2,
+		input		BTN3,
+
+		output		LED1,
+		output		LED2,
+		output		LED3,
+		output		LED4,
+		output		LED5,
+		output		LEDR_N,
+		output		LEDG_N,
+
+		output		spi0_clk,
+		output		spi0_cs,
+		output		spi0_mosi,
+		input		spi0_miso,
+
+		output		spi1_clk,
+		output		spi1_cs,
+		output		spi1_mosi,
+		input		spi1_miso,
+
+		output		spi2_clk,
+		output		spi2_cs,
+		output		spi2_mosi,
+		input		spi2_miso,
+
+		output		spi3_clk,
+		output		spi3_cs,
+		output		spi3_mosi,
+		input		spi3_miso
+	);
+
+	wire nreset;
+	assign nreset = ~reset;
+
+	/* Buttons sampled every 2^16 cycles, which is enough debounce */
+	reg [15:0] btn_div;
+	reg [2:0] btn;
+	reg [2:0] last_btn;
+	wire [2:0] btn_press;
+	assign btn_press = btn & ~last_btn;
+
+	/* Configuration steps */
+	reg [2:0] type_step;
+	reg [1:0] mix_step;
+	reg random;
+
+	reg [3:0] raid_type;
+	reg [3:0] read_mix;
+
+	always @(*) begin
+		case( type_step )
+			0: raid_type = 4'd0;	/* RAID1 */
+			1: raid_type = 4'd1;	/* RAID0 */
+			2: raid_type = 4'd5;	/* RAID5 */
+			3: raid_type = 4'd10;	/* RAID10 */
+			default: raid_type = 4'd6;	/* ECC */
+		endcase
+		case( mix_step )
+			0: read_mix = 4'd0;		/* Writes only */
+			1: read_mix = 4'd4;		/* Half reads */
+			2: read_mix = 4'd6;		/* Three quarters reads */
+			default: read_mix = 4'd8;	/* Reads only */
+		endcase
+	end
+
+	/* Result display */
+	reg [23:0] show_div;
+	wire [1:0] show_nibble;
+	assign show_nibble = show_div[23:22];
+
+	wire running;
+	wire done;
+	wire [31:0] cycles;
+	wire [31:0] ops;
+	wire [31:0] reads;
+	wire [31:0] writes;
+	wire [31:0] cycles_per_op;
+	wire [3:0] nibble;
+	assign nibble = cycles_per_op[4*show_nibble +: 4];
+
+	assign LEDR_N = ~running;
+	assign LEDG_N = ~( !done && random );
+	assign { LED4, LED3, LED2, LED1 } = ( done ) ? nibble : { mix_step[0], type_step };
+	assign LED5 = ( done ) ? (show_nibble == 0) : mix_step[1];
+
+	always @(posedge clk or posedge nreset) begin
+		if( nreset ) begin
+			btn_div <= 0;
+			btn <= 0;
+			last_btn <= 0;
+			type_step <= 0;
+			mix_step <= 0;
+			random <= 0;
+			show_div <= 0;
+		end
+		else begin
+			btn_div <= btn_div + 1;
+			show_div <= show_div + 1;
+			last_btn <= btn;
+			if( btn_div == 0 ) begin
+				btn <= { BTN3, BTN2, BTN1 };
+			end
+
+			if( !running ) begin
+				if( btn_press[1] ) begin
+					type_step <= ( type_step == 4 ) ? 0 : type_step + 1;
+				end
+				if( btn_press[2] ) begin
+					/* Random flips after every pass through the mixes */
+					mix_step <= mix_step + 1;
+					if( mix_step == 3 ) begin
+						random <= ~random;
+					end
+				end
+			end
+		end
+	end
+
+	bench_top bench (
+		.reset( nreset ),
+		.clk( clk ),
+		.start( btn_press[0] ),
+		.cfg_raid_type( raid_type ),
+		.cfg_random( random ),
+		.cfg_read_mix( read_mix ),
+		.running( running ),
+		.done( done ),
+		.cycles( cycles ),
+		.ops( ops ),
+		.reads( reads ),
+		.writes( writes ),
+		.cycles_per_op( cycles_per_op ),
+		.spi0_clk( spi0_clk ),
+		.spi0_cs( spi0_cs ),
+		.spi0_mosi( spi0_mosi ),
+		.spi0_miso( spi0_miso ),
+		.spi1_clk( spi1_clk ),
+		.spi1_cs( spi1_cs ),
+		.spi1_mosi( spi1_mosi ),
+		.spi1_miso( spi1_miso ),
+		.spi2_clk( spi2_clk ),
+		.spi2_cs( spi2_cs ),
+		.spi2_mosi( spi2_mosi ),
+		.spi2_miso( spi2_miso ),
+		.spi3_clk( spi3_clk ),
+		.spi3_cs( spi3_cs ),
+		.spi3_mosi( spi3_mosi ),
+		.spi3_miso( spi3_miso )
+	);
+
+endmodule
@@ -0,0 +1,239 @@
+/* Self running throughput benchmark around wb_spraid */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* Access patterns */
+`define BENCH_SEQUENTIAL	0	/* Window offsets counting up from 0 */
+`define BENCH_RANDOM		1	/* Window offsets from the LFSR */
+
+/* A start pulse sets the RAID type, then runs 2^OPS_LOG2 single word Wishbone
+* operations against the window. Addresses are sequential or random, and
+* cfg_read_mix out of 8 operations are reads, picked by the LFSR, so 0 is
+* writes only and 8 reads only. Write data also comes from the LFSR, which is
+* reseeded on every start so runs are repeatable. cycles counts from the first
+* operation to the last ack, and cycles_per_op is that over the operation
+* count. Everything holds until the next start. */
+
+module bench_top #(
+		parameter OPS_LOG2 = 10,			/* Operations per run, as a power of 2 */
+		parameter ADDR_BITS = 10,			/* Window offsets used, from 0 */
+		parameter LFSR_SEED = 32'hACE12345,
+		parameter RAID_PIPELINE = 0
+	)
+	(
+		input				reset,
+		input				clk,
+
+		/* Run configuration, sampled on start */
+		input				start,
+		input      [3:0]	cfg_raid_type,
+		input				cfg_random,
+		input      [3:0]	cfg_read_mix,	/* Reads out of every 8 operations */
+
+		/* Results */
+		output				running,
+		output reg			done,
+		output reg [31:0]	cycles,
+		output reg [31:0]	ops,
+		output reg [31:0]	reads,
+		output reg [31:0]	writes,
+		output     [31:0]	cycles_per_op,
+
+		/* SPI0 */
+		output				spi0_clk,
+		output				spi0_cs,
+		output				spi0_mosi,
+		input				spi0_miso,
+
+		/* SPI1 */
+		output				spi1_clk,
+		output				spi1_cs,
+		output				spi1_mosi,
+		input				spi1_miso,
+
+		/* SPI2 */
+		output				spi2_clk,
+		output				spi2_cs,
+		output				spi2_mosi,
+		input				spi2_miso,
+
+		/* SPI3 */
+		output				spi3_clk,
+		output				spi3_cs,
+		output				spi3_mosi,
+		input				spi3_miso
+	);
+
+	/* Benchmark state */
+	`define BENCH_IDLE		0
+	`define BENCH_SET_TYPE	1	/* Write RAID type register */
+	`define BENCH_GAP		2	/* Bus idle between operations */
+	`define BENCH_OP		3	/* Operation on the bus, wait for ack */
+	reg [1:0] bench_state;
+
+	reg [31:0] lfsr;
+	reg [ADDR_BITS-1:0] seq_addr;
+	reg last_start;
+
+	reg random;
+	reg [3:0] read_mix;
+
+	/* Wishbone master */
+	reg wb_cyc;
+	reg wb_we;
+	reg [31:0] wb_adr;
+	reg [31:0] wb_dat;
+	wire [31:0] wb_dat_o;
+	wire wb_ack;
+	wire wb_stall;
+	wire wb_err;
+	wire wb_rty;
+
+	assign running = (bench_state != `BENCH_IDLE);
+	assign cycles_per_op = cycles >> OPS_LOG2;
+
+	/* Next operation, taken from the current LFSR value */
+	wire op_read;
+	wire [ADDR_BITS-1:0] op_addr;
+	assign op_read = ( { 1'b0, lfsr[31:29] } < read_mix );
+	assign op_addr = ( random ) ? lfsr[ADDR_BITS-1:0] : seq_addr;
+
+	/* Galois LFSR, x^32 + x^22 + x^2 + x + 1 */
+	function [31:0] lfsr_next;
+		input [31:0] value;
+		begin
+			lfsr_next = (value >> 1) ^ ( value[0] ? 32'h80200003 : 32'h0 );
+		end
+	endfunction
+
+	always @(posedge clk or posedge reset) begin
+		if( reset ) begin
+			bench_state <= `BENCH_IDLE;
+			lfsr <= LFSR_SEED;
+			seq_addr <= 0;
+			last_start <= 0;
+			random <= 0;
+			read_mix <= 0;
+			done <= 0;
+			cycles <= 0;
+			ops <= 0;
+			reads <= 0;
+			writes <= 0;
+			wb_cyc <= 0;
+			wb_we <= 0;
+			wb_adr <= 0;
+			wb_dat <= 0;
+		end
+		else begin
+			last_start <= start;
+
+			/* Count every cycle once operations start */
+			if( running && (bench_state != `BENCH_SET_TYPE) ) begin
+				cycles <= cycles + 1;
+			end
+
+			case( bench_state )
+				`BENCH_IDLE: begin
+					if( start && !last_start ) begin
+						random <= cfg_random;
+						read_mix <= cfg_read_mix;
+						lfsr <= LFSR_SEED;
+						seq_addr <= 0;
+						done <= 1'b0;
+						cycles <= 0;
+						ops <= 0;
+						reads <= 0;
+						writes <= 0;
+
+						wb_cyc <= 1'b1;
+						wb_we <= 1'b1;
+						wb_adr <= `SPRAID_RAID_TYPE;
+						wb_dat <= { 28'b0, cfg_raid_type };
+						bench_state <= `BENCH_SET_TYPE;
+					end
+				end
+
+				`BENCH_SET_TYPE: begin
+					if( wb_ack ) begin
+						wb_cyc <= 1'b0;
+						bench_state <= `BENCH_GAP;
+					end
+				end
+
+				`BENCH_GAP: begin
+					if( ops == (1 << OPS_LOG2) ) begin
+						done <= 1'b1;
+						bench_state <= `BENCH_IDLE;
+					end
+					else begin
+						wb_cyc <= 1'b1;
+						wb_we <= !op_read;
+						wb_adr <= `WB_ADDR_BASE + op_addr;
+						wb_dat <= { lfsr[15:0], lfsr[31:16] };
+						if( op_read ) begin
+							reads <= reads + 1;
+						end
+						else begin
+							writes <= writes + 1;
+						end
+						lfsr <= lfsr_next( lfsr );
+						seq_addr <= seq_addr + 1;
+						bench_state <= `BENCH_OP;
+					end
+				end
+
+				`BENCH_OP: begin
+					if( wb_ack ) begin
+						wb_cyc <= 1'b0;
+						ops <= ops + 1;
+						bench_state <= `BENCH_GAP;
+					end
+				end
+
+				default: begin
+					bench_state <= `BENCH_IDLE;
+				end
+			endcase
+		end
+	end
+
+	wb_spraid #(
+		.RAID_PIPELINE( RAID_PIPELINE ),
+		.HOT_SPARE( 0 )
+	) spraid (
+		.wb_clk_i( clk ),
+		.wb_rst_i( reset ),
+		.wb_cyc_i( wb_cyc ),
+		.wb_stb_i( wb_cyc ),
+		.wb_we_i( wb_we ),
+		.wb_adr_i( wb_adr ),
+		.wb_dat_i( wb_dat ),
+		.wb_sel_i( 4'b1111 ),
+		.wb_dat_o( wb_dat_o ),
+		.wb_ack_o( wb_ack ),
+		.wb_stall_o( wb_stall ),
+		.wb_err_o( wb_err ),
+		.wb_rty_o( wb_rty ),
+		.spi0_clk( spi0_clk ),
+		.spi0_cs( spi0_cs ),
+		.spi0_mosi( spi0_mosi ),
+		.spi0_miso( spi0_miso ),
+		.spi1_clk( spi1_clk ),
+		.spi1_cs( spi1_cs ),
+		.spi1_mosi( spi1_mosi ),
+		.spi1_miso( spi1_miso ),
+		.spi2_clk( spi2_clk ),
+		.spi2_cs( spi2_cs ),
+		.spi2_mosi( spi2_mosi ),
+		.spi2_miso( spi2_miso ),
+		.spi3_clk( spi3_clk ),
+		.spi3_cs( spi3_cs ),
+		.spi3_mosi( spi3_mosi ),
+		.spi3_miso( spi3_miso ),
+		.spi4_clk(),
+		.spi4_cs(),
+		.spi4_mosi(),
+		.spi4_miso( 1'b0 )
+	);
+
+endmodule
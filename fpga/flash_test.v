@@ -69,6 +69,16 @@ module flash_test (
 		.write(write),
 		.addr(test_addr),
 		.din(data),
+		.burst(2'b0),
+		.din_burst(24'b0),
+		.xip_timeout(16'b0),
+		.xip_hit(),
+		.pd_timeout(16'b0),
+		.wake_time(16'b0),
+		.wake(1'b0),
+		.asleep(),
+		.woke(),
+		.wake_wait(),
 		.dout(dout),
 		.busy(busy),
 		
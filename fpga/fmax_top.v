@@ -0,0 +1,245 @@
+/* Timing wrappers for fmax runs */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* The host side buses are far wider than the pins on the iCEBreaker part, so
+* these wrappers shift them in from one pin and fold every output into one
+* registered pin. All of the core logic is kept and stays between flops, the
+* SPI pins are brought out as they are on a real board. Only meant for place
+* and route timing, not for running on hardware. */
+
+module fmax_spraid #(
+		parameter RAID_PIPELINE = 0
+	)
+	(
+		input			reset,
+		input			clk,
+
+		input			sin,	/* Serial in, shifts through all core inputs */
+		output reg		sout,	/* All core outputs XORed together */
+
+		output			spi0_clk,
+		output			spi0_cs,
+		output			spi0_mosi,
+		input			spi0_miso,
+
+		output			spi1_clk,
+		output			spi1_cs,
+		output			spi1_mosi,
+		input			spi1_miso,
+
+		output			spi2_clk,
+		output			spi2_cs,
+		output			spi2_mosi,
+		input			spi2_miso,
+
+		output			spi3_clk,
+		output			spi3_cs,
+		output			spi3_mosi,
+		input			spi3_miso
+	);
+
+	/* raid_type, read, write, addr, din, sel, health register writes */
+	reg [75:0] in_shift;
+
+	wire [31:0] dout;
+	wire busy;
+	wire ack;
+	wire parity;
+	wire err;
+	wire ecc_double;
+	wire [31:0] perf_full_writes;
+	wire [31:0] perf_rmw_writes;
+	wire [31:0] perf_rcw_writes;
+	wire [31:0] perf_drive_ops;
+	wire [31:0] ecc_corrected;
+	wire [31:0] ecc_uncorrected;
+	wire [31:0] xip_reads;
+	wire [15:0] health_threshold;
+	wire [3:0] degraded;
+	wire [63:0] health_ewma;
+	wire [63:0] health_max;
+	wire probing;
+	wire [95:0] drive_id;
+	wire [19:0] drive_density;
+	wire [11:0] drive_addr_bytes;
+	wire [3:0] asleep;
+	wire [127:0] wake_count;
+	wire [127:0] wake_stall;
+
+	always @(posedge clk) begin
+		in_shift <= { in_shift[74:0], sin };
+		sout <= ^{ dout, busy, ack, parity, err, ecc_double,
+			perf_full_writes, perf_rmw_writes, perf_rcw_writes, perf_drive_ops,
+			ecc_corrected, ecc_uncorrected, xip_reads,
+			health_threshold, degraded, health_ewma, health_max,
+			probing, drive_id, drive_density, drive_addr_bytes,
+			asleep, wake_count, wake_stall };
+	end
+
+	spraid #(
+		.RAID_PIPELINE( RAID_PIPELINE ),
+		.DRIVE_PROBE( 1 )
+	) spraid (
+		.reset( reset ),
+		.clk( clk ),
+		.raid_type( in_shift[75:72] ),
+		.read( in_shift[71] ),
+		.write( in_shift[70] ),
+		.addr( in_shift[69:38] ),
+		.din( in_shift[37:6] ),
+		.sel( in_shift[5:2] ),
+		.burst( in_shift[1:0] ),
+		.din_burst( { 3{ in_shift[37:6] } } ),
+		.dout( dout ),
+		.busy( busy ),
+		.wbs_ack_o( ack ),
+		.parity( parity ),
+		.err( err ),
+		.ecc_double( ecc_double ),
+		.perf_full_writes( perf_full_writes ),
+		.perf_rmw_writes( perf_rmw_writes ),
+		.perf_rcw_writes( perf_rcw_writes ),
+		.perf_drive_ops( perf_drive_ops ),
+		.ecc_corrected( ecc_corrected ),
+		.ecc_uncorrected( ecc_uncorrected ),
+		.xip_reads( xip_reads ),
+		.xip_timeout( in_shift[21:6] ),
+		.pd_timeout( in_shift[37:22] ),
+		.wake_time( { 4{ in_shift[21:6] } } ),
+		.wake( in_shift[70] ),
+		.wake_clear( in_shift[5:2] ),
+		.asleep( asleep ),
+		.wake_count( wake_count ),
+		.wake_stall( wake_stall ),
+		.probing( probing ),
+		.drive_id( drive_id ),
+		.drive_density( drive_density ),
+		.drive_addr_bytes( drive_addr_bytes ),
+		.spare_in( 1'b0 ),
+		.spare_slot( 2'b0 ),
+		.health_set_threshold( in_shift[1] ),
+		.health_set_degraded( in_shift[0] ),
+		.health_clear_max( in_shift[5:2] ),
+		.health_din( in_shift[37:6] ),
+		.health_threshold( health_threshold ),
+		.degraded( degraded ),
+		.health_ewma( health_ewma ),
+		.health_max( health_max ),
+		.health_clear_drive( 4'b0 ),
+		.health_clear_degraded( 1'b0 ),
+		.spi0_clk( spi0_clk ),
+		.spi0_cs( spi0_cs ),
+		.spi0_mosi( spi0_mosi ),
+		.spi0_miso( spi0_miso ),
+		.spi1_clk( spi1_clk ),
+		.spi1_cs( spi1_cs ),
+		.spi1_mosi( spi1_mosi ),
+		.spi1_miso( spi1_miso ),
+		.spi2_clk( spi2_clk ),
+		.spi2_cs( spi2_cs ),
+		.spi2_mosi( spi2_mosi ),
+		.spi2_miso( spi2_miso ),
+		.spi3_clk( spi3_clk ),
+		.spi3_cs( spi3_cs ),
+		.spi3_mosi( spi3_mosi ),
+		.spi3_miso( spi3_miso ),
+		.spi4_clk(),
+		.spi4_cs(),
+		.spi4_mosi(),
+		.spi4_miso( 1'b0 )
+	);
+
+endmodule
+
+
+module fmax_wb_spraid #(
+		parameter RAID_PIPELINE = 0
+	)
+	(
+		input			reset,
+		input			clk,
+
+		input			sin,	/* Serial in, shifts through all bus inputs */
+		output reg		sout,	/* All bus outputs XORed together */
+
+		output			spi0_clk,
+		output			spi0_cs,
+		output			spi0_mosi,
+		input			spi0_miso,
+
+		output			spi1_clk,
+		output			spi1_cs,
+		output			spi1_mosi,
+		input			spi1_miso,
+
+		output			spi2_clk,
+		output			spi2_cs,
+		output			spi2_mosi,
+		input			spi2_miso,
+
+		output			spi3_clk,
+		output			spi3_cs,
+		output			spi3_mosi,
+		input			spi3_miso,
+
+		output			spi4_clk,
+		output			spi4_cs,
+		output			spi4_mosi,
+		input			spi4_miso
+	);
+
+	/* cyc, stb, we, adr, dat, sel */
+	reg [70:0] in_shift;
+
+	wire [31:0] wb_dat_o;
+	wire wb_ack_o;
+	wire wb_stall_o;
+	wire wb_err_o;
+	wire wb_rty_o;
+
+	always @(posedge clk) begin
+		in_shift <= { in_shift[69:0], sin };
+		sout <= ^{ wb_dat_o, wb_ack_o, wb_stall_o, wb_err_o, wb_rty_o };
+	end
+
+	wb_spraid #(
+		.RAID_PIPELINE( RAID_PIPELINE ),
+		.DRIVE_PROBE( 1 )
+	) spraid (
+		.wb_clk_i( clk ),
+		.wb_rst_i( reset ),
+		.wb_cyc_i( in_shift[70] ),
+		.wb_stb_i( in_shift[69] ),
+		.wb_we_i( in_shift[68] ),
+		.wb_adr_i( in_shift[67:36] ),
+		.wb_dat_i( in_shift[35:4] ),
+		.wb_sel_i( in_shift[3:0] ),
+		.wb_dat_o( wb_dat_o ),
+		.wb_ack_o( wb_ack_o ),
+		.wb_stall_o( wb_stall_o ),
+		.wb_err_o( wb_err_o ),
+		.wb_rty_o( wb_rty_o ),
+		.spi0_clk( spi0_clk ),
+		.spi0_cs( spi0_cs ),
+		.spi0_mosi( spi0_mosi ),
+		.spi0_miso( spi0_miso ),
+		.spi1_clk( spi1_clk ),
+		.spi1_cs( spi1_cs ),
+		.spi1_mosi( spi1_mosi ),
+		.spi1_miso( spi1_miso ),
+		.spi2_clk( spi2_clk ),
+		.spi2_cs( spi2_cs ),
+		.spi2_mosi( spi2_mosi ),
+		.spi2_miso( spi2_miso ),
+		.spi3_clk( spi3_clk ),
+		.spi3_cs( spi3_cs ),
+		.spi3_mosi( spi3_mosi ),
+		.spi3_miso( spi3_miso ),
+		.spi4_clk( spi4_clk ),
+		.spi4_cs( spi4_cs ),
+		.spi4_mosi( spi4_mosi ),
+		.spi4_miso( spi4_miso )
+	);
+
+endmodule
@@ -0,0 +1,171 @@
+/* Write coalescing in front of the array */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* Full word window writes are held back and merged while they go to the same
+* or the next offset, up to 4 words. The whole run then goes out as one burst,
+* one write command per drive instead of one per word. Writes are acked as
+* soon as they are taken. A run is flushed when it is full, when no write has
+* joined it for the merge window, or when an access needs it out first: a
+* read of a held offset, a write that can't be merged, or any register write.
+* Those wait until the flush is done, so the array sees everything in order.
+* A window of zero turns merging off. */
+
+module coalesce (
+		input				reset,
+		input				clk,
+
+		/* Register interface */
+		input				set_window,
+		input      [31:0]	reg_din,
+		output reg [15:0]	window,		/* Idle cycles before a run is flushed */
+		output reg [31:0]	merged,		/* Writes taken */
+		output reg [31:0]	bursts,		/* Runs written */
+		output				pending,	/* Writes held */
+		output				active,		/* Flush in progress */
+
+		/* Host access, before any waiting */
+		input				allow,		/* Merging allowed for new writes */
+		input				host_pending,	/* Window access not finished */
+		input				host_write,		/* Window write */
+		input				host_full,		/* All byte lanes selected */
+		input				host_read,		/* Window read */
+		input				host_other,		/* Any other array or register write */
+		input      [15:0]	host_offset,
+		input      [31:0]	host_din,
+		output				take,		/* Write merged, ack it */
+		output				wait_flush,	/* Access has to wait for the flush */
+
+		/* spraid connection */
+		output reg			sp_write,
+		output     [31:0]	sp_addr,
+		output     [31:0]	sp_din,
+		output     [1:0]	sp_burst,
+		output     [95:0]	sp_din_burst,
+		input				sp_busy
+	);
+
+	/* Coalescing state machine */
+	`define COALESCE_IDLE		0	/* Taking writes */
+	`define COALESCE_RUN		1	/* Issue burst */
+	`define COALESCE_WAIT_BUSY	2	/* Burst issued, wait for array busy */
+	`define COALESCE_WAIT_DONE	3	/* Wait for array to finish */
+	`define COALESCE_CAPTURE	4	/* Burst written */
+	reg [2:0] co_state;
+
+	/* Held run */
+	reg [15:0]	base;
+	reg [2:0]	count;
+	reg [127:0]	words;
+	reg [15:0]	timer;
+
+	wire in_run;
+	wire next_in_run;
+	wire conflict;
+	wire flush;
+	assign in_run = (count != 0) && (host_offset >= base) && (host_offset < base + count);
+	assign next_in_run = (host_offset == base + count) && (count != 4);
+
+	assign take = (co_state == `COALESCE_IDLE) && (window != 0) && allow && host_write && host_full &&
+		( (count == 0) || in_run || next_in_run );
+	assign conflict = (host_write && !take) || (host_read && in_run) || host_other;
+	assign wait_flush = conflict && (count != 0);
+
+	/* Flush right away for an access that is waiting, otherwise between host
+	* accesses */
+	assign flush = (co_state == `COALESCE_IDLE) && (count != 0) && ( wait_flush ||
+		( !host_pending && ( (timer == 0) || (count == 4) || !allow || (window == 0) ) ) );
+
+	assign pending = (count != 0);
+	assign active = (co_state != `COALESCE_IDLE);
+
+	assign sp_addr = { 16'b0, base };
+	assign sp_din = words[31:0];
+	assign sp_din_burst = words[127:32];
+	assign sp_burst = count - 1;
+
+	integer i;
+
+	always @(posedge clk or posedge reset) begin
+		if( reset ) begin
+			co_state <= `COALESCE_IDLE;
+			window <= 0;
+			merged <= 0;
+			bursts <= 0;
+			base <= 0;
+			count <= 0;
+			words <= 0;
+			timer <= 0;
+			sp_write <= 0;
+		end
+		else begin
+			/* Single cycle pulses */
+			sp_write <= 1'b0;
+
+			if( set_window ) begin
+				window <= reg_din[15:0];
+			end
+
+			case( co_state )
+				`COALESCE_IDLE: begin
+					if( take ) begin
+						/* Held until the bus access ends, so only count the
+						* first cycle of it */
+						timer <= window;
+						if( count == 0 ) begin
+							base <= host_offset;
+							count <= 1;
+							words[31:0] <= host_din;
+							merged <= merged + 1;
+						end
+						else if( next_in_run ) begin
+							count <= count + 1;
+							merged <= merged + 1;
+						end
+						for( i = 0; i < 4; i = i + 1 ) begin
+							if( (count != 0) && (host_offset == base + i) ) begin
+								words[32*i +: 32] <= host_din;
+							end
+						end
+					end
+					else if( flush ) begin
+						co_state <= `COALESCE_RUN;
+					end
+					else if( (count != 0) && (timer != 0) ) begin
+						timer <= timer - 1;
+					end
+				end
+
+				`COALESCE_RUN: begin
+					if( !sp_busy ) begin
+						sp_write <= 1'b1;
+						co_state <= `COALESCE_WAIT_BUSY;
+					end
+				end
+
+				`COALESCE_WAIT_BUSY: begin
+					if( sp_busy ) begin
+						co_state <= `COALESCE_WAIT_DONE;
+					end
+				end
+
+				`COALESCE_WAIT_DONE: begin
+					if( !sp_busy ) begin
+						co_state <= `COALESCE_CAPTURE;
+					end
+				end
+
+				`COALESCE_CAPTURE: begin
+					bursts <= bursts + 1;
+					count <= 0;
+					co_state <= `COALESCE_IDLE;
+				end
+
+				default: begin
+					co_state <= `COALESCE_IDLE;
+				end
+			endcase
+		end
+	end
+
+endmodule
@@ -0,0 +1,132 @@
+/* Drive latency health monitor */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* Every array operation waits for the slowest drive taking part, so one
+* marginal part slows everything down. This times how long each drive stays
+* busy per operation, and keeps a moving average (1/8 weight on the newest
+* operation) and the worst case for each one. When a drive's average goes over
+* the threshold it is marked degraded, and the RAID levels with redundancy
+* stop reading from it. Only one drive is demoted at a time, since that is all
+* RAID5 can rebuild around. The degraded mask stays set until it is written,
+* which also allows taking a drive out by hand, or until a hot spare has been
+* rebuilt in its place. A threshold of zero turns automatic demotion off. */
+
+module drive_health (
+		input				reset,
+		input				clk,
+
+		/* Register interface */
+		input				set_threshold,
+		input				set_degraded,
+		input      [3:0]	clear_max,		/* Worst case of drive n cleared */
+		input      [31:0]	reg_din,
+
+		/* Drive replacement */
+		input      [3:0]	clear_drive,	/* History of drive n cleared */
+		input				clear_degraded,	/* Drive rebuilt */
+		output reg [15:0]	threshold,		/* Average busy cycles before demotion */
+		output reg [3:0]	degraded,
+
+		/* Per drive, drive n in bits [16*n +: 16] */
+		output     [63:0]	ewma,			/* Average busy cycles per operation */
+		output reg [63:0]	max,			/* Worst busy cycles of an operation */
+
+		input      [3:0]	drive_busy
+	);
+
+	/* Cycles the current operation has been busy, saturating */
+	reg [63:0] busy_count;
+	reg [3:0]  last_busy;
+
+	/* Averages kept with 4 fraction bits */
+	reg [79:0] ewma_fp;
+
+	/* Latency of the operation that just finished on drive n */
+	reg [15:0] latency;
+	reg [19:0] ewma_next;
+	reg [3:0]  over;
+
+	integer n;
+
+	genvar g;
+	generate
+		for( g = 0; g < 4; g = g + 1 ) begin : ewma_out
+			assign ewma[16*g +: 16] = ewma_fp[20*g + 4 +: 16];
+		end
+	endgenerate
+
+	always @(posedge clk or posedge reset) begin
+		if( reset ) begin
+			threshold <= 0;
+			degraded <= 0;
+			max <= 0;
+			busy_count <= 0;
+			last_busy <= 0;
+			ewma_fp <= 0;
+		end
+		else begin
+			last_busy <= drive_busy;
+			over = 4'b0;
+
+			for( n = 0; n < 4; n = n + 1 ) begin
+				if( drive_busy[n] ) begin
+					if( busy_count[16*n +: 16] != 16'hFFFF ) begin
+						busy_count[16*n +: 16] <= busy_count[16*n +: 16] + 1;
+					end
+				end
+				else if( last_busy[n] ) begin
+					/* Operation done */
+					latency = busy_count[16*n +: 16];
+					ewma_next = ewma_fp[20*n +: 20] - (ewma_fp[20*n +: 20] >> 3) + { latency, 1'b0 };
+					ewma_fp[20*n +: 20] <= ewma_next;
+					busy_count[16*n +: 16] <= 0;
+
+					if( latency > max[16*n +: 16] ) begin
+						max[16*n +: 16] <= latency;
+					end
+
+					over[n] = (threshold != 0) && (ewma_next[19:4] > threshold);
+				end
+
+				if( clear_max[n] ) begin
+					max[16*n +: 16] <= 0;
+				end
+
+				/* New part in the slot, none of the old history applies */
+				if( clear_drive[n] ) begin
+					max[16*n +: 16] <= 0;
+					ewma_fp[20*n +: 20] <= 0;
+				end
+			end
+
+			/* Register writes */
+			if( set_threshold ) begin
+				threshold <= reg_din[15:0];
+			end
+
+			if( set_degraded ) begin
+				degraded <= reg_din[3:0];
+			end
+			else if( clear_degraded ) begin
+				degraded <= 0;
+			end
+			else if( (degraded == 0) && (over != 0) ) begin
+				/* Demote the lowest numbered drive over the threshold */
+				if( over[0] ) begin
+					degraded <= 4'b0001;
+				end
+				else if( over[1] ) begin
+					degraded <= 4'b0010;
+				end
+				else if( over[2] ) begin
+					degraded <= 4'b0100;
+				end
+				else begin
+					degraded <= 4'b1000;
+				end
+			end
+		end
+	end
+
+endmodule
@@ -8,7 +8,8 @@
 
 
 module flash_ctl #(
-		parameter FLASH_ADDR_SZ = 11
+		parameter FLASH_ADDR_SZ = 11,	/* Address bits used when the ID is unknown */
+		parameter PROBE = 0				/* Read the JEDEC ID after reset */
 	) (
 		input	reset,
 		input	clk,
@@ -19,8 +20,41 @@ module flash_ctl #(
 		input [7:0] din,
 		output[7:0] dout,
 
+		/* Write bursts, extra bytes written to the following addresses in
+		* the same write command */
+		input [1:0] burst,			/* Extra bytes, 0-3 */
+		input [23:0] din_burst,		/* First extra byte in bits 7:0 */
+
+		/* Continuous reads. After a read chip select stays low, and a read of
+		* the next address only clocks in one more byte, no command or
+		* address. The stream is closed by any other access, or after
+		* xip_timeout idle cycles. Zero turns it off */
+		input [15:0] xip_timeout,
+		output reg xip_hit,			/* Pulse, read continued the stream */
+
+		/* Deep power-down. After pd_timeout idle cycles the part is put to
+		* sleep, and woken again by the next request, or early by wake so the
+		* first request doesn't wait for it. wake_time is the part's wake up
+		* time in cycles. Requests that come in while the part is going to
+		* sleep or waking up are kept until it is ready. Zero turns it off */
+		input [15:0] pd_timeout,
+		input [15:0] wake_time,
+		input wake,
+		output reg asleep,
+		output reg woke,			/* Pulse, wake up command sent */
+		output wake_wait,			/* Request waiting for the part to wake */
+
 		output reg busy,
 
+		/* Part discovery. With PROBE set the JEDEC ID is read after reset,
+		* while probing is high. busy stays low then, requests have to wait
+		* for probing to drop. A part that doesn't answer, like the FRAM,
+		* reads as 0 and keeps the FLASH_ADDR_SZ defaults */
+		output reg probing,
+		output reg [23:0] jedec_id,		/* Manufacturer, type, capacity */
+		output [4:0] density,			/* Part size, log2 bytes */
+		output [2:0] addr_bytes,		/* Address bytes the part takes */
+
 		/* SPI Connections */
 		output	spi_clk,
 		output	spi_cs,
@@ -46,27 +80,102 @@ module flash_ctl #(
 	`define CMD_WRITE		8'h02
 	`define CMD_WRITE_SZ	`SZ_32BIT
 
+	`define CMD_RDID		8'h9F
+
+	`define CMD_DPD			8'hB9	/* Deep power-down */
+	`define CMD_RDPD		8'hAB	/* Release from deep power-down */
+
 	/* SPI Read write selection */
 	reg spi_read;
 	reg	spi_write;
 
 	/* Command generation */
 
-	/* Address */
-	wire [FLASH_ADDR_SZ-1:0] flash_addr;
-	assign flash_addr = addr[FLASH_ADDR_SZ-1:0];
-
-	/* Write command */
+	/* Request kept while the part sleeps or wakes, replayed from IDLE */
+	reg        req_read;
+	reg        req_write;
+	reg [15:0] req_addr;
+	reg [7:0]  req_din;
+	reg [1:0]  req_burst;
+	reg [23:0] req_din_burst;
+	wire       req_held;
+	assign req_held = req_read | req_write;
+	assign wake_wait = req_held;
+
+	/* Request to act on, a kept one first */
+	wire        op_read;
+	wire        op_write;
+	wire [15:0] op_addr;
+	wire [7:0]  op_din;
+	wire [1:0]  op_burst;
+	wire [23:0] op_din_burst;
+	assign op_read = req_read | (!busy && !write && read);
+	assign op_write = req_write | (!busy && write && !read);
+	assign op_addr = ( req_held ) ? req_addr : addr;
+	assign op_din = ( req_held ) ? req_din : din;
+	assign op_burst = ( req_held ) ? req_burst : burst;
+	assign op_din_burst = ( req_held ) ? req_din_burst : din_burst;
+
+	/* Part geometry. The capacity byte of the ID is log2 of the size in
+	* bytes for most parts, anything out of range keeps the default. Parts
+	* over 64KB take 3 address bytes. Parts over 16MB list 4, but start up
+	* in 3 byte mode, which covers every address here */
+	wire id_valid;
+	wire id_sized;
+	assign id_valid = (jedec_id[23:16] != 8'h00) && (jedec_id[23:16] != 8'hFF);
+	assign id_sized = id_valid && (jedec_id[7:0] >= 8) && (jedec_id[7:0] <= 31);
+	assign density = ( id_sized ) ? jedec_id[4:0] : FLASH_ADDR_SZ;
+	assign addr_bytes = ( density > 24 ) ? 3'd4 : ( density > 16 ) ? 3'd3 : 3'd2;
+
+	wire addr3;
+	assign addr3 = (density > 16);
+
+	/* Address, wrapped at the end of the part */
+	wire [15:0] part_mask;
+	wire [15:0] flash_addr;
+	assign part_mask = ( density >= 16 ) ? 16'hFFFF : ( (16'b1 << density) - 1 );
+	assign flash_addr = op_addr & part_mask;
+
+	/* Write command. With 3 address bytes the data byte follows in its own
+	* frame, like a burst byte */
 	wire [31:0] write_cmd;
-	assign write_cmd = {`CMD_WRITE, {(16-FLASH_ADDR_SZ){1'b0}}, flash_addr, din };
+	assign write_cmd = ( addr3 ) ? {`CMD_WRITE, 8'b0, flash_addr } :
+		{`CMD_WRITE, flash_addr, op_din };
 
-	/* Read Command */
+	/* Read Command. With 3 address bytes the data byte is clocked in with
+	* its own frame */
 	wire [31:0] read_cmd;
-	assign read_cmd = {`CMD_READ, {(16-FLASH_ADDR_SZ){1'b0}}, flash_addr, 8'b0 };
+	assign read_cmd = ( addr3 ) ? {`CMD_READ, 8'b0, flash_addr } :
+		{`CMD_READ, flash_addr, 8'b0 };
+
+	/* ID bytes left to read */
+	reg [1:0] probe_left;
+	reg       probe_cmd;		/* Frame done was the command */
 
 	/* Command save, since writes require enable first */
 	reg [31:0] cmd_save;
 
+	/* Burst bytes, sent one frame each once the write command frame is out.
+	* Chip select is held between the frames so the part sees one write */
+	reg [2:0]  burst_save;
+	reg [31:0] burst_data;
+	reg        spi_hold;
+
+	/* Open read stream */
+	reg        xip_open;
+	reg [15:0] xip_next;	/* Address the part will send next */
+	reg [15:0] xip_idle;
+	reg        xip_read;		/* Current read continues the stream */
+	wire       xip_continue;
+	assign xip_continue = xip_open && (flash_addr == xip_next);
+
+	/* Power state */
+	reg [15:0] pd_idle;		/* Idle cycles while awake */
+	reg [15:0] wake_left;
+	reg        waking;		/* Wake up command sent */
+	wire       pd_due;
+	assign pd_due = (pd_timeout != 0) && !asleep && !xip_open && !wake && (pd_idle >= pd_timeout);
+
 	/* Command register to use to write to spi */
 	reg [31:0] cmd;
 	/* Size for command */
@@ -83,7 +192,17 @@ module flash_ctl #(
 	`define WRITE			3
 	`define READ_BUBBLE		5
 	`define READ			4
-	reg [2:0] flash_state;
+	`define WRITE_BURST_BUBBLE	6	/* Frame sent, chip select held */
+	`define WRITE_BURST		7	/* Burst byte issued */
+	`define READ_ADDR		8	/* 3 byte address frame issued */
+	`define READ_ADDR_BUBBLE	9	/* Address out, chip select held */
+	`define PROBE			10	/* Issue ID command */
+	`define PROBE_WAIT		11	/* Wait for frame to start */
+	`define PROBE_BUBBLE	12	/* Frame done, chip select held */
+	`define POWER			13	/* Power command issued */
+	`define POWER_BUBBLE	14	/* Power command frame running */
+	`define WAKE_DELAY		15	/* Waiting out the wake up time */
+	reg [3:0] flash_state;
 
 	spi32 spi0(
 		.reset(reset),
@@ -94,6 +213,7 @@ module flash_ctl #(
 		.dout(spi_dout),
 		.busy(spi_busy),
 		.nbytes(cmd_sz),
+		.hold(spi_hold),
 
 		.sdi(spi_miso),
 		.sdo(spi_mosi),
@@ -110,17 +230,75 @@ module flash_ctl #(
 			cmd <= 0;
 			cmd_sz <= 0;
 			cmd_save <= 0;
-			flash_state <= `IDLE;
+			burst_save <= 0;
+			burst_data <= 0;
+			spi_hold <= 0;
+			xip_open <= 0;
+			xip_next <= 0;
+			xip_idle <= 0;
+			xip_read <= 0;
+			xip_hit <= 0;
+			probe_left <= 0;
+			probe_cmd <= 0;
+			jedec_id <= 0;
+			req_read <= 0;
+			req_write <= 0;
+			req_addr <= 0;
+			req_din <= 0;
+			req_burst <= 0;
+			req_din_burst <= 0;
+			pd_idle <= 0;
+			wake_left <= 0;
+			waking <= 0;
+			asleep <= 0;
+			woke <= 0;
+			if( PROBE ) begin
+				probing <= 1;
+				flash_state <= `PROBE;
+			end
+			else begin
+				probing <= 0;
+				flash_state <= `IDLE;
+			end
 		end
 
 		else begin
+			xip_hit <= 1'b0;
+			woke <= 1'b0;
+
+			/* Keep a request that comes in while the part is asleep, going
+			* to sleep or waking up */
+			if( !busy && (read != write) && ( asleep || (flash_state == `POWER) ||
+				(flash_state == `POWER_BUBBLE) || (flash_state == `WAKE_DELAY) ) ) begin
+				req_read <= read;
+				req_write <= write;
+				req_addr <= addr;
+				req_din <= din;
+				req_burst <= burst;
+				req_din_burst <= din_burst;
+				busy <= 1'b1;
+			end
+
 			case( flash_state )
 				`IDLE: begin
 					/* Determine operation */
-					if( !busy && write && !read ) begin
+					if( op_write && !asleep ) begin
 						/* Writing, need to enable writing first, but store
-						* incoming data for later */
+						* incoming data for later. Chip select has to go up
+						* first if a read stream is open */
+						spi_hold <= 1'b0;
+						xip_open <= 1'b0;
+						req_write <= 1'b0;
+						pd_idle <= 0;
 						cmd_save <= write_cmd;
+						if( addr3 ) begin
+							burst_save <= op_burst + 1;
+							burst_data <= { op_din_burst, op_din };
+						end
+						else begin
+							burst_save <= op_burst;
+							burst_data <= { 8'b0, op_din_burst };
+						end
 						flash_state <= `WRITE_ENABLE;
 						cmd <=  {`CMD_WEN, 24'b0};
 						cmd_sz <= `CMD_WEN_SZ;
@@ -132,11 +310,28 @@ module flash_ctl #(
 			   			
 
 					end
-					else if( !busy && !write && read ) begin
+					else if( op_read && !asleep ) begin
 						/* Reading, so no need to enable writes */
+						req_read <= 1'b0;
+						pd_idle <= 0;
 //						cmd <= read_cmd;
-						cmd_save <= read_cmd;
-						cmd_sz <= `CMD_READ_SZ;
+						if( xip_continue ) begin
+							/* Part is already sending this byte, clock it in
+							* with a one byte frame */
+							cmd_save <= 32'b0;
+							cmd_sz <= `SZ_8BIT;
+							xip_hit <= 1'b1;
+						end
+						else begin
+							/* New command, chip select goes up first */
+							cmd_save <= read_cmd;
+							cmd_sz <= `CMD_READ_SZ;
+							spi_hold <= 1'b0;
+						end
+						xip_read <= xip_continue;
+						xip_open <= 1'b0;
+						xip_next <= (flash_addr + 1) & part_mask;
+						xip_idle <= 0;
 						flash_state <= `READ_BUBBLE;
 
 						spi_write <= 1'b0;
@@ -145,6 +340,24 @@ module flash_ctl #(
 						busy <= 1'b1;
 
 					end
+					else if( asleep && (req_held || wake || (!busy && (read != write))) && !spi_busy ) begin
+						/* Wake the part up for a request, or ahead of one */
+						cmd <= {`CMD_RDPD, 24'b0};
+						cmd_sz <= `SZ_8BIT;
+						spi_write <= 1'b1;
+						spi_read <= 1'b0;
+						waking <= 1'b1;
+						woke <= 1'b1;
+						flash_state <= `POWER;
+					end
+					else if( pd_due && !busy && !spi_busy ) begin
+						/* Idle long enough, put the part to sleep */
+						cmd <= {`CMD_DPD, 24'b0};
+						cmd_sz <= `SZ_8BIT;
+						spi_write <= 1'b1;
+						spi_read <= 1'b0;
+						flash_state <= `POWER;
+					end
 					else begin
 						/* No longer busy, default. Also forces additional
 						* cycle so can't read and write back to back, need to
@@ -156,12 +369,33 @@ module flash_ctl #(
 						else begin
 							busy <= 1'b0;						
 						end
+
+						/* Idle time counts towards power-down once the
+						* read stream is closed */
+						if( asleep || xip_open || wake || spi_busy ) begin
+							pd_idle <= 0;
+						end
+						else if( pd_idle != 16'hFFFF ) begin
+							pd_idle <= pd_idle + 1;
+						end
+
+						/* Close an idle read stream */
+						if( xip_open && !spi_busy ) begin
+							xip_idle <= xip_idle + 1;
+							if( (xip_idle >= xip_timeout) || (xip_timeout == 0) ) begin
+								spi_hold <= 1'b0;
+								xip_open <= 1'b0;
+							end
+						end
 					end
 
 				end
 
 				`WRITE_ENABLE: begin
 					if( spi_busy ) begin
+						/* Busy straight away when a read stream is closing */
+						spi_write <= 1'b0;
+						spi_read <= 1'b0;
 						flash_state <= `WRITE_BUBBLE;
 					end
 					else begin
@@ -184,6 +418,7 @@ module flash_ctl #(
 						flash_state <= `WRITE;
 						cmd <= cmd_save;
 						cmd_sz <= `CMD_WRITE_SZ;
+						spi_hold <= (burst_save != 0);
 					end
 
 				end
@@ -192,7 +427,13 @@ module flash_ctl #(
 					spi_write <= 1'b0;
 					spi_read <= 1'b0;
 					busy <= 1'b1;
-					if( !spi_busy ) begin
+					if( burst_save != 0 ) begin
+						/* Wait for the command frame to start */
+						if( spi_busy ) begin
+							flash_state <= `WRITE_BURST_BUBBLE;
+						end
+					end
+					else if( !spi_busy ) begin
 						/* SPI is no longer busy, write has finished */
 						cmd <= 0;
 						cmd_sz <= 0;
@@ -201,15 +442,62 @@ module flash_ctl #(
 
 				end
 
+				`WRITE_BURST_BUBBLE: begin
+					busy <= 1'b1;
+					spi_write <= 1'b0;
+					spi_read <= 1'b0;
+					if( !spi_busy ) begin
+						if( burst_save != 0 ) begin
+							/* Previous frame done, next byte follows */
+							spi_write <= 1'b1;
+							flash_state <= `WRITE_BURST;
+							cmd <= { burst_data[7:0], 24'b0 };
+							cmd_sz <= `SZ_8BIT;
+							burst_data <= burst_data >> 8;
+							burst_save <= burst_save - 1;
+						end
+						else begin
+							/* All bytes out, chip select ends the write */
+							spi_hold <= 1'b0;
+							cmd <= 0;
+							cmd_sz <= 0;
+							flash_state <= `IDLE;
+						end
+					end
+				end
+
+				`WRITE_BURST: begin
+					/* Wait for the byte frame to start */
+					spi_write <= 1'b0;
+					spi_read <= 1'b0;
+					busy <= 1'b1;
+					if( spi_busy ) begin
+						flash_state <= `WRITE_BURST_BUBBLE;
+					end
+				end
+
 				`READ_BUBBLE: begin
 					/* Needed one more cycle to get things ready */
 					busy <= 1'b1;
 					if( !spi_busy ) begin
-						spi_write <= 1'b0;
-						spi_read <= 1'b1;
-						flash_state <= `READ;
 						cmd <= cmd_save;
-						cmd_sz <= `CMD_READ_SZ;
+						if( addr3 && !xip_read ) begin
+							/* Command and address fill the frame, the data
+							* byte follows with chip select held */
+							spi_write <= 1'b1;
+							spi_read <= 1'b0;
+							spi_hold <= 1'b1;
+							flash_state <= `READ_ADDR;
+						end
+						else begin
+							/* Stream byte is a plain frame, the byte coming in
+							* is the data */
+							spi_write <= xip_read;
+							spi_read <= !xip_read;
+							flash_state <= `READ;
+							/* Held if the stream carries on after this read */
+							spi_hold <= (xip_timeout != 0);
+						end
 					end
 
 				end
@@ -222,11 +510,126 @@ module flash_ctl #(
 						/* SPI is no longer busy, write has finished */
 						cmd <= cmd_save;
 						cmd_sz <= 0;
+						xip_open <= spi_hold;
 						flash_state <= `IDLE;
 					end
 
 				end
 
+				`READ_ADDR: begin
+					/* Wait for the address frame to start */
+					spi_write <= 1'b0;
+					spi_read <= 1'b0;
+					busy <= 1'b1;
+					if( spi_busy ) begin
+						flash_state <= `READ_ADDR_BUBBLE;
+					end
+				end
+
+				`READ_ADDR_BUBBLE: begin
+					busy <= 1'b1;
+					spi_write <= 1'b0;
+					spi_read <= 1'b0;
+					if( !spi_busy ) begin
+						/* Clock the data byte in. Chip select stays held, as
+						* an open stream, and goes up once idle if streams
+						* are off */
+						spi_write <= 1'b1;
+						cmd <= 32'b0;
+						cmd_sz <= `SZ_8BIT;
+						flash_state <= `READ;
+					end
+				end
+
+				`PROBE: begin
+					busy <= 1'b0;
+					if( !spi_busy ) begin
+						/* ID command, chip select held for the answer */
+						spi_write <= 1'b1;
+						spi_read <= 1'b0;
+						cmd <= {`CMD_RDID, 24'b0};
+						cmd_sz <= `SZ_8BIT;
+						spi_hold <= 1'b1;
+						probe_left <= 3;
+						probe_cmd <= 1'b1;
+						flash_state <= `PROBE_WAIT;
+					end
+				end
+
+				`PROBE_WAIT: begin
+					spi_write <= 1'b0;
+					spi_read <= 1'b0;
+					if( spi_busy ) begin
+						flash_state <= `PROBE_BUBBLE;
+					end
+				end
+
+				`PROBE_BUBBLE: begin
+					if( !spi_busy ) begin
+						probe_cmd <= 1'b0;
+						if( !probe_cmd ) begin
+							jedec_id <= { jedec_id[15:0], spi_dout[7:0] };
+						end
+
+						if( probe_left != 0 ) begin
+							/* Clock in the next ID byte */
+							spi_write <= 1'b1;
+							cmd <= 32'b0;
+							cmd_sz <= `SZ_8BIT;
+							probe_left <= probe_left - 1;
+							flash_state <= `PROBE_WAIT;
+						end
+						else begin
+							spi_hold <= 1'b0;
+							cmd <= 0;
+							cmd_sz <= 0;
+							probing <= 1'b0;
+							flash_state <= `IDLE;
+						end
+					end
+				end
+
+				`POWER: begin
+					/* Wait for the command frame to start */
+					spi_write <= 1'b0;
+					spi_read <= 1'b0;
+					if( spi_busy ) begin
+						flash_state <= `POWER_BUBBLE;
+					end
+				end
+
+				`POWER_BUBBLE: begin
+					if( !spi_busy ) begin
+						cmd <= 0;
+						cmd_sz <= 0;
+						if( waking ) begin
+							wake_left <= wake_time;
+							flash_state <= `WAKE_DELAY;
+						end
+						else begin
+							asleep <= 1'b1;
+							flash_state <= `IDLE;
+						end
+					end
+				end
+
+				`WAKE_DELAY: begin
+					/* Part can't take commands until its wake up time is over,
+					* a kept request goes out from IDLE after that */
+					if( wake_left != 0 ) begin
+						wake_left <= wake_left - 1;
+					end
+					else begin
+						asleep <= 1'b0;
+						waking <= 1'b0;
+						pd_idle <= 0;
+						flash_state <= `IDLE;
+					end
+				end
+
+				default: begin
+					flash_state <= `IDLE;
+				end
 
 
 			endcase
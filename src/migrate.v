@@ -0,0 +1,162 @@
+/* Online RAID level migration */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* Converts the array to a new RAID type in place, one word at a time. Each
+* word is read back with the old layout and written with the new one, then
+* the high water mark moves past it. Accesses below the mark use the new
+* layout, accesses at or above it the old one, so the host keeps using the
+* array while this runs. Between words the engine waits a programmable number
+* of cycles and never starts a word while a host access is pending, which
+* keeps the host from being starved. Data wider than the new layout holds is
+* truncated the same as a host write would be. */
+
+module migrate #(
+		parameter MEM_WORDS = 16'h800	/* Default range, whole window */
+	)
+	(
+		input				reset,
+		input				clk,
+
+		/* Register interface */
+		input				set_target,
+		input				set_len,
+		input				set_throttle,
+		input      [31:0]	reg_din,
+		output reg [3:0]	target,
+		output reg [15:0]	mig_len,	/* Words to migrate, from offset 0 */
+		output reg [15:0]	throttle,	/* Idle cycles between words */
+		output reg [15:0]	mark,		/* Words below this are migrated */
+		output				active,		/* Migration in progress */
+		output				owner,		/* Engine owns the array */
+		output reg			new_layout,	/* Current array op uses the new layout */
+		output reg			done,		/* Pulsed when migration finishes */
+
+		/* Host access waiting for the array */
+		input				host_pending,
+
+		/* spraid connection */
+		output reg			sp_read,
+		output reg			sp_write,
+		output     [31:0]	sp_addr,
+		output reg [31:0]	sp_din,
+		input      [31:0]	sp_dout,
+		input				sp_busy
+	);
+
+	/* Migration state machine */
+	`define MIGRATE_IDLE		0
+	`define MIGRATE_THROTTLE	1	/* Waiting between words, host can use array */
+	`define MIGRATE_RUN			2	/* Issue next operation */
+	`define MIGRATE_WAIT_BUSY	3	/* Operation issued, wait for array busy */
+	`define MIGRATE_WAIT_DONE	4	/* Wait for array to finish */
+	`define MIGRATE_CAPTURE		5	/* Array output is valid */
+	reg [2:0] mig_state;
+
+	reg [15:0] throttle_count;
+
+	assign sp_addr = { 16'b0, mark };
+	assign active = (mig_state != `MIGRATE_IDLE);
+	assign owner = active && (mig_state != `MIGRATE_THROTTLE);
+
+	always @(posedge clk or posedge reset) begin
+		if( reset ) begin
+			mig_state <= `MIGRATE_IDLE;
+			target <= 0;
+			mig_len <= MEM_WORDS;
+			throttle <= 16;
+			mark <= 0;
+			new_layout <= 0;
+			done <= 0;
+			throttle_count <= 0;
+			sp_read <= 0;
+			sp_write <= 0;
+			sp_din <= 0;
+		end
+		else begin
+			/* Single cycle pulses */
+			sp_read <= 1'b0;
+			sp_write <= 1'b0;
+			done <= 1'b0;
+
+			/* Register writes, only allowed when idle */
+			if( !active ) begin
+				if( set_len ) begin
+					mig_len <= reg_din[15:0];
+				end
+				if( set_throttle ) begin
+					throttle <= reg_din[15:0];
+				end
+				if( set_target ) begin
+					/* Start migration */
+					target <= reg_din[3:0];
+					mark <= 0;
+					new_layout <= 1'b0;
+					throttle_count <= 0;
+					mig_state <= `MIGRATE_THROTTLE;
+				end
+			end
+
+			case( mig_state )
+				`MIGRATE_THROTTLE: begin
+					if( throttle_count != 0 ) begin
+						throttle_count <= throttle_count - 1;
+					end
+					else if( mark == mig_len ) begin
+						/* Whole range is in the new layout */
+						done <= 1'b1;
+						mig_state <= `MIGRATE_IDLE;
+					end
+					else if( !host_pending && !sp_busy ) begin
+						mig_state <= `MIGRATE_RUN;
+					end
+				end
+
+				`MIGRATE_RUN: begin
+					if( !sp_busy ) begin
+						if( new_layout ) begin
+							sp_write <= 1'b1;
+						end
+						else begin
+							sp_read <= 1'b1;
+						end
+						mig_state <= `MIGRATE_WAIT_BUSY;
+					end
+				end
+
+				`MIGRATE_WAIT_BUSY: begin
+					if( sp_busy ) begin
+						mig_state <= `MIGRATE_WAIT_DONE;
+					end
+				end
+
+				`MIGRATE_WAIT_DONE: begin
+					if( !sp_busy ) begin
+						mig_state <= `MIGRATE_CAPTURE;
+					end
+				end
+
+				`MIGRATE_CAPTURE: begin
+					if( !new_layout ) begin
+						/* Old data is in, write it back in the new layout */
+						sp_din <= sp_dout;
+						new_layout <= 1'b1;
+						mig_state <= `MIGRATE_RUN;
+					end
+					else begin
+						/* Word done, move the mark past it */
+						new_layout <= 1'b0;
+						mark <= mark + 1;
+						throttle_count <= throttle;
+						mig_state <= `MIGRATE_THROTTLE;
+					end
+				end
+
+				default: begin
+				end
+			endcase
+
+		end
+	end
+
+endmodule
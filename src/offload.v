@@ -0,0 +1,216 @@
+/* Array side offload engine: fill, compare and CRC32 over a range */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* Offload commands */
+`define OFFLOAD_NONE	0
+`define OFFLOAD_FILL	1	/* Write value to every word in range */
+`define OFFLOAD_COMPARE	2	/* Check every word in range against value */
+`define OFFLOAD_CRC32	3	/* CRC32 of range, bytes taken LSB first */
+
+/* The range is given the same way as the stream port, a window offset of the
+* first word and a word count. Only the data bytes the layout holds count,
+* word_bytes of them, the rest of a word always reads back as zero. Compare
+* stops at the first word whose data bytes do not match and records its
+* offset. CRC32 is the usual reflected 0xEDB88320 CRC with all ones init and
+* final invert, so it matches zlib over the data bytes of each word, LSB
+* first. The range registers keep what was programmed, the
+* engine runs from its own copies, so a command can be issued again without
+* setting them up again. */
+
+module offload (
+		input				reset,
+		input				clk,
+
+		/* Register interface */
+		input				set_addr,
+		input				set_len,
+		input				set_value,
+		input				set_cmd,
+		input      [31:0]	reg_din,
+		output reg [31:0]	off_addr,
+		output reg [15:0]	off_left,
+		output reg [31:0]	value,
+		output reg [1:0]	cmd,
+		output				active,
+
+		/* Data bytes in the word the array is on, 1-4 */
+		input      [2:0]	word_bytes,
+
+		/* Results */
+		output reg [31:0]	result,			/* CRC32, or 1 on compare mismatch */
+		output reg [31:0]	mismatch_addr,	/* First mismatch, all ones if none */
+		output reg			mismatch,
+
+		/* spraid connection */
+		output reg			sp_read,
+		output reg			sp_write,
+		output     [31:0]	sp_addr,
+		output reg [31:0]	sp_din,
+		input      [31:0]	sp_dout,
+		input				sp_busy
+	);
+
+	/* Offload state machine */
+	`define OFFLOAD_IDLE		0
+	`define OFFLOAD_RUN			1	/* Issue next operation */
+	`define OFFLOAD_WAIT_BUSY	2	/* Operation issued, wait for array busy */
+	`define OFFLOAD_WAIT_DONE	3	/* Wait for array to finish */
+	`define OFFLOAD_CAPTURE		4	/* Array output is valid */
+	`define OFFLOAD_CRC			5	/* Fold captured word into CRC, byte per cycle */
+	reg [2:0] off_state;
+
+	/* Working copies of the range, taken when a command starts */
+	reg [31:0] run_addr;
+	reg [15:0] run_left;
+
+	/* Running CRC and word being folded in */
+	reg [31:0] crc;
+	reg [31:0] crc_data;
+	reg [1:0]  crc_byte;
+
+	/* Data bits of the word, the rest of it isn't stored */
+	wire [31:0] word_mask;
+	assign word_mask = ( word_bytes >= 4 ) ? 32'hFFFFFFFF : ((32'b1 << { word_bytes, 3'b0 }) - 1);
+
+	assign sp_addr = run_addr;
+	assign active = (off_state != `OFFLOAD_IDLE);
+
+	/* One byte of reflected CRC32 */
+	function [31:0] crc32_byte;
+		input [31:0] crc_in;
+		input [7:0]  data;
+		integer i;
+		begin
+			crc32_byte = crc_in ^ {24'b0, data};
+			for( i = 0; i < 8; i = i + 1 ) begin
+				if( crc32_byte[0] ) begin
+					crc32_byte = (crc32_byte >> 1) ^ 32'hEDB88320;
+				end
+				else begin
+					crc32_byte = crc32_byte >> 1;
+				end
+			end
+		end
+	endfunction
+
+	always @(posedge clk or posedge reset) begin
+		if( reset ) begin
+			off_state <= `OFFLOAD_IDLE;
+			off_addr <= 0;
+			off_left <= 0;
+			run_addr <= 0;
+			run_left <= 0;
+			value <= 0;
+			cmd <= `OFFLOAD_NONE;
+			result <= 0;
+			mismatch_addr <= 32'hFFFFFFFF;
+			mismatch <= 0;
+			crc <= 0;
+			crc_data <= 0;
+			crc_byte <= 0;
+			sp_read <= 0;
+			sp_write <= 0;
+			sp_din <= 0;
+		end
+		else begin
+			/* Single cycle pulses */
+			sp_read <= 1'b0;
+			sp_write <= 1'b0;
+
+			/* Register writes, only allowed when idle */
+			if( !active ) begin
+				if( set_addr ) begin
+					off_addr <= reg_din;
+				end
+				if( set_len ) begin
+					off_left <= reg_din[15:0];
+				end
+				if( set_value ) begin
+					value <= reg_din;
+				end
+				if( set_cmd && (reg_din[1:0] != `OFFLOAD_NONE) ) begin
+					/* Start command */
+					cmd <= reg_din[1:0];
+					result <= 0;
+					mismatch <= 1'b0;
+					mismatch_addr <= 32'hFFFFFFFF;
+					crc <= 32'hFFFFFFFF;
+					run_addr <= off_addr;
+					run_left <= off_left;
+					off_state <= `OFFLOAD_RUN;
+				end
+			end
+
+			case( off_state )
+				`OFFLOAD_RUN: begin
+					if( run_left == 0 ) begin
+						/* Range finished */
+						if( cmd == `OFFLOAD_CRC32 ) begin
+							result <= ~crc;
+						end
+						off_state <= `OFFLOAD_IDLE;
+					end
+					else if( !sp_busy ) begin
+						if( cmd == `OFFLOAD_FILL ) begin
+							sp_din <= value;
+							sp_write <= 1'b1;
+						end
+						else begin
+							sp_read <= 1'b1;
+						end
+						off_state <= `OFFLOAD_WAIT_BUSY;
+					end
+				end
+
+				`OFFLOAD_WAIT_BUSY: begin
+					if( sp_busy ) begin
+						off_state <= `OFFLOAD_WAIT_DONE;
+					end
+				end
+
+				`OFFLOAD_WAIT_DONE: begin
+					if( !sp_busy ) begin
+						off_state <= `OFFLOAD_CAPTURE;
+					end
+				end
+
+				`OFFLOAD_CAPTURE: begin
+					if( (cmd == `OFFLOAD_COMPARE) && (((sp_dout ^ value) & word_mask) != 0) ) begin
+						/* Stop at first mismatch */
+						result <= 1;
+						mismatch <= 1'b1;
+						mismatch_addr <= run_addr;
+						off_state <= `OFFLOAD_IDLE;
+					end
+					else if( cmd == `OFFLOAD_CRC32 ) begin
+						crc_data <= sp_dout;
+						crc_byte <= 0;
+						off_state <= `OFFLOAD_CRC;
+					end
+					else begin
+						run_addr <= run_addr + 1;
+						run_left <= run_left - 1;
+						off_state <= `OFFLOAD_RUN;
+					end
+				end
+
+				`OFFLOAD_CRC: begin
+					crc <= crc32_byte(crc, crc_data[7:0]);
+					crc_data <= crc_data >> 8;
+					crc_byte <= crc_byte + 1;
+					if( { 1'b0, crc_byte } == word_bytes - 1 ) begin
+						run_addr <= run_addr + 1;
+						run_left <= run_left - 1;
+						off_state <= `OFFLOAD_RUN;
+					end
+				end
+
+				default: begin
+				end
+			endcase
+
+		end
+	end
+
+endmodule
@@ -6,12 +6,15 @@
 `define TYPE_RAID0	1
 `define TYPE_RAID1	0	/* Default, since simplest */
 `define TYPE_RAID5	5
+`define TYPE_RAID10	10	/* Striped across mirrored pairs 0/1 and 2/3 */
+`define TYPE_ECC	6	/* 24 bit data with SECDED check bits, striped */
 
 /* Assume 32 bit address, 32 bit data for now. Will parameterize later.
 * Output data will also be 32 bits to make things simpler on this side */
 
 module raid #(
-		parameter NDRIVES = 4
+		parameter NDRIVES = 4,
+		parameter PIPELINE = 0	/* Registered stages in read compute, 0-2 */
 	)
 	(
 		input				reset,
@@ -21,16 +24,24 @@ module raid #(
 
 		/* Host connection  */
 		input      [31:0]	din,
+		input      [3:0]	sel,		/* Byte lanes to write */
+		input      [1:0]	burst,		/* Extra words written after din, full words only */
+		input      [95:0]	din_burst,	/* Extra words, next address in bits 31:0 */
 		input      [31:0]	addr,
 		output reg [31:0]	dout,
 		output reg			busy,
 		output reg			parity,		/* parity error that is non recoverable */
 		output reg			err,		/* error flag on raid0 consistency */
+		output reg			ecc_double,	/* last ECC read had an uncorrectable error */
 		input [3:0]			raid_type,
+		input      [3:0]	degraded,	/* Drive too slow, read around it */
 
 		/* Drive controller connection */
 		output reg			w_drives,
 		output reg			r_drives,
+		output reg [3:0]	drive_en,	/* Drives taking part in operation */
+		output reg [1:0]	drive_burst,	/* Extra bytes in drive writes */
+		output reg [95:0]	drive_din_burst,	/* Extra bytes of drive n in [24*n +: 24] */
 		output reg [31:0]	drive_addr,
 		input				busy_drive0,
 		input				busy_drive1,
@@ -45,7 +56,15 @@ module raid #(
 		output reg [31:0]	w_drive_data0,
 		output reg [31:0]	w_drive_data1,
 		output reg [31:0]	w_drive_data2,
-		output reg [31:0]	w_drive_data3
+		output reg [31:0]	w_drive_data3,
+
+		/* Performance counters */
+		output reg [31:0]	perf_full_writes,	/* RAID5 full stripe writes */
+		output reg [31:0]	perf_rmw_writes,	/* RAID5 read-modify-writes */
+		output reg [31:0]	perf_rcw_writes,	/* RAID5 reconstruct-writes */
+		output reg [31:0]	perf_drive_ops,		/* Drive level reads and writes */
+		output reg [31:0]	ecc_corrected,		/* ECC reads with a single bit fixed */
+		output reg [31:0]	ecc_uncorrected		/* ECC reads with a double bit error */
 
 	);
 
@@ -55,18 +74,50 @@ module raid #(
 	`define OP_WRITE	 	2
 	`define OP_WRITE_FINISH 3 /* Waiting for write to finish */
 	`define OP_READ_WAIT	4
+	`define OP_PREREAD_WAIT	5 /* Partial RAID5 write, start reading old data */
+	`define OP_PREREAD		6 /* Partial RAID5 write, old data being read */
 	reg [3:0] op;
 	reg [3:0] last_op;
 
 	/* Temporary storage */
 	//reg [31:0] tmp_addr;
 	reg [31:0] tmp_data;
+	reg [3:0]  tmp_sel;
+	reg [95:0] tmp_burst;
+
 
+	/* Degraded drive. Only one can be worked around, so more than one is
+	* ignored. The mask is held for the whole operation */
+	wire [3:0] skip;
+	reg  [3:0] op_skip;
+	assign skip = ( (degraded & (degraded - 1)) == 0 ) ? degraded : 4'b0;
 
 	/* Busy connection tying all drives together */
 	wire drive_busy;
 	assign drive_busy = busy_drive0 | busy_drive1 | busy_drive2 | busy_drive3;
 
+	/* Read pipeline. Stage 1 registers the drive data before the compares,
+	* parity and ECC, stage 2 registers their results before the output mux.
+	* Each stage adds a cycle to reads and takes logic off the critical path */
+	reg [31:0] r_pipe_data0;
+	reg [31:0] r_pipe_data1;
+	reg [31:0] r_pipe_data2;
+	reg [31:0] r_pipe_data3;
+
+	wire [31:0] r_data0;
+	wire [31:0] r_data1;
+	wire [31:0] r_data2;
+	wire [31:0] r_data3;
+	assign r_data0 = ( PIPELINE >= 1 ) ? r_pipe_data0 : r_drive_data0;
+	assign r_data1 = ( PIPELINE >= 1 ) ? r_pipe_data1 : r_drive_data1;
+	assign r_data2 = ( PIPELINE >= 1 ) ? r_pipe_data2 : r_drive_data2;
+	assign r_data3 = ( PIPELINE >= 1 ) ? r_pipe_data3 : r_drive_data3;
+
+	/* Cycles since drives finished a read */
+	reg [1:0] pipe_count;
+	wire read_done;
+	assign read_done = !drive_busy && (pipe_count == PIPELINE);
+
 
 	/* RAID 0 wires */
 	
@@ -83,7 +134,7 @@ module raid #(
 
 	/* Read */
 	wire [31:0] r_raid0;
-	assign r_raid0 = { r_drive_data3[7:0], r_drive_data2[7:0], r_drive_data1[7:0], r_drive_data0[7:0]};
+	assign r_raid0 = { r_data3[7:0], r_data2[7:0], r_data1[7:0], r_data0[7:0]};
 
 	/* RAID 1 wires */
 
@@ -92,10 +143,19 @@ module raid #(
     wire eq_d1d2;
     wire eq_d2d3; 
     wire r_raid1_eq;
-	assign eq_d0d1 = (r_drive_data0 == r_drive_data1);
-	assign eq_d1d2 = (r_drive_data1 == r_drive_data2);
-	assign eq_d2d3 = (r_drive_data2 == r_drive_data3);
-	assign r_raid1_eq = (eq_d0d1 && eq_d1d2 && eq_d2d3);
+
+	/* With a degraded drive, compare the others against the first one read */
+	wire [31:0] r_raid1_ref;
+	wire r_raid1_deg_eq;
+	assign r_raid1_ref = ( op_skip[0] ) ? r_data1 : r_data0;
+	assign r_raid1_deg_eq = (op_skip[0] || (r_data0 == r_raid1_ref)) &&
+		(op_skip[1] || (r_data1 == r_raid1_ref)) &&
+		(op_skip[2] || (r_data2 == r_raid1_ref)) &&
+		(op_skip[3] || (r_data3 == r_raid1_ref));
+	assign eq_d0d1 = (r_data0 == r_data1);
+	assign eq_d1d2 = (r_data1 == r_data2);
+	assign eq_d2d3 = (r_data2 == r_data3);
+	assign r_raid1_eq = (op_skip != 0) ? r_raid1_deg_eq : (eq_d0d1 && eq_d1d2 && eq_d2d3);
 	
 	/* Write */
 	wire [31:0] w_raid1_d0;
@@ -114,25 +174,35 @@ module raid #(
 	* make this better. As in use the most common data output, instead of only
 	* relying on them all being consistent */
 	wire [31:0] r_raid1;
-	assign r_raid1 = ( r_raid1_eq ) ? r_drive_data0 : 32'b0;
+	assign r_raid1 = ( r_raid1_eq ) ? r_raid1_ref : 32'b0;
 
 	/* RAID 5 wires */
 
 	/* Read */
 
+	/* A degraded data drive is not read, its byte is rebuilt from the other
+	* two and parity */
+	wire [7:0] r_raid5_d0;
+	wire [7:0] r_raid5_d1;
+	wire [7:0] r_raid5_d2;
+	assign r_raid5_d0 = ( op_skip[0] ) ? (r_data1[7:0] ^ r_data2[7:0] ^ r_data3[7:0]) : r_data0[7:0];
+	assign r_raid5_d1 = ( op_skip[1] ) ? (r_data0[7:0] ^ r_data2[7:0] ^ r_data3[7:0]) : r_data1[7:0];
+	assign r_raid5_d2 = ( op_skip[2] ) ? (r_data0[7:0] ^ r_data1[7:0] ^ r_data3[7:0]) : r_data2[7:0];
+
 	/* Only 24 bits because byte 3 is parity */
 	wire [31:0] r_raid5;
-	assign r_raid5 = { {8'b0}, r_drive_data2[7:0], r_drive_data1[7:0], r_drive_data0[7:0]};
+	assign r_raid5 = { {8'b0}, r_raid5_d2, r_raid5_d1, r_raid5_d0 };
 
 	/* parity check */
 	wire [7:0] r_raid5_parity_d0d1;
     wire [7:0] r_raid5_parity_d2d3;
-	assign r_raid5_parity_d0d1 = r_drive_data0[7:0] ^ r_drive_data1[7:0];
-	assign r_raid5_parity_d2d3 = r_drive_data2[7:0] ^ r_drive_data3[7:0];
+	assign r_raid5_parity_d0d1 = r_data0[7:0] ^ r_data1[7:0];
+	assign r_raid5_parity_d2d3 = r_data2[7:0] ^ r_data3[7:0];
 
-	/* If no issues, then should be zero ( xor with itself is zero )*/
+	/* If no issues, then should be zero ( xor with itself is zero ). Can't be
+	* checked with a drive left out */
 	wire r_raid5_parity_err;
-	assign r_raid5_parity_err = r_raid5_parity_d0d1 ^ r_raid5_parity_d2d3;
+	assign r_raid5_parity_err = (op_skip == 0) && |(r_raid5_parity_d0d1 ^ r_raid5_parity_d2d3);
 
 
 	/* Write */
@@ -151,6 +221,297 @@ module raid #(
 	assign w_raid5_d2 = tmp_data[23:16];
 	assign w_raid5_d3 = w_raid5_parity;
 
+	/* Partial stripe writes */
+
+	/* Byte lanes each layout stores. A write selecting none of them changes
+	* nothing, so it finishes without touching the drives */
+	wire [3:0] held_lanes;
+	assign held_lanes = ( raid_type == `TYPE_RAID0 ) ? 4'b1111 :
+		( (raid_type == `TYPE_RAID5) || (raid_type == `TYPE_ECC) ) ? 4'b0111 :
+		( raid_type == `TYPE_RAID10 ) ? 4'b0011 : 4'b0001;
+
+	/* Byte 3 is not stored, so only lanes 0-2 count. Writing all of them is
+	* a full stripe write and needs no old data */
+	wire [2:0] raid5_lanes;
+	wire       raid5_partial;
+	assign raid5_lanes   = sel[2:0];
+	assign raid5_partial = (raid5_lanes != 3'b000) && (raid5_lanes != 3'b111);
+
+	/* Read-modify-write reads the old data of the lanes written plus the old
+	* parity, reconstruct-write reads the lanes not written. Pick whichever
+	* reads fewer drives, on a tie use read-modify-write since it leaves the
+	* other data drives idle */
+	wire [2:0] raid5_touched;
+	wire [2:0] raid5_rmw_reads;
+	wire [2:0] raid5_rcw_reads;
+	wire       raid5_use_rmw;
+
+	/* Don't pick the one that has to read a degraded drive */
+	wire       raid5_rmw_avoid;
+	wire       raid5_rcw_avoid;
+	assign raid5_rmw_avoid = skip[3] || ((skip[2:0] & raid5_lanes) != 0);
+	assign raid5_rcw_avoid = ((skip[2:0] & ~raid5_lanes) != 0);
+	assign raid5_touched   = raid5_lanes[0] + raid5_lanes[1] + raid5_lanes[2];
+	assign raid5_rmw_reads = raid5_touched + 1;
+	assign raid5_rcw_reads = 3 - raid5_touched;
+	assign raid5_use_rmw   = raid5_rmw_avoid ? 1'b0 :
+		raid5_rcw_avoid ? 1'b1 : (raid5_rmw_reads <= raid5_rcw_reads);
+
+	/* Merge new lanes with the old data read back */
+	wire [7:0] w_raid5_merge_d0;
+	wire [7:0] w_raid5_merge_d1;
+	wire [7:0] w_raid5_merge_d2;
+	assign w_raid5_merge_d0 = ( tmp_sel[0] ) ? tmp_data[7:0]   : r_drive_data0[7:0];
+	assign w_raid5_merge_d1 = ( tmp_sel[1] ) ? tmp_data[15:8]  : r_drive_data1[7:0];
+	assign w_raid5_merge_d2 = ( tmp_sel[2] ) ? tmp_data[23:16] : r_drive_data2[7:0];
+
+	/* Reconstruct-write, parity over the merged stripe */
+	wire [7:0] w_raid5_rcw_parity;
+	assign w_raid5_rcw_parity = w_raid5_merge_d0 ^ w_raid5_merge_d1 ^ w_raid5_merge_d2;
+
+	/* Read-modify-write, old parity with the changed bits flipped */
+	wire [7:0] w_raid5_rmw_parity;
+	assign w_raid5_rmw_parity = r_drive_data3[7:0]
+		^ ( ( tmp_sel[0] ) ? (r_drive_data0[7:0] ^ tmp_data[7:0])   : 8'b0 )
+		^ ( ( tmp_sel[1] ) ? (r_drive_data1[7:0] ^ tmp_data[15:8])  : 8'b0 )
+		^ ( ( tmp_sel[2] ) ? (r_drive_data2[7:0] ^ tmp_data[23:16]) : 8'b0 );
+
+	/* Drive level operations issued, one per enabled drive */
+	function [2:0] drive_count;
+		input [3:0] en;
+		begin
+			drive_count = en[0] + en[1] + en[2] + en[3];
+		end
+	endfunction
+
+	/* RAID 10 wires */
+
+	/* Write */
+	/* Byte 0 mirrored on drives 0 and 1, byte 1 mirrored on drives 2 and 3 */
+	wire [7:0] w_raid10_d0;
+	wire [7:0] w_raid10_d1;
+	wire [7:0] w_raid10_d2;
+	wire [7:0] w_raid10_d3;
+	assign w_raid10_d0 = tmp_data[7:0];
+	assign w_raid10_d1 = tmp_data[7:0];
+	assign w_raid10_d2 = tmp_data[15:8];
+	assign w_raid10_d3 = tmp_data[15:8];
+
+	/* Read */
+
+	/* Reads alternate between the two halves of each mirror, so only one
+	* drive in each pair is used per read. Select is toggled when the read
+	* starts, so it points at the drives in use for the rest of the read */
+	reg raid10_sel;
+
+	/* Only 16 bits, each pair holds one byte */
+	wire [31:0] r_raid10;
+	assign r_raid10 = ( raid10_sel ) ?
+		{ {16'b0}, r_data2[7:0], r_data0[7:0] } :
+		{ {16'b0}, r_data3[7:0], r_data1[7:0] };
+
+	/* ECC wires */
+
+	/* Hamming code over positions 1-29, check bits at the powers of two and
+	* the 24 data bits in the rest, in order. Bit 0 is overall parity for
+	* double error detection and bits 30-31 are unused. The codeword is
+	* striped one byte per drive, the same as RAID0 */
+	function [31:0] ecc_encode;
+		input [23:0] data;
+		integer pos;
+		integer j;
+		integer p;
+		begin
+			ecc_encode = 32'b0;
+			j = 0;
+			for( pos = 1; pos < 30; pos = pos + 1 ) begin
+				if( (pos & (pos - 1)) != 0 ) begin
+					ecc_encode[pos] = data[j];
+					j = j + 1;
+				end
+			end
+			for( p = 0; p < 5; p = p + 1 ) begin
+				for( pos = 1; pos < 30; pos = pos + 1 ) begin
+					if( ((pos >> p) & 1) && (pos != (1 << p)) ) begin
+						ecc_encode[1 << p] = ecc_encode[1 << p] ^ ecc_encode[pos];
+					end
+				end
+			end
+			ecc_encode[0] = ^ecc_encode[29:1];
+		end
+	endfunction
+
+	/* Position of a single bit error, zero if none */
+	function [4:0] ecc_syndrome;
+		input [31:0] code;
+		integer pos;
+		integer p;
+		begin
+			ecc_syndrome = 5'b0;
+			for( p = 0; p < 5; p = p + 1 ) begin
+				for( pos = 1; pos < 30; pos = pos + 1 ) begin
+					if( (pos >> p) & 1 ) begin
+						ecc_syndrome[p] = ecc_syndrome[p] ^ code[pos];
+					end
+				end
+			end
+		end
+	endfunction
+
+	function [23:0] ecc_data;
+		input [31:0] code;
+		integer pos;
+		integer j;
+		begin
+			ecc_data = 24'b0;
+			j = 0;
+			for( pos = 1; pos < 30; pos = pos + 1 ) begin
+				if( (pos & (pos - 1)) != 0 ) begin
+					ecc_data[j] = code[pos];
+					j = j + 1;
+				end
+			end
+		end
+	endfunction
+
+	/* Write */
+	wire [31:0] w_ecc;
+	assign w_ecc = ecc_encode( tmp_data[23:0] );
+
+	/* Partial writes. The codeword covers every lane, so the old one is read
+	* back and decoded, a single bit error fixed, and the new lanes merged in
+	* before encoding again */
+	wire [31:0] w_ecc_old_code;
+	wire [4:0]  w_ecc_old_syndrome;
+	wire        w_ecc_old_parity;
+	wire        w_ecc_old_single;
+	wire        w_ecc_old_double;
+	wire [23:0] w_ecc_old;
+	wire [23:0] w_ecc_merge;
+	wire [31:0] w_ecc_partial;
+	assign w_ecc_old_code = { r_drive_data3[7:0], r_drive_data2[7:0], r_drive_data1[7:0], r_drive_data0[7:0] };
+	assign w_ecc_old_syndrome = ecc_syndrome( w_ecc_old_code );
+	assign w_ecc_old_parity = ^w_ecc_old_code[29:0];
+	assign w_ecc_old_single = w_ecc_old_parity && (w_ecc_old_syndrome < 30);
+	assign w_ecc_old_double = (!w_ecc_old_parity && (w_ecc_old_syndrome != 0)) || (w_ecc_old_parity && (w_ecc_old_syndrome >= 30));
+	assign w_ecc_old = ecc_data( ( w_ecc_old_single ) ? (w_ecc_old_code ^ (32'b1 << w_ecc_old_syndrome)) : w_ecc_old_code );
+	assign w_ecc_merge = {
+		( tmp_sel[2] ) ? tmp_data[23:16] : w_ecc_old[23:16],
+		( tmp_sel[1] ) ? tmp_data[15:8]  : w_ecc_old[15:8],
+		( tmp_sel[0] ) ? tmp_data[7:0]   : w_ecc_old[7:0] };
+	assign w_ecc_partial = ecc_encode( w_ecc_merge );
+
+	/* Write bursts */
+
+	/* Every layout keeps word n at address n on each drive, so a burst of
+	* words is a burst of bytes on every drive. Byte d of the result goes to
+	* drive d */
+	function [31:0] stripe;
+		input [3:0]  rtype;
+		input [31:0] data;
+		begin
+			case( rtype )
+				`TYPE_RAID1:	stripe = { 4{data[7:0]} };
+				`TYPE_RAID5:	stripe = { data[7:0] ^ data[15:8] ^ data[23:16], data[23:0] };
+				`TYPE_RAID10:	stripe = { data[15:8], data[15:8], data[7:0], data[7:0] };
+				`TYPE_ECC:		stripe = ecc_encode( data[23:0] );
+				default:		stripe = data;
+			endcase
+		end
+	endfunction
+
+	wire [31:0] w_burst1;
+	wire [31:0] w_burst2;
+	wire [31:0] w_burst3;
+	assign w_burst1 = stripe( raid_type, tmp_burst[31:0] );
+	assign w_burst2 = stripe( raid_type, tmp_burst[63:32] );
+	assign w_burst3 = stripe( raid_type, tmp_burst[95:64] );
+
+	/* Read */
+	wire [31:0] r_ecc_code;
+	wire [4:0]  r_ecc_syndrome;
+	wire        r_ecc_parity;
+	wire        r_ecc_single;
+	wire        r_ecc_double;
+	wire [31:0] r_ecc_fixed;
+	wire [31:0] r_ecc;
+	assign r_ecc_code = r_raid0;
+	assign r_ecc_syndrome = ecc_syndrome( r_ecc_code );
+	assign r_ecc_parity = ^r_ecc_code[29:0];
+
+	/* Odd overall parity is a single error, either in the syndrome position or
+	* in the parity bit itself. Even parity with a syndrome is two errors. A
+	* syndrome past the end of the code can only come from more errors */
+	assign r_ecc_single = r_ecc_parity && (r_ecc_syndrome < 30);
+	assign r_ecc_double = (!r_ecc_parity && (r_ecc_syndrome != 0)) || (r_ecc_parity && (r_ecc_syndrome >= 30));
+	assign r_ecc_fixed = ( r_ecc_single ) ? (r_ecc_code ^ (32'b1 << r_ecc_syndrome)) : r_ecc_code;
+	assign r_ecc = { 8'b0, ecc_data( r_ecc_fixed ) };
+
+	/* Read pipeline stage 2 */
+	reg [31:0] r_raid0_q;
+	reg [31:0] r_raid1_q;
+	reg        r_raid1_eq_q;
+	reg [31:0] r_raid5_q;
+	reg        r_raid5_parity_err_q;
+	reg [31:0] r_raid10_q;
+	reg [31:0] r_ecc_q;
+	reg        r_ecc_single_q;
+	reg        r_ecc_double_q;
+
+	wire [31:0] r_raid0_p;
+	wire [31:0] r_raid1_p;
+	wire        r_raid1_eq_p;
+	wire [31:0] r_raid5_p;
+	wire        r_raid5_parity_err_p;
+	wire [31:0] r_raid10_p;
+	wire [31:0] r_ecc_p;
+	wire        r_ecc_single_p;
+	wire        r_ecc_double_p;
+	assign r_raid0_p            = ( PIPELINE >= 2 ) ? r_raid0_q            : r_raid0;
+	assign r_raid1_p            = ( PIPELINE >= 2 ) ? r_raid1_q            : r_raid1;
+	assign r_raid1_eq_p         = ( PIPELINE >= 2 ) ? r_raid1_eq_q         : r_raid1_eq;
+	assign r_raid5_p            = ( PIPELINE >= 2 ) ? r_raid5_q            : r_raid5;
+	assign r_raid5_parity_err_p = ( PIPELINE >= 2 ) ? r_raid5_parity_err_q : r_raid5_parity_err;
+	assign r_raid10_p           = ( PIPELINE >= 2 ) ? r_raid10_q           : r_raid10;
+	assign r_ecc_p              = ( PIPELINE >= 2 ) ? r_ecc_q              : r_ecc;
+	assign r_ecc_single_p       = ( PIPELINE >= 2 ) ? r_ecc_single_q       : r_ecc_single;
+	assign r_ecc_double_p       = ( PIPELINE >= 2 ) ? r_ecc_double_q       : r_ecc_double;
+
+	always @( posedge clk or posedge reset ) begin
+		if( reset ) begin
+			r_pipe_data0 <= 0;
+			r_pipe_data1 <= 0;
+			r_pipe_data2 <= 0;
+			r_pipe_data3 <= 0;
+
+			r_raid0_q <= 0;
+			r_raid1_q <= 0;
+			r_raid1_eq_q <= 0;
+			r_raid5_q <= 0;
+			r_raid5_parity_err_q <= 0;
+			r_raid10_q <= 0;
+			r_ecc_q <= 0;
+			r_ecc_single_q <= 0;
+			r_ecc_double_q <= 0;
+		end
+		else begin
+			r_pipe_data0 <= r_drive_data0;
+			r_pipe_data1 <= r_drive_data1;
+			r_pipe_data2 <= r_drive_data2;
+			r_pipe_data3 <= r_drive_data3;
+
+			r_raid0_q <= r_raid0;
+			r_raid1_q <= r_raid1;
+			r_raid1_eq_q <= r_raid1_eq;
+			r_raid5_q <= r_raid5;
+			r_raid5_parity_err_q <= r_raid5_parity_err;
+			r_raid10_q <= r_raid10;
+			r_ecc_q <= r_ecc;
+			r_ecc_single_q <= r_ecc_single;
+			r_ecc_double_q <= r_ecc_double;
+		end
+	end
+
 	reg [31:0] dout_tmp;
 
 	always @( posedge clk or posedge reset ) begin
@@ -159,9 +520,12 @@ module raid #(
 			busy <= 1;
 			parity <= 0;
 			err <= 0;
+			ecc_double <= 0;
 
 			w_drives <= 0;
 			r_drives <= 0;
+			drive_en <= 4'b1111;
+			raid10_sel <= 0;
 
 			w_drive_data0 <= 0;
 			w_drive_data1 <= 0;
@@ -170,6 +534,19 @@ module raid #(
 
 			op <= `OP_NOP;
 			tmp_data <= 0;
+			tmp_sel <= 0;
+			tmp_burst <= 0;
+			drive_burst <= 0;
+			drive_din_burst <= 0;
+			op_skip <= 0;
+			pipe_count <= 0;
+
+			perf_full_writes <= 0;
+			perf_rmw_writes <= 0;
+			perf_rcw_writes <= 0;
+			perf_drive_ops <= 0;
+			ecc_corrected <= 0;
+			ecc_uncorrected <= 0;
 
 			drive_addr <= 0;
 			last_op <= `OP_NOP;
@@ -201,24 +578,89 @@ module raid #(
 						/* Writing */
 						op <= `OP_WRITE;
 						drive_addr <= addr;
+						drive_en <= 4'b1111;
+
+						/* Only touch the drives holding the lanes written.
+						* With none of them selected busy still pulses, so
+						* the access completes */
+						if( (sel & held_lanes) == 4'b0000 ) begin
+							op <= `OP_WRITE_FINISH;
+							busy <= 1'b1;
+						end
+						else if( raid_type == `TYPE_RAID0 ) begin
+							drive_en <= sel;
+						end
+						else if( raid_type == `TYPE_RAID10 ) begin
+							drive_en <= { sel[1], sel[1], sel[0], sel[0] };
+						end
+						else if( raid_type == `TYPE_RAID5 ) begin
+							if( raid5_partial ) begin
+								/* Old data is needed for the parity first */
+								op <= `OP_PREREAD_WAIT;
+								if( raid5_use_rmw ) begin
+									drive_en <= { 1'b1, raid5_lanes };
+									perf_rmw_writes <= perf_rmw_writes + 1;
+								end
+								else begin
+									drive_en <= { 1'b0, ~raid5_lanes };
+									perf_rcw_writes <= perf_rcw_writes + 1;
+								end
+							end
+							else begin
+								perf_full_writes <= perf_full_writes + 1;
+							end
+						end
+						else if( (raid_type == `TYPE_ECC) && raid5_partial ) begin
+							/* Same lanes as RAID5, the whole codeword is
+							* read first to merge them */
+							op <= `OP_PREREAD_WAIT;
+						end
 						/* Output write signal, next cycle */
 						w_drives <= 1'b0;
 						r_drives <= 1'b0;
 
 						/* save input data */
 						tmp_data <= din;
+						tmp_sel <= { 1'b0, raid5_lanes };
+						tmp_burst <= din_burst;
+						drive_burst <= ( sel == 4'b1111 ) ? burst : 2'b0;
+						op_skip <= skip;
 						
 					end
 					else if( !write_en && read_en ) begin
 						/* Reading */
 						op <= `OP_READ_WAIT;
 						drive_addr <= addr;
+
+						/* Load balance RAID10 reads between mirrors, a
+						* degraded drive pins the read to the other half */
+						if( (raid_type == `TYPE_RAID10) && ((skip & 4'b0101) != 0) ) begin
+							drive_en <= 4'b1010;
+							raid10_sel <= 1'b0;
+						end
+						else if( (raid_type == `TYPE_RAID10) && ((skip & 4'b1010) != 0) ) begin
+							drive_en <= 4'b0101;
+							raid10_sel <= 1'b1;
+						end
+						else if( raid_type == `TYPE_RAID10 ) begin
+							drive_en <= ( raid10_sel ) ? 4'b1010 : 4'b0101;
+							raid10_sel <= ~raid10_sel;
+						end
+						else if( (raid_type == `TYPE_RAID1) || (raid_type == `TYPE_RAID5) ) begin
+							/* Read around a degraded drive */
+							drive_en <= ~skip;
+						end
+						else begin
+							drive_en <= 4'b1111;
+						end
+						op_skip <= skip;
 						/* Output read signal next cycle */
 						w_drives <= 1'b0;
 						r_drives <= 1'b0;
 
 						/* Make sure input register is clear */
 						tmp_data <= 0;
+						drive_burst <= 0;
 						
 					end
 				end
@@ -226,6 +668,7 @@ module raid #(
 				`OP_WRITE: begin
 					w_drives <= 1'b1;
 					r_drives <= 1'b0;
+					perf_drive_ops <= perf_drive_ops + drive_count(drive_en);
 					case ( raid_type )
 						`TYPE_RAID0: begin
 							/* Data striping. Only use 8 bits, since it is simpler */
@@ -255,8 +698,33 @@ module raid #(
 							w_drive_data3 <= w_raid5_d3;
 							op <= `OP_WRITE_FINISH;
 						end
+
+						`TYPE_RAID10: begin
+							/* Write 16 bits, each byte to a mirrored pair */
+							w_drive_data0 <= w_raid10_d0;
+							w_drive_data1 <= w_raid10_d1;
+							w_drive_data2 <= w_raid10_d2;
+							w_drive_data3 <= w_raid10_d3;
+							op <= `OP_WRITE_FINISH;
+						end
+
+						`TYPE_ECC: begin
+							/* Write 24 bits as a striped codeword */
+							w_drive_data0 <= { 24'b0, w_ecc[7:0] };
+							w_drive_data1 <= { 24'b0, w_ecc[15:8] };
+							w_drive_data2 <= { 24'b0, w_ecc[23:16] };
+							w_drive_data3 <= { 24'b0, w_ecc[31:24] };
+							op <= `OP_WRITE_FINISH;
+						end
 		
 					endcase 
+
+					/* Burst words, a byte of each for every drive */
+					drive_din_burst <= {
+						w_burst3[31:24], w_burst2[31:24], w_burst1[31:24],
+						w_burst3[23:16], w_burst2[23:16], w_burst1[23:16],
+						w_burst3[15:8], w_burst2[15:8], w_burst1[15:8],
+						w_burst3[7:0], w_burst2[7:0], w_burst1[7:0] };
 				end
 
 				`OP_READ_WAIT: begin
@@ -264,6 +732,7 @@ module raid #(
 						w_drives <= 1'b0;
 						r_drives <= 1'b0;
 						op <= `OP_READ;
+						perf_drive_ops <= perf_drive_ops + drive_count(drive_en);
 					end
 					else begin
 						w_drives <= 1'b0;
@@ -272,11 +741,19 @@ module raid #(
 				end
 
 				`OP_READ: begin
+					/* Wait for the read pipeline once drives are done */
+					if( drive_busy ) begin
+						pipe_count <= 0;
+					end
+					else if( pipe_count != PIPELINE ) begin
+						pipe_count <= pipe_count + 1;
+					end
+
 					case ( raid_type )
 						`TYPE_RAID0: begin
 							/* Read */
-							if( !drive_busy ) begin
-								dout_tmp <= r_raid0;
+							if( read_done ) begin
+								dout_tmp <= r_raid0_p;
 //								w_drives <= 1'b0;
 //								r_drives <= 1'b0;
 								op <= `OP_NOP;
@@ -284,15 +761,15 @@ module raid #(
 							end
 							/* Still busy, keep reading */
 							else begin
-								tmp_data <= r_raid0;
+								tmp_data <= r_raid0_p;
 							end
 						end
 		
 						`TYPE_RAID1: begin
 							/* Copied data */
 							/* Check if data is ready, and no issues */
-							if( !drive_busy && r_raid1_eq ) begin
-								dout_tmp <= r_raid1;//tmp_data;
+							if( read_done && r_raid1_eq_p ) begin
+								dout_tmp <= r_raid1_p;//tmp_data;
 								op <= `OP_NOP;
 //								w_drives <= 1'b0;
 //								r_drives <= 1'b0;
@@ -301,7 +778,7 @@ module raid #(
 
 							/* Data integrity is broken, raise error, no data
 							* out */
-							else if( !drive_busy && !r_raid1_eq ) begin
+							else if( read_done && !r_raid1_eq_p ) begin
 								err <= 1'b1;
 								dout_tmp <= 32'hFFFFFFFF;
 								op <= `OP_NOP;
@@ -313,33 +790,108 @@ module raid #(
 								/* Keep reading in data, should be ready once
 								* busy is over */
 							   	
-							   	tmp_data <= r_raid1;
+							   	tmp_data <= r_raid1_p;
 							end
 		
 						end
 		
 						`TYPE_RAID5: begin
-							if( !drive_busy ) begin
+							if( read_done ) begin
 								/* Output parity status  */
-								parity <= r_raid5_parity_err;
+								parity <= r_raid5_parity_err_p;
 								op <= `OP_NOP;
 //								w_drives <= 1'b0;
 //								r_drives <= 1'b0;
-								dout_tmp <= r_raid5;
+								dout_tmp <= r_raid5_p;
 								tmp_data <= 0;
 							end
 							else begin
 								/* Keep reading in data, should be complete
 								* once busy is over */
-							    tmp_data <= r_raid5;
+							    tmp_data <= r_raid5_p;
 
 							end
 						end
+
+						`TYPE_RAID10: begin
+							/* Only the selected half of each mirror was read */
+							if( read_done ) begin
+								op <= `OP_NOP;
+								dout_tmp <= r_raid10_p;
+								tmp_data <= 0;
+							end
+							else begin
+								/* Keep reading in data, should be complete
+								* once busy is over */
+							    tmp_data <= r_raid10_p;
+							end
+						end
+
+						`TYPE_ECC: begin
+							/* Single bit errors are fixed on the way out */
+							if( read_done ) begin
+								op <= `OP_NOP;
+								dout_tmp <= r_ecc_p;
+								ecc_double <= r_ecc_double_p;
+								if( r_ecc_single_p ) begin
+									ecc_corrected <= ecc_corrected + 1;
+								end
+								if( r_ecc_double_p ) begin
+									ecc_uncorrected <= ecc_uncorrected + 1;
+								end
+								tmp_data <= 0;
+							end
+							else begin
+								tmp_data <= r_ecc_p;
+							end
+						end
 		
 					endcase 
 
 
 				end
+				`OP_PREREAD_WAIT: begin
+					if( drive_busy ) begin
+						op <= `OP_PREREAD;
+						perf_drive_ops <= perf_drive_ops + drive_count(drive_en);
+					end
+					else begin
+						r_drives <= 1'b1;
+					end
+				end
+
+				`OP_PREREAD: begin
+					if( !drive_busy && (raid_type == `TYPE_ECC) ) begin
+						/* Old codeword is in, write the merged one. The
+						* read counts like any other ECC read */
+						w_drives <= 1'b1;
+						w_drive_data0 <= { 24'b0, w_ecc_partial[7:0] };
+						w_drive_data1 <= { 24'b0, w_ecc_partial[15:8] };
+						w_drive_data2 <= { 24'b0, w_ecc_partial[23:16] };
+						w_drive_data3 <= { 24'b0, w_ecc_partial[31:24] };
+						perf_drive_ops <= perf_drive_ops + 4;
+						ecc_double <= w_ecc_old_double;
+						if( w_ecc_old_single ) begin
+							ecc_corrected <= ecc_corrected + 1;
+						end
+						if( w_ecc_old_double ) begin
+							ecc_uncorrected <= ecc_uncorrected + 1;
+						end
+						op <= `OP_WRITE_FINISH;
+					end
+					else if( !drive_busy ) begin
+						/* Old data is in, write the new lanes and parity */
+						w_drives <= 1'b1;
+						drive_en <= { 1'b1, tmp_sel[2:0] };
+						w_drive_data0 <= w_raid5_d0;
+						w_drive_data1 <= w_raid5_d1;
+						w_drive_data2 <= w_raid5_d2;
+						w_drive_data3 <= ( drive_en[3] ) ? w_raid5_rmw_parity : w_raid5_rcw_parity;
+						perf_drive_ops <= perf_drive_ops + drive_count({ 1'b1, tmp_sel[2:0] });
+						op <= `OP_WRITE_FINISH;
+					end
+				end
+
 				`OP_WRITE_FINISH: begin
 					w_drives <= 1'b0;
 					r_drives <= 1'b0;
@@ -350,6 +902,7 @@ module raid #(
 //						w_drives <= 1'b0;
 //						r_drives <= 1'b0;
 						tmp_data <= 0;
+						tmp_sel <= 0;
 //						busy <= 1'b0;
 
 						w_drive_data0 <= 0;
@@ -389,7 +942,7 @@ module raid #(
 			assume( din[15:8] != 0 );
 			assume( din[23:16] != 0 );
 
-			assume( (raid_type == `TYPE_RAID0) || (raid_type == `TYPE_RAID1) || (raid_type == `TYPE_RAID5) );
+			assume( (raid_type == `TYPE_RAID0) || (raid_type == `TYPE_RAID1) || (raid_type == `TYPE_RAID5) || (raid_type == `TYPE_RAID10) || (raid_type == `TYPE_ECC) );
 
 			/* Setup $past */
 			past_available <= 1'b1;
@@ -0,0 +1,179 @@
+/* Hot spare promotion and rebuild */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* Once armed, the spare drive takes over the slot of a drive that is marked
+* degraded, as long as the RAID type can rebuild it (RAID1, RAID5, RAID10).
+* The slot is switched over while the array is idle, then every word is read
+* back and written again, one at a time. Reads go around the degraded slot,
+* so the word comes from the mirrors or parity, and the write puts it on the
+* spare along with the rest of the stripe. The host keeps using the array in
+* degraded mode between words, the same way as during a migration. When the
+* last word is written the degraded mask is cleared and the spare stays in
+* the slot for good. */
+
+module rebuild (
+		input				reset,
+		input				clk,
+
+		/* Register interface */
+		input				set_ctrl,
+		input      [31:0]	reg_din,
+		output reg			armed,		/* Spare waiting for a failure */
+		output reg [15:0]	throttle,	/* Idle cycles between words */
+		output reg [15:0]	mark,		/* Words below this are rebuilt */
+		output				active,		/* Rebuild in progress */
+		output				owner,		/* Engine owns the array */
+		output reg			in_use,		/* Spare has taken over a slot */
+		output reg [1:0]	slot,		/* Slot the spare took over */
+		output reg			promote,	/* Pulsed when the spare takes over */
+		output reg			done,		/* Pulsed when the rebuild finishes */
+
+		/* Array state */
+		input      [3:0]	degraded,
+		input				redundant,	/* RAID type can rebuild a drive */
+		input				allow,		/* No other engine running */
+		input      [15:0]	rb_len,		/* Words to rebuild, from offset 0 */
+
+		/* Host access waiting for the array */
+		input				host_pending,
+
+		/* spraid connection */
+		output reg			sp_read,
+		output reg			sp_write,
+		output     [31:0]	sp_addr,
+		output reg [31:0]	sp_din,
+		input      [31:0]	sp_dout,
+		input				sp_busy
+	);
+
+	/* Rebuild state machine */
+	`define REBUILD_IDLE		0
+	`define REBUILD_THROTTLE	1	/* Waiting between words, host can use array */
+	`define REBUILD_RUN			2	/* Issue next operation */
+	`define REBUILD_WAIT_BUSY	3	/* Operation issued, wait for array busy */
+	`define REBUILD_WAIT_DONE	4	/* Wait for array to finish */
+	`define REBUILD_CAPTURE		5	/* Array output is valid */
+	reg [2:0] rb_state;
+
+	reg [15:0] throttle_count;
+	reg        writing;
+
+	/* Only one drive can be rebuilt around */
+	wire single;
+	assign single = (degraded != 0) && ((degraded & (degraded - 1)) == 0);
+
+	assign sp_addr = { 16'b0, mark };
+	assign active = (rb_state != `REBUILD_IDLE);
+	assign owner = active && (rb_state != `REBUILD_THROTTLE);
+
+	always @(posedge clk or posedge reset) begin
+		if( reset ) begin
+			rb_state <= `REBUILD_IDLE;
+			armed <= 0;
+			throttle <= 16;
+			mark <= 0;
+			in_use <= 0;
+			slot <= 0;
+			promote <= 0;
+			done <= 0;
+			throttle_count <= 0;
+			writing <= 0;
+			sp_read <= 0;
+			sp_write <= 0;
+			sp_din <= 0;
+		end
+		else begin
+			/* Single cycle pulses */
+			sp_read <= 1'b0;
+			sp_write <= 1'b0;
+			promote <= 1'b0;
+			done <= 1'b0;
+
+			/* Register writes. The spare can't be disarmed once it holds
+			* a slot */
+			if( set_ctrl ) begin
+				throttle <= reg_din[31:16];
+				if( !in_use ) begin
+					armed <= reg_din[0];
+				end
+			end
+
+			case( rb_state )
+				`REBUILD_IDLE: begin
+					/* Switch the slot over between array operations */
+					if( armed && !in_use && single && redundant && allow &&
+						!host_pending && !sp_busy ) begin
+						in_use <= 1'b1;
+						armed <= 1'b0;
+						promote <= 1'b1;
+						slot <= ( degraded[0] ) ? 2'd0 : ( degraded[1] ) ? 2'd1 :
+							( degraded[2] ) ? 2'd2 : 2'd3;
+						mark <= 0;
+						writing <= 1'b0;
+						throttle_count <= 0;
+						rb_state <= `REBUILD_THROTTLE;
+					end
+				end
+
+				`REBUILD_THROTTLE: begin
+					if( throttle_count != 0 ) begin
+						throttle_count <= throttle_count - 1;
+					end
+					else if( mark == rb_len ) begin
+						/* Spare holds everything, slot is whole again */
+						done <= 1'b1;
+						rb_state <= `REBUILD_IDLE;
+					end
+					else if( !host_pending && !sp_busy ) begin
+						rb_state <= `REBUILD_RUN;
+					end
+				end
+
+				`REBUILD_RUN: begin
+					if( !sp_busy ) begin
+						if( writing ) begin
+							sp_write <= 1'b1;
+						end
+						else begin
+							sp_read <= 1'b1;
+						end
+						rb_state <= `REBUILD_WAIT_BUSY;
+					end
+				end
+
+				`REBUILD_WAIT_BUSY: begin
+					if( sp_busy ) begin
+						rb_state <= `REBUILD_WAIT_DONE;
+					end
+				end
+
+				`REBUILD_WAIT_DONE: begin
+					if( !sp_busy ) begin
+						rb_state <= `REBUILD_CAPTURE;
+					end
+				end
+
+				`REBUILD_CAPTURE: begin
+					if( !writing ) begin
+						/* Word read around the failed drive, write it back */
+						sp_din <= sp_dout;
+						writing <= 1'b1;
+						rb_state <= `REBUILD_RUN;
+					end
+					else begin
+						writing <= 1'b0;
+						mark <= mark + 1;
+						throttle_count <= throttle;
+						rb_state <= `REBUILD_THROTTLE;
+					end
+				end
+
+				default: begin
+				end
+			endcase
+
+		end
+	end
+
+endmodule
@@ -15,6 +15,10 @@ module spi32 (
 		/* Get size for command */
 		input [1:0]			nbytes,
 
+		/* Keep chip select low after the frame, so the next one carries on
+		* the same transaction. Dropping it ends the transaction */
+		input				hold,
+
 		/* Busy signal for higher level control */
 //		output reg			busy,
 		output				busy,
@@ -113,7 +117,9 @@ module spi32 (
 
 
 	reg tmp_busy;
-	assign busy = ~cs | tmp_busy | ~spi_tx_ready; 
+	/* Chip select held low between frames, not a transfer */
+	reg held;
+	assign busy = (~cs & ~held) | tmp_busy | ~spi_tx_ready; 
 
 
 	/* Actual SPI controller from NANDLAND (thanks) */
@@ -146,6 +152,7 @@ module spi32 (
 			spi_state <= `SPI_IDLE;
 			write_state <= `SPI_WRITE_START;
 			cs <= 1;
+			held <= 0;
 			write_fifo_spi_en <= 0;
 			tmp_busy <= 0;
 		end
@@ -162,13 +169,18 @@ module spi32 (
 					/* Ensure no more data is read out */
 					write_fifo_spi_en <= 0;
 					fifo_early_reset <= 1'b0;
-					cs <= 1'b1;
+					if( !hold ) begin
+						cs <= 1'b1;
+					end
+					held <= hold;
 					tmp_busy <= 1'b0;
 	
 					/* Writing, should have loaded data into shift register */
 					if( write && !read ) begin
 						tmp_busy <= 1'b1;
 						spi_state = `SPI_WRITE_FIFO;
+						/* Clear flag left over from a previous read */
+						read_flag <= 1'b0;
 						bytes2write <= nbytes;
 					end
 					else if( !write && read ) begin
@@ -183,6 +195,7 @@ module spi32 (
 				end
 	
 				`SPI_WRITE_FIFO: begin
+					held <= 1'b0;
 					if( (bytes2write == write_fifo_nbyte) && !write_fifo_full ) begin
 						cs <= 1'b0;
 						if(bytes2write == write_fifo_nbyte)begin
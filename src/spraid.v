@@ -6,9 +6,16 @@
 `define TYPE_RAID0	1
 `define TYPE_RAID1	0	/* Default, since simplest */
 `define TYPE_RAID5	5
+`define TYPE_RAID10	10
+`define TYPE_ECC	6
 
 
-module spraid(
+module spraid #(
+		parameter RAID_PIPELINE = 0,	/* Read compute pipeline stages, 0-2 */
+		parameter DRIVE_PROBE = 0,		/* Read drive JEDEC IDs after reset */
+		parameter HOT_SPARE = 0			/* Spare drive on SPI4 */
+	)
+	(
 		input			reset,
 		input			clk,
 
@@ -18,12 +25,63 @@ module spraid(
 		input			write,
 		input [31:0]	addr,
 		input [31:0]	din,
+		input [3:0]		sel,		/* Byte lanes to write */
+		input [1:0]		burst,		/* Extra words written after din */
+		input [95:0]	din_burst,	/* Extra words, next address in bits 31:0 */
 		output reg [31:0]	dout,
 		output			busy,
 		output reg		wbs_ack_o,	/* needed for wishbone */
 
 		output			parity,
 		output			err,
+		output			ecc_double,
+
+		/* Performance counters */
+		output [31:0]	perf_full_writes,
+		output [31:0]	perf_rmw_writes,
+		output [31:0]	perf_rcw_writes,
+		output [31:0]	perf_drive_ops,
+		output [31:0]	ecc_corrected,
+		output [31:0]	ecc_uncorrected,
+		output reg [31:0]	xip_reads,	/* Drive reads that continued a stream */
+
+		/* Continuous read stream idle timeout, 0 is off */
+		input  [15:0]	xip_timeout,
+
+		/* Deep power-down. Drives sleep after pd_timeout idle cycles, 0 is
+		* off, and are woken early while wake is set. Per slot values in
+		* bits [16*n +: 16] and [32*n +: 32] */
+		input  [15:0]	pd_timeout,
+		input  [63:0]	wake_time,		/* Wake up cycles of each part */
+		input			wake,
+		input  [3:0]	wake_clear,		/* Counters of slot n cleared */
+		output [3:0]	asleep,
+		output reg [127:0]	wake_count,	/* Wake ups */
+		output reg [127:0]	wake_stall,	/* Cycles a request waited on a wake up */
+
+		/* Drive discovery, reads and writes wait while probing. Drive n
+		* in bits [24*n +: 24], [5*n +: 5] and [3*n +: 3] */
+		output			probing,
+		output [95:0]	drive_id,
+		output [19:0]	drive_density,		/* log2 bytes */
+		output [11:0]	drive_addr_bytes,
+
+		/* Hot spare. While spare_in is set the spare drive stands in for
+		* slot spare_slot, the drive there is no longer used */
+		input			spare_in,
+		input  [1:0]	spare_slot,
+
+		/* Drive health, per drive values in bits [16*n +: 16] */
+		input			health_set_threshold,
+		input			health_set_degraded,
+		input  [3:0]	health_clear_max,
+		input  [31:0]	health_din,
+		output [15:0]	health_threshold,
+		output [3:0]	degraded,
+		output [63:0]	health_ewma,
+		output [63:0]	health_max,
+		input  [3:0]	health_clear_drive,
+		input			health_clear_degraded,
 
 
 
@@ -49,7 +107,13 @@ module spraid(
 		output 			spi3_clk,
 		output 			spi3_cs,
 		output 			spi3_mosi,
-		input			spi3_miso
+		input			spi3_miso,
+
+		/* SPI4, hot spare */
+		output 			spi4_clk,
+		output 			spi4_cs,
+		output 			spi4_mosi,
+		input			spi4_miso
 
 	);
 
@@ -57,6 +121,14 @@ module spraid(
 	/* raid - spi wires */
 	wire spi_read;
 	wire spi_write;
+	wire [3:0] spi_en;	/* Drives used by current operation */
+	wire [1:0] spi_burst;	/* Extra bytes in drive writes */
+	wire [95:0] spi_din_burst;
+	wire [4:0] xip_hit;		/* Drive read continued a stream */
+	wire [4:0] drive_probing;
+	wire [4:0] drive_asleep;
+	wire [4:0] drive_woke;
+	wire [4:0] drive_wake_wait;
 	wire spi0_busy;
 	wire spi1_busy;
 	wire spi2_busy;
@@ -74,26 +146,77 @@ module spraid(
 	wire [7:0] spi2_dout;
 	wire [7:0] spi3_dout;
 
+	/* Spare drive */
+	wire spare_busy;
+	wire [7:0] spare_dout;
+	wire [119:0] phys_id;
+	wire [24:0] phys_density;
+	wire [14:0] phys_addr_bytes;
+
+	/* Slot connections, the spare stands in for one once promoted */
+	wire [3:0] on_spare;
+	wire [7:0] slot0_dout;
+	wire [7:0] slot1_dout;
+	wire [7:0] slot2_dout;
+	wire [7:0] slot3_dout;
+	wire slot0_busy;
+	wire slot1_busy;
+	wire slot2_busy;
+	wire slot3_busy;
+	assign on_spare = ( HOT_SPARE && spare_in ) ? (4'b0001 << spare_slot) : 4'b0000;
+	assign slot0_dout = ( on_spare[0] ) ? spare_dout : spi0_dout;
+	assign slot1_dout = ( on_spare[1] ) ? spare_dout : spi1_dout;
+	assign slot2_dout = ( on_spare[2] ) ? spare_dout : spi2_dout;
+	assign slot3_dout = ( on_spare[3] ) ? spare_dout : spi3_dout;
+	assign slot0_busy = ( on_spare[0] ) ? spare_busy : spi0_busy;
+	assign slot1_busy = ( on_spare[1] ) ? spare_busy : spi1_busy;
+	assign slot2_busy = ( on_spare[2] ) ? spare_busy : spi2_busy;
+	assign slot3_busy = ( on_spare[3] ) ? spare_busy : spi3_busy;
+
+	/* Power state of whichever drive is in the slot */
+	wire [3:0] slot_woke;
+	wire [3:0] slot_wake_wait;
+
+	genvar g;
+	generate
+		for( g = 0; g < 4; g = g + 1 ) begin : slot_info
+			assign asleep[g] = ( on_spare[g] ) ? drive_asleep[4] : drive_asleep[g];
+			assign slot_woke[g] = ( on_spare[g] ) ? drive_woke[4] : drive_woke[g];
+			assign slot_wake_wait[g] = ( on_spare[g] ) ? drive_wake_wait[4] : drive_wake_wait[g];
+			assign drive_id[24*g +: 24] = ( on_spare[g] ) ? phys_id[96 +: 24] : phys_id[24*g +: 24];
+			assign drive_density[5*g +: 5] = ( on_spare[g] ) ? phys_density[20 +: 5] : phys_density[5*g +: 5];
+			assign drive_addr_bytes[3*g +: 3] = ( on_spare[g] ) ? phys_addr_bytes[12 +: 3] : phys_addr_bytes[3*g +: 3];
+		end
+	endgenerate
+
 	wire [31:0] dout_tmp;
 
 	reg		last_cycle_busy;
 	reg		last_cycle_write;
 	reg		last_cycle_read;
-	wire raid_write = ( last_cycle_write && write) ? 1'b0 : write;
-	wire raid_read = ( last_cycle_read && read) ? 1'b0 : read;
+	/* Requests held until the drives are probed, then seen as new */
+	wire raid_write = ( last_cycle_write && write) ? 1'b0 : write & ~probing;
+	wire raid_read = ( last_cycle_read && read) ? 1'b0 : read & ~probing;
 	wire wbs_ack;
 	reg last_wbs_ack;
 	assign wbs_ack = last_cycle_busy & ~busy;
+	assign probing = |drive_probing;
 
-	raid raid_module(
+	raid #(
+		.PIPELINE( RAID_PIPELINE )
+	) raid_module(
 		.reset(reset),
 		.clk(clk),
 
 		/* Host control */
 		.raid_type(raid_type),
+		.degraded(degraded),
 		.read_en(raid_read),
 		.write_en(raid_write),
 		.din(din),
+		.sel(sel),
+		.burst(burst),
+		.din_burst(din_burst),
 		.dout(dout_tmp),
 		.addr(addr),
 		.busy(busy),
@@ -101,39 +224,85 @@ module spraid(
 		/* Flags */
 		.parity(parity),
 		.err(err),
+		.ecc_double(ecc_double),
 
 		/* Device connections */
 		.w_drives(spi_write),
 		.r_drives(spi_read),
+		.drive_en(spi_en),
+		.drive_burst(spi_burst),
+		.drive_din_burst(spi_din_burst),
 
 		.drive_addr(spi_addr),
 
-		.r_drive_data0({24'b0, spi0_dout}),
+		.r_drive_data0({24'b0, slot0_dout}),
 		.w_drive_data0(spi0_din),
-		.busy_drive0(spi0_busy),
+		.busy_drive0(slot0_busy),
 
-		.r_drive_data1({24'b0,spi1_dout}),
+		.r_drive_data1({24'b0, slot1_dout}),
 		.w_drive_data1(spi1_din),
-		.busy_drive1(spi1_busy),
+		.busy_drive1(slot1_busy),
 
-		.r_drive_data2({24'b0,spi2_dout}),
+		.r_drive_data2({24'b0, slot2_dout}),
 		.w_drive_data2(spi2_din),
-		.busy_drive2(spi2_busy),
+		.busy_drive2(slot2_busy),
 
-		.r_drive_data3({24'b0,spi3_dout}),
+		.r_drive_data3({24'b0, slot3_dout}),
 		.w_drive_data3(spi3_din),
-		.busy_drive3(spi3_busy)
+		.busy_drive3(slot3_busy),
+
+		.perf_full_writes(perf_full_writes),
+		.perf_rmw_writes(perf_rmw_writes),
+		.perf_rcw_writes(perf_rcw_writes),
+		.perf_drive_ops(perf_drive_ops),
+		.ecc_corrected(ecc_corrected),
+		.ecc_uncorrected(ecc_uncorrected)
+
+	);
+
+	/* Latency of each drive */
+	drive_health health(
+		.reset(reset),
+		.clk(clk),
 
+		.set_threshold(health_set_threshold),
+		.set_degraded(health_set_degraded),
+		.clear_max(health_clear_max),
+		.reg_din(health_din),
+		.threshold(health_threshold),
+		.degraded(degraded),
+		.ewma(health_ewma),
+		.max(health_max),
+		.clear_drive(health_clear_drive),
+		.clear_degraded(health_clear_degraded),
+
+		.drive_busy({ slot3_busy, slot2_busy, slot1_busy, slot0_busy })
 	);
 
 	/* SPI0 */
-	flash_ctl drive0(
+	flash_ctl #(
+		.PROBE( DRIVE_PROBE )
+	) drive0(
 		.reset(reset),
 		.clk(clk),
-		.read(spi_read),
-		.write(spi_write),
+		.read(spi_read & spi_en[0] & ~on_spare[0]),
+		.write(spi_write & spi_en[0] & ~on_spare[0]),
 		.addr(spi_addr[15:0]),
 		.din(spi0_din[7:0]),
+		.burst(spi_burst),
+		.din_burst(spi_din_burst[23:0]),
+		.xip_timeout(xip_timeout),
+		.xip_hit(xip_hit[0]),
+		.pd_timeout(pd_timeout),
+		.wake_time(wake_time[15:0]),
+		.wake(wake),
+		.asleep(drive_asleep[0]),
+		.woke(drive_woke[0]),
+		.wake_wait(drive_wake_wait[0]),
+		.probing(drive_probing[0]),
+		.jedec_id(phys_id[23:0]),
+		.density(phys_density[4:0]),
+		.addr_bytes(phys_addr_bytes[2:0]),
 		.dout(spi0_dout),
 		.busy(spi0_busy),
 		
@@ -146,13 +315,29 @@ module spraid(
 	);
 
 	/* SPI1 */
-	flash_ctl drive1(
+	flash_ctl #(
+		.PROBE( DRIVE_PROBE )
+	) drive1(
 		.reset(reset),
 		.clk(clk),
-		.read(spi_read),
-		.write(spi_write),
+		.read(spi_read & spi_en[1] & ~on_spare[1]),
+		.write(spi_write & spi_en[1] & ~on_spare[1]),
 		.addr(spi_addr[15:0]),
 		.din(spi1_din[7:0]),
+		.burst(spi_burst),
+		.din_burst(spi_din_burst[47:24]),
+		.xip_timeout(xip_timeout),
+		.xip_hit(xip_hit[1]),
+		.pd_timeout(pd_timeout),
+		.wake_time(wake_time[31:16]),
+		.wake(wake),
+		.asleep(drive_asleep[1]),
+		.woke(drive_woke[1]),
+		.wake_wait(drive_wake_wait[1]),
+		.probing(drive_probing[1]),
+		.jedec_id(phys_id[47:24]),
+		.density(phys_density[9:5]),
+		.addr_bytes(phys_addr_bytes[5:3]),
 		.dout(spi1_dout),
 		.busy(spi1_busy),
 		
@@ -165,13 +350,29 @@ module spraid(
 	);
 
 	/* SPI2 */
-	flash_ctl drive2(
+	flash_ctl #(
+		.PROBE( DRIVE_PROBE )
+	) drive2(
 		.reset(reset),
 		.clk(clk),
-		.read(spi_read),
-		.write(spi_write),
+		.read(spi_read & spi_en[2] & ~on_spare[2]),
+		.write(spi_write & spi_en[2] & ~on_spare[2]),
 		.addr(spi_addr[15:0]),
 		.din(spi2_din[7:0]),
+		.burst(spi_burst),
+		.din_burst(spi_din_burst[71:48]),
+		.xip_timeout(xip_timeout),
+		.xip_hit(xip_hit[2]),
+		.pd_timeout(pd_timeout),
+		.wake_time(wake_time[47:32]),
+		.wake(wake),
+		.asleep(drive_asleep[2]),
+		.woke(drive_woke[2]),
+		.wake_wait(drive_wake_wait[2]),
+		.probing(drive_probing[2]),
+		.jedec_id(phys_id[71:48]),
+		.density(phys_density[14:10]),
+		.addr_bytes(phys_addr_bytes[8:6]),
 		.dout(spi2_dout),
 		.busy(spi2_busy),
 		
@@ -184,13 +385,29 @@ module spraid(
 	);
 
 	/* SPI3 */
-	flash_ctl drive3(
+	flash_ctl #(
+		.PROBE( DRIVE_PROBE )
+	) drive3(
 		.reset(reset),
 		.clk(clk),
-		.read(spi_read),
-		.write(spi_write),
+		.read(spi_read & spi_en[3] & ~on_spare[3]),
+		.write(spi_write & spi_en[3] & ~on_spare[3]),
 		.addr(spi_addr[15:0]),
 		.din(spi3_din[7:0]),
+		.burst(spi_burst),
+		.din_burst(spi_din_burst[95:72]),
+		.xip_timeout(xip_timeout),
+		.xip_hit(xip_hit[3]),
+		.pd_timeout(pd_timeout),
+		.wake_time(wake_time[63:48]),
+		.wake(wake),
+		.asleep(drive_asleep[3]),
+		.woke(drive_woke[3]),
+		.wake_wait(drive_wake_wait[3]),
+		.probing(drive_probing[3]),
+		.jedec_id(phys_id[95:72]),
+		.density(phys_density[19:15]),
+		.addr_bytes(phys_addr_bytes[11:9]),
 		.dout(spi3_dout),
 		.busy(spi3_busy),
 
@@ -202,6 +419,66 @@ module spraid(
 
 	);
 
+	/* SPI4, hot spare, takes the requests of the slot it stands in for */
+	generate
+		if( HOT_SPARE ) begin : spare
+			wire [1:0] n;
+			assign n = spare_slot;
+
+			flash_ctl #(
+				.PROBE( DRIVE_PROBE )
+			) drive4(
+				.reset(reset),
+				.clk(clk),
+				.read(spi_read & |(spi_en & on_spare)),
+				.write(spi_write & |(spi_en & on_spare)),
+				.addr(spi_addr[15:0]),
+				.din( (n == 0) ? spi0_din[7:0] : (n == 1) ? spi1_din[7:0] :
+					(n == 2) ? spi2_din[7:0] : spi3_din[7:0] ),
+				.burst(spi_burst),
+				.din_burst(spi_din_burst[24*n +: 24]),
+				.xip_timeout(xip_timeout),
+				.xip_hit(xip_hit[4]),
+				.pd_timeout(pd_timeout),
+				.wake_time(wake_time[16*n +: 16]),
+				.wake(wake),
+				.asleep(drive_asleep[4]),
+				.woke(drive_woke[4]),
+				.wake_wait(drive_wake_wait[4]),
+				.probing(drive_probing[4]),
+				.jedec_id(phys_id[119:96]),
+				.density(phys_density[24:20]),
+				.addr_bytes(phys_addr_bytes[14:12]),
+				.dout(spare_dout),
+				.busy(spare_busy),
+
+				/* SPI */
+				.spi_clk(spi4_clk),
+				.spi_cs(spi4_cs),
+				.spi_mosi(spi4_mosi),
+				.spi_miso(spi4_miso)
+
+			);
+		end
+		else begin : no_spare
+			assign xip_hit[4] = 1'b0;
+			assign drive_probing[4] = 1'b0;
+			assign drive_asleep[4] = 1'b0;
+			assign drive_woke[4] = 1'b0;
+			assign drive_wake_wait[4] = 1'b0;
+			assign phys_id[119:96] = 24'b0;
+			assign phys_density[24:20] = 5'b0;
+			assign phys_addr_bytes[14:12] = 3'b0;
+			assign spare_dout = 8'b0;
+			assign spare_busy = 1'b0;
+			assign spi4_clk = 1'b0;
+			assign spi4_cs = 1'b1;
+			assign spi4_mosi = 1'b0;
+		end
+	endgenerate
+
+	integer i;
+
 	always @(posedge clk or posedge reset ) begin
 		if( reset ) begin
 			wbs_ack_o <= 0;
@@ -210,6 +487,9 @@ module spraid(
 			last_cycle_busy <= 1;
 			last_cycle_read <= 0;
 			last_cycle_write <= 0;
+			xip_reads <= 0;
+			wake_count <= 0;
+			wake_stall <= 0;
 		end
 		else begin
 			last_wbs_ack <= wbs_ack;
@@ -227,8 +507,20 @@ module spraid(
 			end
 			dout <= dout_tmp;
 			last_cycle_busy <= busy;
-			last_cycle_read <= read;
-			last_cycle_write <= write;
+			last_cycle_read <= read & ~probing;
+			last_cycle_write <= write & ~probing;
+			xip_reads <= xip_reads + xip_hit[0] + xip_hit[1] + xip_hit[2] + xip_hit[3] + xip_hit[4];
+
+			for( i = 0; i < 4; i = i + 1 ) begin
+				if( wake_clear[i] ) begin
+					wake_count[32*i +: 32] <= 0;
+					wake_stall[32*i +: 32] <= 0;
+				end
+				else begin
+					wake_count[32*i +: 32] <= wake_count[32*i +: 32] + slot_woke[i];
+					wake_stall[32*i +: 32] <= wake_stall[32*i +: 32] + slot_wake_wait[i];
+				end
+			end
 		end
 	end
 
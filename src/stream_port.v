@@ -0,0 +1,219 @@
+/* Auto incrementing stream port for bulk array access */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* The host programs a start address and a length in words, then moves the
+* data through a single data register. Each array word is at a window offset
+* (same storage as WB_ADDR_BASE + offset), and the stream advances one offset
+* per word, so consecutive words are consecutive bytes on every drive. The
+* direction is decided by the first access to the data register after the
+* length is written. */
+
+module stream_port #(
+		parameter FIFO_DEPTH = 8
+	)
+	(
+		input				reset,
+		input				clk,
+
+		/* Register interface */
+		input				set_addr,
+		input				set_len,
+		input      [31:0]	reg_din,
+		output reg [31:0]	stream_addr,
+		output reg [15:0]	stream_left,	/* Words left to move to/from the array */
+		output				active,			/* Stream owns the array */
+
+		/* Data register interface, requests are held until host_done */
+		input				host_wr_req,
+		input				host_rd_req,
+		input      [31:0]	host_din,
+		output reg [31:0]	host_dout,
+		output reg			host_done,
+
+		/* spraid connection */
+		output reg			sp_read,
+		output reg			sp_write,
+		output     [31:0]	sp_addr,
+		output reg [31:0]	sp_din,
+		input      [31:0]	sp_dout,
+		input				sp_busy
+	);
+
+	/* Stream state machine */
+	`define STREAM_IDLE			0
+	`define STREAM_ARMED		1	/* Length written, waiting for direction */
+	`define STREAM_RUN			2	/* Issue operations when data/space ready */
+	`define STREAM_WAIT_BUSY	3	/* Operation issued, wait for array busy */
+	`define STREAM_WAIT_DONE	4	/* Wait for array to finish */
+	`define STREAM_CAPTURE		5	/* Array output is valid, store it */
+	reg [2:0] stream_state;
+
+	/* Direction of stream, set by first data access */
+	reg dir_read;
+
+	/* Words the host can still move through the data register */
+	reg [15:0] host_left;
+
+	/* Reset fifo when a new stream starts */
+	reg fifo_flush;
+
+	/* Data FIFO, holds write data or prefetched read data */
+	reg			fifo_push;
+	reg			fifo_pop;
+	reg [31:0]	fifo_din;
+	wire [31:0]	fifo_dout;
+	wire		fifo_full;
+	wire		fifo_empty;
+	wire [$clog2(FIFO_DEPTH)-1:0] fifo_count;
+
+	sync_fifo #(
+		.FIFO_WIDTH(32),
+		.FIFO_DEPTH(FIFO_DEPTH)
+	) stream_fifo (
+		.reset(reset | fifo_flush),
+		.clk(clk),
+		.read_en(fifo_pop),
+		.write_en(fifo_push),
+		.din(fifo_din),
+		.dout(fifo_dout),
+		.fifo_full(fifo_full),
+		.fifo_empty(fifo_empty),
+		.count_out(fifo_count)
+	);
+
+	assign sp_addr = stream_addr;
+	assign active = (stream_state != `STREAM_IDLE);
+
+	always @(posedge clk or posedge reset) begin
+		if( reset ) begin
+			stream_state <= `STREAM_IDLE;
+			stream_addr <= 0;
+			stream_left <= 0;
+			host_left <= 0;
+			dir_read <= 0;
+			fifo_flush <= 0;
+			fifo_push <= 0;
+			fifo_pop <= 0;
+			fifo_din <= 0;
+			host_dout <= 0;
+			host_done <= 0;
+			sp_read <= 0;
+			sp_write <= 0;
+			sp_din <= 0;
+		end
+		else begin
+			/* Single cycle pulses */
+			fifo_flush <= 1'b0;
+			fifo_push <= 1'b0;
+			fifo_pop <= 1'b0;
+			host_done <= 1'b0;
+			sp_read <= 1'b0;
+			sp_write <= 1'b0;
+
+			/* Register writes, only allowed when not moving data */
+			if( set_addr && !active ) begin
+				stream_addr <= reg_din;
+			end
+			if( set_len && !active ) begin
+				stream_left <= reg_din[15:0];
+				host_left <= reg_din[15:0];
+				fifo_flush <= 1'b1;
+				if( reg_din[15:0] != 0 ) begin
+					stream_state <= `STREAM_ARMED;
+				end
+			end
+
+			/* Host side of the data register */
+			if( host_wr_req && !host_done && !fifo_flush ) begin
+				if( (stream_state == `STREAM_ARMED) || (active && !dir_read) ) begin
+					if( stream_state == `STREAM_ARMED ) begin
+						dir_read <= 1'b0;
+						stream_state <= `STREAM_RUN;
+					end
+					if( host_left == 0 ) begin
+						/* Past the end of stream, drop the data */
+						host_done <= 1'b1;
+					end
+					else if( !fifo_full ) begin
+						fifo_din <= host_din;
+						fifo_push <= 1'b1;
+						host_left <= host_left - 1;
+						host_done <= 1'b1;
+					end
+				end
+				else begin
+					/* No stream set up */
+					host_done <= 1'b1;
+				end
+			end
+			else if( host_rd_req && !host_done && !fifo_flush ) begin
+				if( stream_state == `STREAM_ARMED ) begin
+					/* Start prefetching, host waits for first word */
+					dir_read <= 1'b1;
+					stream_state <= `STREAM_RUN;
+				end
+				else if( dir_read && !fifo_empty ) begin
+					host_dout <= fifo_dout;
+					fifo_pop <= 1'b1;
+					host_done <= 1'b1;
+				end
+				else if( !dir_read || (stream_left == 0 && fifo_empty && !fifo_push) ) begin
+					/* Nothing left to give */
+					host_dout <= 0;
+					host_done <= 1'b1;
+				end
+			end
+
+			/* Array side */
+			case( stream_state )
+				`STREAM_RUN: begin
+					if( stream_left == 0 ) begin
+						stream_state <= `STREAM_IDLE;
+					end
+					else if( !sp_busy ) begin
+						if( !dir_read && !fifo_empty ) begin
+							/* Write next word */
+							sp_din <= fifo_dout;
+							sp_write <= 1'b1;
+							fifo_pop <= 1'b1;
+							stream_state <= `STREAM_WAIT_BUSY;
+						end
+						else if( dir_read && !fifo_full ) begin
+							/* Prefetch next word while there is room for it */
+							sp_read <= 1'b1;
+							stream_state <= `STREAM_WAIT_BUSY;
+						end
+					end
+				end
+
+				`STREAM_WAIT_BUSY: begin
+					if( sp_busy ) begin
+						stream_state <= `STREAM_WAIT_DONE;
+					end
+				end
+
+				`STREAM_WAIT_DONE: begin
+					if( !sp_busy ) begin
+						stream_state <= `STREAM_CAPTURE;
+					end
+				end
+
+				`STREAM_CAPTURE: begin
+					if( dir_read ) begin
+						fifo_din <= sp_dout;
+						fifo_push <= 1'b1;
+					end
+					stream_addr <= stream_addr + 1;
+					stream_left <= stream_left - 1;
+					stream_state <= `STREAM_RUN;
+				end
+
+				default: begin
+				end
+			endcase
+
+		end
+	end
+
+endmodule
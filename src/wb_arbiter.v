@@ -0,0 +1,214 @@
+/* Wishbone arbiter, N slave ports sharing one master port */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* Arbitration modes */
+`define ARB_ROUND_ROBIN		0	/* Port after the last one granted goes first */
+`define ARB_PRIORITY		1	/* Lowest port number always goes first */
+
+/* Ports are granted one operation at a time. The grant is dropped when the
+* operation is acked, and the master side is idle for a cycle before the next
+* grant so the slave sees every operation start. With round robin a port
+* doing back to back operations can not hold off the others.
+*
+* Each port has counters for operations done, total and worst latency, where
+* latency is the cycles from cyc and stb going high to ack. They are read
+* from any port at STAT_BASE + 4 * port: +0 operations, +1 total latency,
+* +2 worst latency. Writing any of them clears all three for that port. These
+* accesses are answered by the arbiter and never reach the master side. */
+
+module wb_arbiter #(
+		parameter NPORTS = 2,
+		parameter ARB_MODE = `ARB_ROUND_ROBIN,
+		parameter STAT_BASE = 32'h30000815
+	)
+	(
+		input							clk,
+		input							reset,
+
+		/* Slave ports, port n in bits [n*width +: width] */
+		input      [NPORTS-1:0]			s_cyc_i,
+		input      [NPORTS-1:0]			s_stb_i,
+		input      [NPORTS-1:0]			s_we_i,
+		input      [32*NPORTS-1:0]		s_adr_i,
+		input      [32*NPORTS-1:0]		s_dat_i,
+		input      [4*NPORTS-1:0]		s_sel_i,
+		output reg [32*NPORTS-1:0]		s_dat_o,
+		output reg [NPORTS-1:0]			s_ack_o,
+		output reg [NPORTS-1:0]			s_stall_o,
+
+		/* Master port */
+		output reg						m_cyc_o,
+		output reg						m_stb_o,
+		output reg						m_we_o,
+		output reg [31:0]				m_adr_o,
+		output reg [31:0]				m_dat_o,
+		output reg [3:0]				m_sel_o,
+		input      [31:0]				m_dat_i,
+		input							m_ack_i,
+		input							m_stall_i
+	);
+
+	/* Arbiter state */
+	`define ARB_IDLE	0	/* Nothing granted, pick next port */
+	`define ARB_GRANT	1	/* Operation in flight for granted port */
+	`define ARB_GAP		2	/* Master side idle for a cycle after ack */
+	reg [1:0] arb_state;
+
+	reg [$clog2(NPORTS+1)-1:0] grant;
+	reg [$clog2(NPORTS+1)-1:0] last_grant;
+
+	/* Latency counters */
+	reg [32*NPORTS-1:0] stat_ops;
+	reg [32*NPORTS-1:0] stat_total;
+	reg [32*NPORTS-1:0] stat_max;
+	reg [32*NPORTS-1:0] stat_wait;	/* Cycles the current operation has waited */
+	reg [NPORTS-1:0]	stat_ack;	/* Counter access acked last cycle */
+
+	/* Request decode */
+	reg [NPORTS-1:0] req;
+	reg [NPORTS-1:0] stat_req;
+	reg [NPORTS-1:0] stat_clear;	/* Counters of port written this cycle */
+	reg [31:0] port_adr;
+	reg [31:0] stat_idx;
+	integer i;
+	integer j;
+	integer n;
+
+	always @(*) begin
+		stat_clear = 0;
+		for( i = 0; i < NPORTS; i = i + 1 ) begin
+			port_adr = s_adr_i[32*i +: 32];
+			stat_req[i] = s_cyc_i[i] && s_stb_i[i] &&
+				(port_adr >= STAT_BASE) && (port_adr < STAT_BASE + 4 * NPORTS);
+			req[i] = s_cyc_i[i] && s_stb_i[i] && !stat_req[i];
+			if( stat_req[i] && !stat_ack[i] && s_we_i[i] ) begin
+				stat_clear[(port_adr - STAT_BASE) >> 2] = 1'b1;
+			end
+		end
+	end
+
+	/* Next port to grant */
+	reg [$clog2(NPORTS+1)-1:0] next_grant;
+	reg next_valid;
+	integer k;
+	integer idx;
+
+	always @(*) begin
+		next_grant = 0;
+		next_valid = 1'b0;
+		for( k = NPORTS; k > 0; k = k - 1 ) begin
+			if( ARB_MODE == `ARB_PRIORITY ) begin
+				idx = k - 1;
+			end
+			else begin
+				idx = (last_grant + k) % NPORTS;
+			end
+			/* Later iterations win, so walk from lowest to highest priority */
+			if( req[idx] ) begin
+				next_grant = idx;
+				next_valid = 1'b1;
+			end
+		end
+	end
+
+	/* Connect granted port to master side */
+	always @(*) begin
+		m_cyc_o = 1'b0;
+		m_stb_o = 1'b0;
+		m_we_o = 1'b0;
+		m_adr_o = 0;
+		m_dat_o = 0;
+		m_sel_o = 0;
+		stat_idx = 0;
+		s_ack_o = stat_ack;
+		s_stall_o = {NPORTS{1'b1}};
+		for( j = 0; j < NPORTS; j = j + 1 ) begin
+			s_dat_o[32*j +: 32] = m_dat_i;
+			if( stat_ack[j] ) begin
+				stat_idx = s_adr_i[32*j +: 32] - STAT_BASE;
+				case( stat_idx[1:0] )
+					0: s_dat_o[32*j +: 32] = stat_ops[32*(stat_idx >> 2) +: 32];
+					1: s_dat_o[32*j +: 32] = stat_total[32*(stat_idx >> 2) +: 32];
+					2: s_dat_o[32*j +: 32] = stat_max[32*(stat_idx >> 2) +: 32];
+					default: s_dat_o[32*j +: 32] = 0;
+				endcase
+			end
+		end
+		if( arb_state == `ARB_GRANT ) begin
+			m_cyc_o = s_cyc_i[grant];
+			m_stb_o = s_stb_i[grant];
+			m_we_o = s_we_i[grant];
+			m_adr_o = s_adr_i[32*grant +: 32];
+			m_dat_o = s_dat_i[32*grant +: 32];
+			m_sel_o = s_sel_i[4*grant +: 4];
+			s_ack_o[grant] = m_ack_i;
+			s_stall_o[grant] = m_stall_i;
+		end
+	end
+
+	always @(posedge clk or posedge reset) begin
+		if( reset ) begin
+			arb_state <= `ARB_IDLE;
+			grant <= 0;
+			last_grant <= NPORTS - 1;
+			stat_ack <= 0;
+			stat_ops <= 0;
+			stat_total <= 0;
+			stat_max <= 0;
+			stat_wait <= 0;
+		end
+		else begin
+			case( arb_state )
+				`ARB_IDLE: begin
+					if( next_valid ) begin
+						grant <= next_grant;
+						arb_state <= `ARB_GRANT;
+					end
+				end
+
+				`ARB_GRANT: begin
+					/* Operation done, or port gave up on it */
+					if( m_ack_i || !(s_cyc_i[grant] && s_stb_i[grant]) ) begin
+						last_grant <= grant;
+						arb_state <= `ARB_GAP;
+					end
+				end
+
+				`ARB_GAP: begin
+					arb_state <= `ARB_IDLE;
+				end
+
+				default: begin
+					arb_state <= `ARB_IDLE;
+				end
+			endcase
+
+			/* Counter accesses, acked the cycle after they are seen */
+			/* Latency of each port's operations */
+			for( n = 0; n < NPORTS; n = n + 1 ) begin
+				stat_ack[n] <= stat_req[n] && !stat_ack[n];
+				if( stat_clear[n] ) begin
+					stat_ops[32*n +: 32] <= 0;
+					stat_total[32*n +: 32] <= 0;
+					stat_max[32*n +: 32] <= 0;
+				end
+				else if( s_ack_o[n] && !stat_ack[n] ) begin
+					/* Operation done, count the ack cycle too */
+					stat_ops[32*n +: 32] <= stat_ops[32*n +: 32] + 1;
+					stat_total[32*n +: 32] <= stat_total[32*n +: 32] + stat_wait[32*n +: 32] + 1;
+					if( stat_wait[32*n +: 32] + 1 > stat_max[32*n +: 32] ) begin
+						stat_max[32*n +: 32] <= stat_wait[32*n +: 32] + 1;
+					end
+				end
+				if( req[n] && !s_ack_o[n] ) begin
+					stat_wait[32*n +: 32] <= stat_wait[32*n +: 32] + 1;
+				end
+				else begin
+					stat_wait[32*n +: 32] <= 0;
+				end
+			end
+		end
+	end
+
+endmodule
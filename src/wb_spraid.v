@@ -6,10 +6,81 @@
 `define WB_ADDR_BASE		32'h30000000
 `define SPRAID_MEM_SZ		32'h7FF
 `define SPRAID_ADR_MAX		(`WB_ADDR_BASE + `SPRAID_MEM_SZ)
+`define SPRAID_MEM_WORDS	(`SPRAID_MEM_SZ + 1)	/* Words in the window, last offset included */
 `define SPRAID_RAID_TYPE	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 1)
 `define SPRAID_STATUS		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 2)
 
-module wb_spraid (
+/* Stream port registers */
+`define SPRAID_STREAM_ADDR	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 3)	/* Window offset of first word */
+`define SPRAID_STREAM_LEN	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 4)	/* Words to move, starts stream */
+`define SPRAID_STREAM_DATA	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 5)	/* Data register */
+
+/* Offload engine registers */
+`define SPRAID_OFFLOAD_ADDR		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 6)	/* Window offset of first word */
+`define SPRAID_OFFLOAD_LEN		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 7)	/* Words in range */
+`define SPRAID_OFFLOAD_VALUE	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 8)	/* Fill value or compare pattern */
+`define SPRAID_OFFLOAD_CMD		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 9)	/* Write starts command */
+`define SPRAID_OFFLOAD_RESULT	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 10)	/* CRC32 or compare result */
+`define SPRAID_OFFLOAD_MISMATCH	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 11)	/* First mismatch offset */
+
+/* Performance counters, read only */
+`define SPRAID_PERF_FULL_WR		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 12)	/* RAID5 full stripe writes */
+`define SPRAID_PERF_RMW_WR		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 13)	/* RAID5 read-modify-writes */
+`define SPRAID_PERF_RCW_WR		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 14)	/* RAID5 reconstruct-writes */
+`define SPRAID_PERF_DRIVE_OPS	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 15)	/* Drive level SPI transactions */
+
+/* RAID level migration registers */
+`define SPRAID_MIGRATE_TARGET	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 16)	/* Write starts migration to type */
+`define SPRAID_MIGRATE_LEN		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 17)	/* Words to migrate from offset 0 */
+`define SPRAID_MIGRATE_THROTTLE	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 18)	/* Idle cycles between words */
+`define SPRAID_MIGRATE_MARK		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 19)	/* High water mark, read only */
+
+/* ECC counters, read only */
+`define SPRAID_ECC_CORRECTED	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 20)	/* Single bit errors fixed */
+`define SPRAID_ECC_UNCORRECTED	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 21)	/* Double bit errors found */
+
+/* Multi port front end, latency counters answered by the arbiter */
+`define SPRAID_ARB_STAT			(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 22)	/* 4 registers per port */
+`define SPRAID_ARB_PORTS		2	/* Ports with room for counters */
+
+/* Drive health, after the arbiter counters of two ports */
+`define SPRAID_HEALTH_THRESHOLD	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 30)	/* Average busy cycles before demotion */
+`define SPRAID_HEALTH_DEGRADED	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 31)	/* Degraded drive mask */
+`define SPRAID_HEALTH_EWMA		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 32)	/* Average per drive, read only */
+`define SPRAID_HEALTH_MAX		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 36)	/* Worst case per drive, write clears */
+
+/* Write coalescing */
+`define SPRAID_COALESCE_WINDOW	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 40)	/* Merge window in cycles, 0 is off */
+`define SPRAID_COALESCE_WRITES	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 41)	/* Writes merged, read only */
+`define SPRAID_COALESCE_BURSTS	(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 42)	/* Bursts written, read only */
+
+/* Continuous reads */
+`define SPRAID_XIP_TIMEOUT		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 43)	/* Stream idle cycles, 0 is off */
+`define SPRAID_XIP_READS		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 44)	/* Drive reads from a stream, read only */
+
+/* Drive discovery, all read only */
+`define SPRAID_DRIVE_ID			(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 45)	/* JEDEC ID per drive, 0 if none */
+`define SPRAID_DRIVE_CAPS		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 49)	/* Capabilities per drive */
+`define SPRAID_GEOMETRY			(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 53)	/* Usable words, data bytes per word */
+`define SPRAID_CAPACITY			(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 54)	/* Usable bytes for the RAID type */
+
+/* Hot spare */
+`define SPRAID_SPARE_CTRL		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 55)	/* Arm, rebuild throttle */
+`define SPRAID_SPARE_STATUS		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 56)	/* Spare state, read only */
+`define SPRAID_REBUILD_MARK		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 57)	/* Words rebuilt, read only */
+
+/* Drive power management */
+`define SPRAID_POWER_CTRL		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 58)	/* Power-down idle cycles, keep awake */
+`define SPRAID_WAKE_TIME		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 59)	/* Wake up cycles per drive */
+`define SPRAID_WAKE_COUNT		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 63)	/* Wake ups per drive, write clears */
+`define SPRAID_WAKE_STALL		(`WB_ADDR_BASE + `SPRAID_MEM_SZ + 67)	/* Wait cycles per drive, write clears */
+
+module wb_spraid #(
+		parameter RAID_PIPELINE = 0,	/* Read compute pipeline stages, 0-2 */
+		parameter DRIVE_PROBE = 0,		/* Read drive JEDEC IDs after reset */
+		parameter HOT_SPARE = 0			/* Spare drive on SPI4 */
+	)
+	(
 	input			wb_clk_i,
 	input  [31:0] 	wb_dat_i,
 	output [31:0]	wb_dat_o,
@@ -22,8 +93,7 @@ module wb_spraid (
 	/* Not used */
 //	input			wb_lock_i,
 	output			wb_rty_o,
-	/* Not used */
-//	input  [3:0]	wb_sel_i,
+	input  [3:0]	wb_sel_i,
 	input			wb_stb_i,
 	input			wb_we_i,
 
@@ -51,7 +121,14 @@ module wb_spraid (
 	output 			spi3_clk,
 	output 			spi3_cs,
 	output 			spi3_mosi,
-	input			spi3_miso
+	input			spi3_miso,
+
+	/* SPI4, hot spare. Held idle with HOT_SPARE = 0, MISO can be left
+	* unconnected */
+	output 			spi4_clk,
+	output 			spi4_cs,
+	output 			spi4_mosi,
+	input			spi4_miso
 
 );
 
@@ -60,11 +137,15 @@ module wb_spraid (
 	assign wb_err_o = 1'b0;
 
 	wire addr_in_bounds;
+	wire addr_window;
 	wire addr_status;
 	wire addr_raid_type;
-	assign addr_in_bounds = ((wb_adr_i - `WB_ADDR_BASE) < `SPRAID_MEM_SZ);
+	wire addr_stream_data;
+	assign addr_in_bounds = ((wb_adr_i - `WB_ADDR_BASE) < `SPRAID_MEM_WORDS);
+	assign addr_window = ( wb_adr_i <= `SPRAID_ADR_MAX );
 	assign addr_raid_type = ( wb_adr_i == `SPRAID_RAID_TYPE );
 	assign addr_status = ( wb_adr_i == `SPRAID_STATUS );
+	assign addr_stream_data = ( wb_adr_i == `SPRAID_STREAM_DATA );
 
 	reg [31:0] buf_data_o;
 	wire [31:0] w_data_o;
@@ -74,16 +155,127 @@ module wb_spraid (
 	wire write;
 	wire enable;
 
-	assign enable = (wb_cyc_i & wb_stb_i); 
+	/* Accesses that need held writes out first wait for the flush, and
+	* everything waits for the drives to be probed after reset */
+	wire bus_enable;
+	wire coalesce_wait;
+	assign bus_enable = (wb_cyc_i & wb_stb_i);
+	assign enable = bus_enable & ~coalesce_wait & ~spraid_probing;
 	assign read = enable & ~wb_we_i;
 	assign write = enable & wb_we_i;
 
 	wire spraid_busy;
+	wire spraid_probing;
 	wire spraid_parity;
 	wire spraid_err;
+	wire spraid_ecc_double;
+	wire [31:0] ecc_corrected;
+	wire [31:0] ecc_uncorrected;
+
+	/* Continuous reads */
+	reg  [15:0] xip_timeout;
+	wire [31:0] xip_reads;
+
+	/* Performance counters */
+	wire [31:0] perf_full_writes;
+	wire [31:0] perf_rmw_writes;
+	wire [31:0] perf_rcw_writes;
+	wire [31:0] perf_drive_ops;
+
+	/* Drive health */
+	wire [15:0] health_threshold;
+	wire [3:0]  degraded;
+	wire [63:0] health_ewma;
+	wire [63:0] health_max;
+	wire        addr_health_ewma;
+	wire        addr_health_max;
+	wire [1:0]  health_drive;
+	assign addr_health_ewma = (wb_adr_i >= `SPRAID_HEALTH_EWMA) && (wb_adr_i < `SPRAID_HEALTH_EWMA + 4);
+	assign addr_health_max = (wb_adr_i >= `SPRAID_HEALTH_MAX) && (wb_adr_i < `SPRAID_HEALTH_MAX + 4);
+	assign health_drive = ( addr_health_max ) ? (wb_adr_i - `SPRAID_HEALTH_MAX) : (wb_adr_i - `SPRAID_HEALTH_EWMA);
+
+	/* Drive power management. Drives are woken ahead of time when an access
+	* is coming: writes are held for a flush, an engine is running or
+	* being set up, or keep awake is set */
+	reg  [15:0]  pd_timeout;
+	reg          keep_awake;
+	reg  [63:0]  wake_time;
+	wire [3:0]   drive_asleep;
+	wire [127:0] wake_count;
+	wire [127:0] wake_stall;
+	wire         array_wake;
+	wire         addr_wake_time;
+	wire         addr_wake_count;
+	wire         addr_wake_stall;
+	wire [1:0]   power_drive;
+	assign addr_wake_time = (wb_adr_i >= `SPRAID_WAKE_TIME) && (wb_adr_i < `SPRAID_WAKE_TIME + 4);
+	assign addr_wake_count = (wb_adr_i >= `SPRAID_WAKE_COUNT) && (wb_adr_i < `SPRAID_WAKE_COUNT + 4);
+	assign addr_wake_stall = (wb_adr_i >= `SPRAID_WAKE_STALL) && (wb_adr_i < `SPRAID_WAKE_STALL + 4);
+	assign power_drive = ( addr_wake_stall ) ? (wb_adr_i - `SPRAID_WAKE_STALL) :
+		( addr_wake_count ) ? (wb_adr_i - `SPRAID_WAKE_COUNT) : (wb_adr_i - `SPRAID_WAKE_TIME);
+
+	/* Drive discovery. Each drive holds one byte of every word at the word
+	* offset, so the smallest drive sets how much of the window is usable.
+	* Larger parts are capped at the window, SPRAID_MEM_WORDS: a word offset
+	* can't go past it, so GEOMETRY and CAPACITY report the window for any
+	* part of 2KB or more. Without DRIVE_PROBE every drive keeps the
+	* flash_ctl defaults, which are a 2KB part */
+	wire [95:0] drive_id;
+	wire [19:0] drive_density;
+	wire [11:0] drive_addr_bytes;
+	wire        addr_drive_id;
+	wire        addr_drive_caps;
+	wire [1:0]  info_drive;
+	reg  [4:0]  min_density;
+	reg  [2:0]  word_bytes;
+	wire [15:0] usable_words;
+	assign addr_drive_id = (wb_adr_i >= `SPRAID_DRIVE_ID) && (wb_adr_i < `SPRAID_DRIVE_ID + 4);
+	assign addr_drive_caps = (wb_adr_i >= `SPRAID_DRIVE_CAPS) && (wb_adr_i < `SPRAID_DRIVE_CAPS + 4);
+	assign info_drive = ( addr_drive_caps ) ? (wb_adr_i - `SPRAID_DRIVE_CAPS) : (wb_adr_i - `SPRAID_DRIVE_ID);
+	assign usable_words = ( (min_density >= 16) || ((32'b1 << min_density) > `SPRAID_MEM_WORDS) ) ?
+		`SPRAID_MEM_WORDS : (16'b1 << min_density);
+
+	integer d;
+	always @(*) begin
+		min_density = drive_density[4:0];
+		for( d = 1; d < 4; d = d + 1 ) begin
+			if( drive_density[5*d +: 5] < min_density ) begin
+				min_density = drive_density[5*d +: 5];
+			end
+		end
+
+		word_bytes = data_bytes( raid_type[3:0] );
+	end
+
+	/* Data bytes in each word of a layout */
+	function [2:0] data_bytes;
+		input [3:0] rtype;
+		begin
+			case( rtype )
+				4'd1:		data_bytes = 4;		/* RAID0 */
+				4'd5:		data_bytes = 3;		/* RAID5 */
+				4'd10:		data_bytes = 2;		/* RAID10 */
+				4'd6:		data_bytes = 3;		/* ECC */
+				default:	data_bytes = 1;		/* RAID1 */
+			endcase
+		end
+	endfunction
+
+	/* Stream port, offload engine, migration and write flushes, only one
+	* owns the array at a time. Migration gives the array back to the host
+	* between words */
+	wire stream_active;
+	wire offload_active;
+	wire migrate_active;
+	wire migrate_owner;
+	wire coalesce_active;
+	wire rebuild_active;
+	wire rebuild_owner;
+	wire engine_active;
+	assign engine_active = stream_active | offload_active | migrate_owner | coalesce_active | rebuild_owner;
 
-	/* Busy signal dictates bus stall */
-	assign wb_stall_o = spraid_busy;
+	/* Busy signal dictates bus stall, window waits for a running engine */
+	assign wb_stall_o = spraid_busy | (engine_active & addr_window) | coalesce_wait | spraid_probing;
 
 	/* ACK generation */
 	reg last_cycle_busy;
@@ -93,7 +285,9 @@ module wb_spraid (
 	wire ack;
 
 	assign wb_ack_o = buf_wb_ack_o;
-	assign ack = (last_cycle_busy & ~spraid_busy);
+	/* Only window accesses complete on array busy, the stream port and
+	* offload engine also run the array in the background */
+	assign ack = (last_cycle_busy & ~spraid_busy) & addr_window & ~engine_active;
 
 
 
@@ -101,25 +295,338 @@ module wb_spraid (
 	reg [7:0] raid_type;
 
 	/* Status registers */
-	reg [7:0] status;
+	reg [10:0] status;
 
+	wire coalesce_take;
 	wire spraid_write;
 	wire spraid_read;
-	assign spraid_write = write && (wb_adr_i <= `SPRAID_ADR_MAX );
-	assign spraid_read = read && (wb_adr_i <= `SPRAID_ADR_MAX );
+	assign spraid_write = write && addr_window && !engine_active && !coalesce_take;
+	assign spraid_read = read && addr_window && !engine_active;
+
+	/* Stream port connections */
+	reg			stream_access_done;
+	wire		stream_done;
+	wire [31:0]	stream_dout;
+	wire [31:0]	stream_addr;
+	wire [15:0]	stream_left;
+	wire		stream_read;
+	wire		stream_write;
+	wire [31:0]	stream_sp_addr;
+	wire [31:0]	stream_sp_din;
+
+	stream_port stream(
+		.reset(wb_rst_i),
+		.clk(wb_clk_i),
+
+		.set_addr( write && (wb_adr_i == `SPRAID_STREAM_ADDR) ),
+		.set_len( write && (wb_adr_i == `SPRAID_STREAM_LEN) && !offload_active && !migrate_active && !rebuild_active ),
+		.reg_din( wb_dat_i ),
+		.stream_addr( stream_addr ),
+		.stream_left( stream_left ),
+		.active( stream_active ),
+
+		.host_wr_req( write && addr_stream_data && !stream_access_done ),
+		.host_rd_req( read && addr_stream_data && !stream_access_done ),
+		.host_din( wb_dat_i ),
+		.host_dout( stream_dout ),
+		.host_done( stream_done ),
+
+		.sp_read( stream_read ),
+		.sp_write( stream_write ),
+		.sp_addr( stream_sp_addr ),
+		.sp_din( stream_sp_din ),
+		.sp_dout( w_data_o ),
+		.sp_busy( spraid_busy )
+	);
+
+	/* Offload engine connections */
+	wire [31:0]	offload_addr;
+	wire [15:0]	offload_left;
+	wire [31:0]	offload_value;
+	wire [1:0]	offload_cmd;
+	wire [31:0]	offload_result;
+	wire [31:0]	offload_mismatch_addr;
+	wire		offload_mismatch;
+	wire		offload_read;
+	wire		offload_write;
+	wire [31:0]	offload_sp_addr;
+	wire [31:0]	offload_sp_din;
+	wire [2:0]	array_bytes;
+
+	offload offload(
+		.reset(wb_rst_i),
+		.clk(wb_clk_i),
+
+		.set_addr( write && (wb_adr_i == `SPRAID_OFFLOAD_ADDR) ),
+		.set_len( write && (wb_adr_i == `SPRAID_OFFLOAD_LEN) ),
+		.set_value( write && (wb_adr_i == `SPRAID_OFFLOAD_VALUE) ),
+		.set_cmd( write && (wb_adr_i == `SPRAID_OFFLOAD_CMD) && !stream_active && !migrate_active && !rebuild_active ),
+		.reg_din( wb_dat_i ),
+		.off_addr( offload_addr ),
+		.off_left( offload_left ),
+		.value( offload_value ),
+		.cmd( offload_cmd ),
+		.active( offload_active ),
+
+		.word_bytes( array_bytes ),
+
+		.result( offload_result ),
+		.mismatch_addr( offload_mismatch_addr ),
+		.mismatch( offload_mismatch ),
 
-	spraid spraid(
+		.sp_read( offload_read ),
+		.sp_write( offload_write ),
+		.sp_addr( offload_sp_addr ),
+		.sp_din( offload_sp_din ),
+		.sp_dout( w_data_o ),
+		.sp_busy( spraid_busy )
+	);
+
+	/* Migration engine connections */
+	wire [3:0]	migrate_target;
+	wire [15:0]	migrate_len;
+	wire [15:0]	migrate_throttle;
+	wire [15:0]	migrate_mark;
+	wire		migrate_new_layout;
+	wire		migrate_done;
+	wire		migrate_read;
+	wire		migrate_write;
+	wire [31:0]	migrate_sp_addr;
+	wire [31:0]	migrate_sp_din;
+
+	/* A migration that stopped short of the end of the window leaves the
+	* array split at the mark, the new layout below it and RAID_TYPE above.
+	* It stays that way until RAID_TYPE is written, and no new migration can
+	* start from a split array */
+	reg			migrate_split;
+
+	migrate #(
+		.MEM_WORDS( `SPRAID_MEM_WORDS )
+	) migrate (
+		.reset(wb_rst_i),
+		.clk(wb_clk_i),
+
+		.set_target( write && (wb_adr_i == `SPRAID_MIGRATE_TARGET) && !stream_active && !offload_active && !rebuild_active && !migrate_split ),
+		.set_len( write && (wb_adr_i == `SPRAID_MIGRATE_LEN) ),
+		.set_throttle( write && (wb_adr_i == `SPRAID_MIGRATE_THROTTLE) ),
+		.reg_din( wb_dat_i ),
+		.target( migrate_target ),
+		.mig_len( migrate_len ),
+		.throttle( migrate_throttle ),
+		.mark( migrate_mark ),
+		.active( migrate_active ),
+		.owner( migrate_owner ),
+		.new_layout( migrate_new_layout ),
+		.done( migrate_done ),
+
+		.host_pending( enable && addr_window ),
+
+		.sp_read( migrate_read ),
+		.sp_write( migrate_write ),
+		.sp_addr( migrate_sp_addr ),
+		.sp_din( migrate_sp_din ),
+		.sp_dout( w_data_o ),
+		.sp_busy( spraid_busy )
+	);
+
+	/* Write coalescing connections */
+	wire [15:0]	coalesce_window;
+	wire [31:0]	coalesce_writes;
+	wire [31:0]	coalesce_bursts;
+	wire		coalesce_pending;
+	wire		coalesce_write;
+	wire [31:0]	coalesce_sp_addr;
+	wire [31:0]	coalesce_sp_din;
+	wire [1:0]	coalesce_burst;
+	wire [95:0]	coalesce_din_burst;
+
+	coalesce coalesce(
+		.reset(wb_rst_i),
+		.clk(wb_clk_i),
+
+		.set_window( write && (wb_adr_i == `SPRAID_COALESCE_WINDOW) ),
+		.reg_din( wb_dat_i ),
+		.window( coalesce_window ),
+		.merged( coalesce_writes ),
+		.bursts( coalesce_bursts ),
+		.pending( coalesce_pending ),
+		.active( coalesce_active ),
+
+		.allow( !stream_active && !offload_active && !migrate_active && !rebuild_active ),
+		.host_pending( bus_enable && addr_window ),
+		.host_write( bus_enable && wb_we_i && addr_in_bounds ),
+		.host_full( wb_sel_i == 4'b1111 ),
+		.host_read( bus_enable && !wb_we_i && addr_window ),
+		.host_other( bus_enable && wb_we_i && !addr_in_bounds ),
+		.host_offset( wb_adr_i[15:0] ),
+		.host_din( wb_dat_i ),
+		.take( coalesce_take ),
+		.wait_flush( coalesce_wait ),
+
+		.sp_write( coalesce_write ),
+		.sp_addr( coalesce_sp_addr ),
+		.sp_din( coalesce_sp_din ),
+		.sp_burst( coalesce_burst ),
+		.sp_din_burst( coalesce_din_burst ),
+		.sp_busy( spraid_busy )
+	);
+
+	/* Hot spare connections */
+	wire		rebuild_armed;
+	wire [15:0]	rebuild_throttle;
+	wire [15:0]	rebuild_mark;
+	wire		spare_in;
+	wire [1:0]	spare_slot;
+	wire		spare_promote;
+	wire		rebuild_done;
+	wire		rebuild_read;
+	wire		rebuild_write;
+	wire [31:0]	rebuild_sp_addr;
+	wire [31:0]	rebuild_sp_din;
+	wire		raid_redundant;
+	assign raid_redundant = (raid_type[3:0] == 4'd0) || (raid_type[3:0] == 4'd5) ||
+		(raid_type[3:0] == 4'd10);	/* RAID1, RAID5, RAID10 */
+
+	/* Without the spare port there is nothing to rebuild onto, the engine
+	* is left out and its registers read as zero */
+	generate
+		if( HOT_SPARE ) begin : spare
+			rebuild rebuild (
+				.reset(wb_rst_i),
+				.clk(wb_clk_i),
+
+				.set_ctrl( write && (wb_adr_i == `SPRAID_SPARE_CTRL) ),
+				.reg_din( wb_dat_i ),
+				.armed( rebuild_armed ),
+				.throttle( rebuild_throttle ),
+				.mark( rebuild_mark ),
+				.active( rebuild_active ),
+				.owner( rebuild_owner ),
+				.in_use( spare_in ),
+				.slot( spare_slot ),
+				.promote( spare_promote ),
+				.done( rebuild_done ),
+
+				.degraded( degraded ),
+				.redundant( raid_redundant ),
+				.allow( !stream_active && !offload_active && !migrate_active &&
+					!coalesce_active && !coalesce_pending ),
+				.rb_len( usable_words ),
+
+				.host_pending( enable && addr_window ),
+
+				.sp_read( rebuild_read ),
+				.sp_write( rebuild_write ),
+				.sp_addr( rebuild_sp_addr ),
+				.sp_din( rebuild_sp_din ),
+				.sp_dout( w_data_o ),
+				.sp_busy( spraid_busy )
+			);
+		end
+		else begin : no_spare
+			assign rebuild_armed = 1'b0;
+			assign rebuild_throttle = 16'b0;
+			assign rebuild_mark = 16'b0;
+			assign rebuild_active = 1'b0;
+			assign rebuild_owner = 1'b0;
+			assign spare_in = 1'b0;
+			assign spare_slot = 2'b0;
+			assign spare_promote = 1'b0;
+			assign rebuild_done = 1'b0;
+			assign rebuild_read = 1'b0;
+			assign rebuild_write = 1'b0;
+			assign rebuild_sp_addr = 32'b0;
+			assign rebuild_sp_din = 32'b0;
+		end
+	endgenerate
+
+	assign array_wake = keep_awake | coalesce_pending | stream_active | offload_active |
+		migrate_active | rebuild_active |
+		( write && ( (wb_adr_i == `SPRAID_STREAM_ADDR) || (wb_adr_i == `SPRAID_OFFLOAD_ADDR) ) );
+
+	/* Array access from whichever engine is running */
+	wire		engine_read;
+	wire		engine_write;
+	wire [31:0]	engine_addr;
+	wire [31:0]	engine_din;
+	assign engine_read = stream_read | offload_read | migrate_read | rebuild_read;
+	assign engine_write = stream_write | offload_write | migrate_write | coalesce_write | rebuild_write;
+	assign engine_addr = coalesce_active ? coalesce_sp_addr :
+		rebuild_owner ? rebuild_sp_addr :
+		migrate_owner ? migrate_sp_addr :
+		stream_active ? stream_sp_addr : offload_sp_addr;
+	assign engine_din = coalesce_active ? coalesce_sp_din :
+		rebuild_owner ? rebuild_sp_din :
+		migrate_owner ? migrate_sp_din :
+		stream_active ? stream_sp_din : offload_sp_din;
+
+	/* Layout for the current array access. While migrating, or split after
+	* a partial migration, offsets below the high water mark are already in
+	* the new layout */
+	wire [31:0]	array_addr;
+	wire [3:0]	array_type;
+	assign array_addr = engine_active ? engine_addr : wb_adr_i;
+	assign array_type = ( (migrate_active || migrate_split) &&
+		( ({ 5'b0, array_addr[10:0] } < migrate_mark) || (migrate_owner && migrate_new_layout) ) ) ?
+		migrate_target : raid_type[3:0];
+
+	/* Width of the word being worked on, below the mark of a split array
+	* it is that of the new layout */
+	assign array_bytes = data_bytes( array_type );
+
+	spraid #(
+		.RAID_PIPELINE( RAID_PIPELINE ),
+		.DRIVE_PROBE( DRIVE_PROBE ),
+		.HOT_SPARE( HOT_SPARE )
+	) spraid(
 		.reset(wb_rst_i),
 		.clk(wb_clk_i),
-		.raid_type( raid_type[3:0] ),
-		.read( spraid_read ),
-		.write( spraid_write ),
-		.addr( wb_adr_i ),
+		.raid_type( array_type ),
+		.read( engine_active ? engine_read : spraid_read ),
+		.write( engine_active ? engine_write : spraid_write ),
+		.addr( array_addr ),
 		.dout( w_data_o ),
-		.din( wb_dat_i ),
+		.din( engine_active ? engine_din : wb_dat_i ),
+		.sel( engine_active ? 4'b1111 : wb_sel_i ),
+		.burst( coalesce_active ? coalesce_burst : 2'b0 ),
+		.din_burst( coalesce_active ? coalesce_din_burst : 96'b0 ),
 		.busy( spraid_busy ),
 		.parity( spraid_parity ),
 		.err( spraid_err ),
+		.ecc_double( spraid_ecc_double ),
+		.ecc_corrected( ecc_corrected ),
+		.ecc_uncorrected( ecc_uncorrected ),
+		.xip_reads( xip_reads ),
+		.xip_timeout( xip_timeout ),
+		.pd_timeout( pd_timeout ),
+		.wake_time( wake_time ),
+		.wake( array_wake ),
+		.wake_clear( (write && (addr_wake_count || addr_wake_stall)) ? (4'b0001 << power_drive) : 4'b0000 ),
+		.asleep( drive_asleep ),
+		.wake_count( wake_count ),
+		.wake_stall( wake_stall ),
+		.probing( spraid_probing ),
+		.drive_id( drive_id ),
+		.drive_density( drive_density ),
+		.drive_addr_bytes( drive_addr_bytes ),
+		.spare_in( spare_in ),
+		.spare_slot( spare_slot ),
+
+		.perf_full_writes( perf_full_writes ),
+		.perf_rmw_writes( perf_rmw_writes ),
+		.perf_rcw_writes( perf_rcw_writes ),
+		.perf_drive_ops( perf_drive_ops ),
+
+		.health_set_threshold( write && (wb_adr_i == `SPRAID_HEALTH_THRESHOLD) ),
+		.health_set_degraded( write && (wb_adr_i == `SPRAID_HEALTH_DEGRADED) ),
+		.health_clear_max( (write && addr_health_max) ? (4'b0001 << health_drive) : 4'b0000 ),
+		.health_din( wb_dat_i ),
+		.health_threshold( health_threshold ),
+		.degraded( degraded ),
+		.health_ewma( health_ewma ),
+		.health_max( health_max ),
+		.health_clear_drive( (spare_promote) ? (4'b0001 << spare_slot) : 4'b0000 ),
+		.health_clear_degraded( rebuild_done ),
 
 		.spi0_clk(spi0_clk),
 		.spi0_cs(spi0_cs),
@@ -139,7 +646,12 @@ module wb_spraid (
 		.spi3_clk(spi3_clk),
 		.spi3_cs(spi3_cs),
 		.spi3_mosi(spi3_mosi),
-		.spi3_miso(spi3_miso)
+		.spi3_miso(spi3_miso),
+
+		.spi4_clk(spi4_clk),
+		.spi4_cs(spi4_cs),
+		.spi4_mosi(spi4_mosi),
+		.spi4_miso(spi4_miso)
 
 
 	);
@@ -150,11 +662,17 @@ module wb_spraid (
 			last_cycle_busy <= 1;
 			reg_access_ack <= 0;
 			raid_type <= 1; /* RAID0 as default. should change this... */
+			migrate_split <= 0;
 			status <= 0;
 			buf_data_o <= 0;
+			xip_timeout <= 0;
+			pd_timeout <= 0;
+			keep_awake <= 0;
+			wake_time <= { 4{ 16'd256 } };
 
 			buf_wb_ack_o <= 0;
 			last_wb_ack_o <= 0;
+			stream_access_done <= 0;
 
 		end
 		else begin
@@ -175,8 +693,32 @@ module wb_spraid (
 				buf_wb_ack_o <= 0;
 			end
 
-			/* Fill status register */
-			status <= { spraid_parity, spraid_err, spraid_busy };
+			/* Fill status register
+			* bit 0: busy, bit 1: err, bit 2: parity, bit 3: stream running,
+			* bit 4: offload running, bit 5: offload compare mismatch,
+			* bit 6: migration running, bit 7: ECC double bit error,
+			* bit 8: drive degraded, bit 9: coalesced writes held,
+			* bit 10: rebuild running */
+			status <= { rebuild_active, coalesce_pending, (degraded != 0), spraid_ecc_double, migrate_active, offload_mismatch, offload_active, stream_active, spraid_parity, spraid_err, spraid_busy };
+
+			/* Only a migration that covered the whole window changes the
+			* layout, anything shorter leaves the array split at the mark */
+			if( migrate_done ) begin
+				if( migrate_mark >= `SPRAID_MEM_WORDS ) begin
+					raid_type <= { 4'b0, migrate_target };
+				end
+				else begin
+					migrate_split <= (migrate_mark != 0);
+				end
+			end
+
+			/* One data register transfer per bus access */
+			if( !enable ) begin
+				stream_access_done <= 1'b0;
+			end
+			else if( stream_done ) begin
+				stream_access_done <= 1'b1;
+			end
 
 			/* Operations depending upon address */
 			if( addr_in_bounds ) begin
@@ -184,7 +726,11 @@ module wb_spraid (
 					buf_data_o <= w_data_o;
 				end
 
-				/* Writes are handled without issue; just data in */
+				/* Writes are handled without issue; just data in. Merged
+				* writes are done once taken */
+				if( coalesce_take ) begin
+					reg_access_ack <= 1'b1;
+				end
 
 			end
 			else if( wb_adr_i == `SPRAID_RAID_TYPE) begin
@@ -194,7 +740,11 @@ module wb_spraid (
 				end
 				if( write ) begin
 					reg_access_ack <= 1'b1;
-					raid_type <= wb_dat_i[7:0];
+					/* Layout is owned by migration or rebuild while they run */
+					if( !migrate_active && !rebuild_active ) begin
+						raid_type <= wb_dat_i[7:0];
+						migrate_split <= 1'b0;
+					end
 				end
 
 			end
@@ -202,13 +752,361 @@ module wb_spraid (
 			else if( wb_adr_i == `SPRAID_STATUS) begin
 				if( read ) begin
 					reg_access_ack <= 1'b1;
-					buf_data_o <= { 24'b0, status};
+					buf_data_o <= { 21'b0, status};
 				end
 
 				/* Can't write to status */
 
 			end
 
+			else if( wb_adr_i == `SPRAID_STREAM_ADDR ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= stream_addr;
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_STREAM_LEN ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, stream_left };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( addr_stream_data ) begin
+				/* Acked once the stream port has taken or given a word */
+				if( stream_done ) begin
+					reg_access_ack <= 1'b1;
+					if( read ) begin
+						buf_data_o <= stream_dout;
+					end
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_OFFLOAD_ADDR ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= offload_addr;
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_OFFLOAD_LEN ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, offload_left };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_OFFLOAD_VALUE ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= offload_value;
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_OFFLOAD_CMD ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { offload_active, 29'b0, offload_cmd };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_OFFLOAD_RESULT ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= offload_result;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_OFFLOAD_MISMATCH ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= offload_mismatch_addr;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_PERF_FULL_WR ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= perf_full_writes;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_PERF_RMW_WR ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= perf_rmw_writes;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_PERF_RCW_WR ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= perf_rcw_writes;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_PERF_DRIVE_OPS ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= perf_drive_ops;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_MIGRATE_TARGET ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { migrate_active, migrate_split, 26'b0, migrate_target };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_MIGRATE_LEN ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, migrate_len };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_MIGRATE_THROTTLE ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, migrate_throttle };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_MIGRATE_MARK ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, migrate_mark };
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_ECC_CORRECTED ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= ecc_corrected;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_ECC_UNCORRECTED ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= ecc_uncorrected;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_HEALTH_THRESHOLD ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, health_threshold };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_HEALTH_DEGRADED ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 28'b0, degraded };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( addr_health_ewma ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, health_ewma[16*health_drive +: 16] };
+				end
+			end
+
+			else if( addr_health_max ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, health_max[16*health_drive +: 16] };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_COALESCE_WINDOW ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, coalesce_window };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_COALESCE_WRITES ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= coalesce_writes;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_COALESCE_BURSTS ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= coalesce_bursts;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_XIP_TIMEOUT ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, xip_timeout };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+					xip_timeout <= wb_dat_i[15:0];
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_XIP_READS ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= xip_reads;
+				end
+			end
+
+			else if( addr_drive_id ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 8'b0, drive_id[24*info_drive +: 24] };
+				end
+			end
+
+			else if( addr_drive_caps ) begin
+				/* bits 4:0 size as log2 bytes, bits 10:8 address bytes,
+				* bits 31:24 read command. Plain reads with continuous
+				* streams are the fastest there is at this clock, fast
+				* read only adds a dummy byte */
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 8'h03, 13'b0, drive_addr_bytes[3*info_drive +: 3],
+						3'b0, drive_density[5*info_drive +: 5] };
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_GEOMETRY ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 8'b0, min_density, word_bytes, usable_words };
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_CAPACITY ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= usable_words * word_bytes;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_SPARE_CTRL ) begin
+				/* bit 0 armed, bits 31:16 idle cycles between rebuilt words */
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { rebuild_throttle, 15'b0, rebuild_armed };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_SPARE_STATUS ) begin
+				/* bit 0 armed, bit 1 rebuilding, bit 2 spare in a slot,
+				* bits 5:4 that slot, bit 8 spare port fitted */
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 23'b0, (HOT_SPARE != 0), 2'b0, spare_slot, 1'b0,
+						spare_in, rebuild_active, rebuild_armed };
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_REBUILD_MARK ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, rebuild_mark };
+				end
+			end
+
+			else if( wb_adr_i == `SPRAID_POWER_CTRL ) begin
+				/* bits 15:0 idle cycles before power-down, 0 is off, bit 16
+				* keep drives awake, bits 23:20 drives asleep, read only */
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 8'b0, drive_asleep, 3'b0, keep_awake, pd_timeout };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+					pd_timeout <= wb_dat_i[15:0];
+					keep_awake <= wb_dat_i[16];
+				end
+			end
+
+			else if( addr_wake_time ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= { 16'b0, wake_time[16*power_drive +: 16] };
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+					wake_time[16*power_drive +: 16] <= wb_dat_i[15:0];
+				end
+			end
+
+			else if( addr_wake_count ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= wake_count[32*power_drive +: 32];
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
+			else if( addr_wake_stall ) begin
+				if( read ) begin
+					reg_access_ack <= 1'b1;
+					buf_data_o <= wake_stall[32*power_drive +: 32];
+				end
+				if( write ) begin
+					reg_access_ack <= 1'b1;
+				end
+			end
+
 		end
 
 	end
@@ -0,0 +1,158 @@
+/* SPI RAID Controller, multiple Wishbone ports */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* wb_spraid behind a wb_arbiter, so several bus masters can share the array
+* without a software lock. Port n uses bits [n*width +: width] of each bus.
+* Register and window addresses are the same as wb_spraid, latency counters
+* for each port start at SPRAID_ARB_STAT. */
+
+module wb_spraid_mp #(
+		parameter NPORTS = 2,
+		parameter ARB_MODE = `ARB_ROUND_ROBIN,
+		parameter RAID_PIPELINE = 0
+	)
+	(
+	input							wb_clk_i,
+	input							wb_rst_i,
+
+	/* Wishbone ports */
+	input  [NPORTS-1:0]				wb_cyc_i,
+	input  [NPORTS-1:0]				wb_stb_i,
+	input  [NPORTS-1:0]				wb_we_i,
+	input  [32*NPORTS-1:0]			wb_adr_i,
+	input  [32*NPORTS-1:0]			wb_dat_i,
+	input  [4*NPORTS-1:0]			wb_sel_i,
+	output [32*NPORTS-1:0]			wb_dat_o,
+	output [NPORTS-1:0]				wb_ack_o,
+	output [NPORTS-1:0]				wb_stall_o,
+	output [NPORTS-1:0]				wb_err_o,
+	output [NPORTS-1:0]				wb_rty_o,
+
+	/* SPI interface connections */
+
+	/* SPI0 */
+	output 			spi0_clk,
+	output 			spi0_cs,
+	output 			spi0_mosi,
+	input  			spi0_miso,
+
+	/* SPI1 */
+	output 			spi1_clk,
+	output 			spi1_cs,
+	output 			spi1_mosi,
+	input			spi1_miso,
+
+	/* SPI2 */
+	output 			spi2_clk,
+	output 			spi2_cs,
+	output 			spi2_mosi,
+	input			spi2_miso,
+
+	/* SPI3 */
+	output 			spi3_clk,
+	output 			spi3_cs,
+	output 			spi3_mosi,
+	input			spi3_miso
+
+);
+
+	/* not used */
+	assign wb_rty_o = 0;
+	assign wb_err_o = 0;
+
+	/* The register map only has room for the arbiter counters of
+	* SPRAID_ARB_PORTS ports, more would be answered in place of the health,
+	* coalescing and continuous read registers after them. Instantiating a
+	* module that doesn't exist stops elaboration of such a build */
+	generate
+		if( NPORTS > `SPRAID_ARB_PORTS ) begin : nports_check
+			wb_spraid_mp_nports_above_register_map too_many_ports();
+		end
+	endgenerate
+
+	/* Arbiter to controller */
+	wire		m_cyc;
+	wire		m_stb;
+	wire		m_we;
+	wire [31:0]	m_adr;
+	wire [31:0]	m_dat_o;
+	wire [3:0]	m_sel;
+	wire [31:0]	m_dat_i;
+	wire		m_ack;
+	wire		m_stall;
+
+	wb_arbiter #(
+		.NPORTS( NPORTS ),
+		.ARB_MODE( ARB_MODE ),
+		.STAT_BASE( `SPRAID_ARB_STAT )
+	) arbiter (
+		.clk( wb_clk_i ),
+		.reset( wb_rst_i ),
+
+		.s_cyc_i( wb_cyc_i ),
+		.s_stb_i( wb_stb_i ),
+		.s_we_i( wb_we_i ),
+		.s_adr_i( wb_adr_i ),
+		.s_dat_i( wb_dat_i ),
+		.s_sel_i( wb_sel_i ),
+		.s_dat_o( wb_dat_o ),
+		.s_ack_o( wb_ack_o ),
+		.s_stall_o( wb_stall_o ),
+
+		.m_cyc_o( m_cyc ),
+		.m_stb_o( m_stb ),
+		.m_we_o( m_we ),
+		.m_adr_o( m_adr ),
+		.m_dat_o( m_dat_o ),
+		.m_sel_o( m_sel ),
+		.m_dat_i( m_dat_i ),
+		.m_ack_i( m_ack ),
+		.m_stall_i( m_stall )
+	);
+
+	wb_spraid #(
+		.RAID_PIPELINE( RAID_PIPELINE ),
+		.HOT_SPARE( 0 )
+	) spraid (
+		.wb_clk_i( wb_clk_i ),
+		.wb_rst_i( wb_rst_i ),
+		.wb_cyc_i( m_cyc ),
+		.wb_stb_i( m_stb ),
+		.wb_we_i( m_we ),
+		.wb_adr_i( m_adr ),
+		.wb_dat_i( m_dat_o ),
+		.wb_sel_i( m_sel ),
+		.wb_dat_o( m_dat_i ),
+		.wb_ack_o( m_ack ),
+		.wb_stall_o( m_stall ),
+		.wb_err_o(),
+		.wb_rty_o(),
+
+		.spi0_clk(spi0_clk),
+		.spi0_cs(spi0_cs),
+		.spi0_mosi(spi0_mosi),
+		.spi0_miso(spi0_miso),
+
+		.spi1_clk(spi1_clk),
+		.spi1_cs(spi1_cs),
+		.spi1_mosi(spi1_mosi),
+		.spi1_miso(spi1_miso),
+
+		.spi2_clk(spi2_clk),
+		.spi2_cs(spi2_cs),
+		.spi2_mosi(spi2_mosi),
+		.spi2_miso(spi2_miso),
+
+		.spi3_clk(spi3_clk),
+		.spi3_cs(spi3_cs),
+		.spi3_mosi(spi3_mosi),
+		.spi3_miso(spi3_miso),
+
+		.spi4_clk(),
+		.spi4_cs(),
+		.spi4_mosi(),
+		.spi4_miso(1'b0)
+	);
+
+endmodule
@@ -0,0 +1,7 @@
+module dump();
+	initial begin
+		$dumpfile("bench_top.vcd");
+		$dumpvars(0, bench_top);
+		#1;
+	end
+endmodule
@@ -0,0 +1,7 @@
+module dump();
+	initial begin
+		$dumpfile("wb_spraid_2port.vcd");
+		$dumpvars(0, wb_spraid_2port);
+		#1;
+	end
+endmodule
@@ -0,0 +1,216 @@
+""" Reference model of the layouts in raid.v, over whole arrays of words
+
+Every layout keeps word n at address n on each drive, with byte d of the
+striped word on drive d, so the drive images are columns of one (n, 4) array
+of bytes. Everything here works on NumPy arrays, so a full array of drives is
+built or checked in one go instead of a word at a time.
+"""
+
+import numpy as np
+
+# RAID types, as in raid.v
+RAID1 = 0
+RAID0 = 1
+RAID5 = 5
+ECC = 6
+RAID10 = 10
+
+NDRIVES = 4
+
+# Data bits the host sees for each type
+DATA_MASK = {
+    RAID0: 0xFFFFFFFF,
+    RAID1: 0x000000FF,
+    RAID5: 0x00FFFFFF,
+    ECC: 0x00FFFFFF,
+    RAID10: 0x0000FFFF,
+}
+
+# Byte lanes each type stores, a write selecting none of them isn't done
+HELD_LANES = {
+    RAID0: 0xF,
+    RAID1: 0x1,
+    RAID5: 0x7,
+    ECC: 0x7,
+    RAID10: 0x3,
+}
+
+
+# SECDED code used by TYPE_ECC. Hamming positions 1-29 with check bits at the
+# powers of two and the 24 data bits in the rest, overall parity in bit 0
+_ECC_DATA_POS = [ pos for pos in range(1, 30) if pos & (pos - 1) ]
+_ECC_CHECK_MASK = [ sum( 1 << pos for pos in range(1, 30) if (pos >> p) & 1 ) for p in range(5) ]
+_POPCOUNT = np.array([ bin(i).count("1") for i in range(256) ], dtype=np.uint8)
+
+
+def _parity(words):
+    # Parity of each 32 bit word
+    count = _POPCOUNT[np.ascontiguousarray(words, dtype=np.uint32).view(np.uint8)].reshape(-1, 4).sum(axis=1)
+    return (count & 1).astype(np.uint32)
+
+
+def ecc_encode(data):
+    """ Codewords for an array of 24 bit data words """
+    data = np.asarray(data, dtype=np.uint32)
+    code = np.zeros(data.shape, dtype=np.uint32)
+    for j, pos in enumerate(_ECC_DATA_POS):
+        code |= ((data >> j) & 1) << pos
+    for p in range(5):
+        code |= _parity(code & _ECC_CHECK_MASK[p]).reshape(data.shape) << (1 << p)
+    code |= _parity(code).reshape(data.shape)
+    return code
+
+
+def ecc_decode(code):
+    """ Data, and single and double error flags, for an array of codewords """
+    code = np.asarray(code, dtype=np.uint32)
+    syndrome = np.zeros(code.shape, dtype=np.uint32)
+    for p in range(5):
+        syndrome |= _parity(code & _ECC_CHECK_MASK[p]).reshape(code.shape) << p
+    parity = _parity(code & 0x3FFFFFFF).reshape(code.shape)
+
+    single = (parity == 1) & (syndrome < 30)
+    double = ((parity == 0) & (syndrome != 0)) | ((parity == 1) & (syndrome >= 30))
+    fixed = np.where(single, code ^ (np.uint32(1) << np.minimum(syndrome, 31)), code)
+
+    data = np.zeros(code.shape, dtype=np.uint32)
+    for j, pos in enumerate(_ECC_DATA_POS):
+        data |= ((fixed >> pos) & 1) << j
+    return data, single, double
+
+
+def stripe(raid_type, words):
+    """ Bytes each drive holds for an array of host words
+
+    :return: uint8 array of shape (n, 4), column d is drive d
+    """
+    words = np.asarray(words, dtype=np.uint32).reshape(-1)
+    b = np.ascontiguousarray(words, dtype='<u4').view(np.uint8).reshape(-1, 4)
+
+    if( raid_type == RAID0 ):
+        return b.copy()
+    if( raid_type == RAID1 ):
+        return np.repeat(b[:, 0:1], NDRIVES, axis=1)
+    if( raid_type == RAID5 ):
+        return np.stack([ b[:, 0], b[:, 1], b[:, 2], b[:, 0] ^ b[:, 1] ^ b[:, 2] ], axis=1)
+    if( raid_type == RAID10 ):
+        return np.stack([ b[:, 0], b[:, 0], b[:, 1], b[:, 1] ], axis=1)
+    if( raid_type == ECC ):
+        return stripe(RAID0, ecc_encode(words & 0x00FFFFFF))
+    raise ValueError('Unknown RAID type %d' % (raid_type))
+
+
+def unstripe(raid_type, drives):
+    """ What the host reads back from an (n, 4) array of drive bytes, with
+    all drives in use
+
+    :return: words, and a flag per word for a RAID1 mismatch, RAID5 parity
+        error or ECC double error
+    """
+    b = np.asarray(drives, dtype=np.uint8).reshape(-1, NDRIVES)
+    b32 = b.astype(np.uint32)
+    raw = b32[:, 0] | (b32[:, 1] << 8) | (b32[:, 2] << 16) | (b32[:, 3] << 24)
+
+    if( raid_type == RAID0 ):
+        return raw, np.zeros(len(b), dtype=bool)
+    if( raid_type == RAID1 ):
+        # Mismatched mirrors read as all ones
+        equal = np.all(b == b[:, 0:1], axis=1)
+        return np.where(equal, b32[:, 0], 0xFFFFFFFF).astype(np.uint32), ~equal
+    if( raid_type == RAID5 ):
+        err = (b[:, 0] ^ b[:, 1] ^ b[:, 2] ^ b[:, 3]) != 0
+        return raw & 0x00FFFFFF, err
+    if( raid_type == RAID10 ):
+        return b32[:, 0] | (b32[:, 2] << 8), (b[:, 0] != b[:, 1]) | (b[:, 2] != b[:, 3])
+    if( raid_type == ECC ):
+        data, single, double = ecc_decode(raw)
+        return data, double
+    raise ValueError('Unknown RAID type %d' % (raid_type))
+
+
+def sel_mask(sel):
+    """ Bit mask of the byte lanes in sel, zero is all of them """
+    sel = np.asarray(sel, dtype=np.uint32)
+    sel = np.where(sel == 0, 0xF, sel)
+    mask = np.zeros(sel.shape, dtype=np.uint32)
+    for lane in range(4):
+        mask |= np.where((sel >> lane) & 1, np.uint32(0xFF << (8 * lane)), np.uint32(0))
+    return mask
+
+
+def write_mask(raid_type, sel):
+    """ Bit mask of the host bits a write with lane select sel changes
+
+    As raid.v takes sel: the lanes selected out of those the type stores,
+    see HELD_LANES, and nothing with none of them selected.
+    """
+    if( raid_type not in HELD_LANES ):
+        raise ValueError('Unknown RAID type %d' % (raid_type))
+    held = np.asarray(sel, dtype=np.uint32) & HELD_LANES[raid_type]
+    return np.where(held == 0, np.uint32(0), sel_mask(held)).astype(np.uint32)
+
+
+class Scoreboard:
+    """ Expected contents of the array, checked in bulk against the drives
+
+    Writes are recorded as the host sees them, in order, and the drive
+    images are built from the final words in one go when checked. Words
+    that were never written aren't checked.
+    """
+
+    def __init__(self, raid_type, nwords):
+        self.raid_type = raid_type
+        self.nwords = nwords
+        self.words = np.zeros(nwords, dtype=np.uint32)
+        self.written = np.zeros(nwords, dtype=bool)
+
+    def write(self, offset, data, sel=0xF):
+        """ Host writes of data at offset onwards, one word each
+
+        offset, data and sel can each be a single value or an array. Lanes
+        the layout doesn't write, see write_mask(), keep the rest of the word.
+        """
+        offset = np.atleast_1d(np.asarray(offset, dtype=np.int64))
+        data = np.atleast_1d(np.asarray(data, dtype=np.uint32))
+        if( len(offset) == 1 ):
+            offset = offset + np.arange(len(data))
+        mask = np.broadcast_to(write_mask(self.raid_type, sel), data.shape)
+
+        # Later writes to the same offset win, so apply them in order when
+        # there are repeats
+        if( len(np.unique(offset)) != len(offset) ):
+            for o, d, m in zip(offset, data, mask):
+                self.words[o] = (self.words[o] & ~m) | (d & m)
+                self.written[o] |= (m != 0)
+            return
+        old = self.words[offset]
+        self.words[offset] = (old & ~mask) | (data & mask)
+        self.written[offset] |= (mask != 0)
+
+    def expected(self):
+        """ Words the host should read back, and the offsets written """
+        offsets = np.flatnonzero(self.written)
+        return self.words[offsets] & DATA_MASK[self.raid_type], offsets
+
+    def images(self):
+        """ Expected bytes per drive, shape (n, 4) for the offsets written """
+        words, offsets = self.expected()
+        return stripe(self.raid_type, words), offsets
+
+    def check(self, drives, skip=0):
+        """ Compare against the drive models' memories
+
+        :param drives: models with dump(), or byte buffers, one per drive
+        :param skip: mask of drives to leave out, like degraded ones
+        :return: list of (drive, offset, expected, actual) for every mismatch
+        """
+        expected, offsets = self.images()
+        mismatches = []
+        for d in range(NDRIVES):
+            if( (skip >> d) & 1 ):
+                continue
+            image = drives[d].dump(0, self.nwords) if hasattr(drives[d], 'dump') else drives[d]
+            actual = np.frombuffer(bytes(image[:self.nwords]), dtype=np.uint8)[offsets]
+            for i in np.flatnonzero(actual != expected[:, d]):
+                mismatches.append( (d, int(offsets[i]), int(expected[i, d]), int(actual[i])) )
+        return mismatches
@@ -0,0 +1,120 @@
+""" Runs the simulation targets in the Makefile side by side
+
+Every target gets its own build directory under sim_build, where it compiles,
+runs and leaves its waves and results.xml, so nothing is shared between them
+and they can all go at once. Each runs as its own make, iverilog and vvp
+processes, the threads here only wait on them. The per target results are
+merged into sim_build/regress.xml, with a summary of how long each took.
+
+    python -m test.regress -j 4 test_raid test_wb_spraid
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+BUILD_ROOT = 'sim_build'
+
+
+class Result:
+    """ Outcome of one target """
+
+    def __init__(self, target):
+        self.target = target
+        self.returncode = None
+        self.seconds = 0.0
+        self.suites = []
+        self.tests = 0
+        self.failures = 0
+
+    @property
+    def status(self):
+        if( self.returncode != 0 ):
+            return 'ERROR'
+        if( not self.suites ):
+            return 'NORESULT'
+        if( self.failures ):
+            return 'FAIL'
+        return 'PASS'
+
+
+def run_target(target, make='make'):
+    """ Build and run one Makefile target in sim_build/<target> """
+    result = Result(target)
+    build = os.path.join(BUILD_ROOT, target)
+    log = os.path.join(BUILD_ROOT, target + '.log')
+    cmd = [ make, '--no-print-directory', 'SIM_BUILD=' + build, 'SIM_RUN=' + build, target ]
+
+    start = time.monotonic()
+    with open(log, 'w') as f:
+        result.returncode = subprocess.call(cmd, stdout=f, stderr=subprocess.STDOUT)
+    result.seconds = time.monotonic() - start
+
+    # cocotb writes results.xml where the simulation ran
+    xml = os.path.join(build, 'results.xml')
+    if( os.path.exists(xml) ):
+        try:
+            root = ET.parse(xml).getroot()
+        except ET.ParseError:
+            return result
+        for suite in root.iter('testsuite'):
+            suite.set('name', target)
+            result.suites.append(suite)
+        for case in root.iter('testcase'):
+            result.tests += 1
+            if( case.find('failure') is not None or case.find('error') is not None ):
+                result.failures += 1
+    return result
+
+
+def merge(results, path):
+    """ One JUnit report for every target """
+    root = ET.Element('testsuites', name='regress')
+    for result in results:
+        if( result.suites ):
+            root.extend(result.suites)
+        else:
+            # Didn't build or didn't finish, show it as an error in its place
+            suite = ET.SubElement(root, 'testsuite', name=result.target)
+            case = ET.SubElement(suite, 'testcase', classname=result.target, name=result.target,
+                                 time='%.3f' % (result.seconds))
+            ET.SubElement(case, 'error', message='make exited with %d, see %s.log' % (result.returncode, result.target))
+    ET.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def report(results, wall):
+    width = max([ len(r.target) for r in results ] + [ 6 ])
+    print('%-*s %-8s %5s %5s %8s' % (width, 'target', 'status', 'tests', 'fail', 'seconds'))
+    for r in results:
+        print('%-*s %-8s %5d %5d %8.1f' % (width, r.target, r.status, r.tests, r.failures, r.seconds))
+    serial = sum(r.seconds for r in results)
+    print('%d targets, %d tests, %d failed, %.1fs wall, %.1fs serial, %.2fx' % (
+        len(results), sum(r.tests for r in results), sum(r.failures for r in results),
+        wall, serial, serial / wall if wall else 0.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run Makefile simulation targets in parallel')
+    parser.add_argument('targets', nargs='+', help='Makefile targets')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='targets at once')
+    parser.add_argument('--make', default=os.environ.get('MAKE', 'make'), help='make to run')
+    args = parser.parse_args(argv)
+
+    os.makedirs(BUILD_ROOT, exist_ok=True)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        # Results in the order given, not the order they finish
+        results = list(pool.map(lambda t: run_target(t, args.make), args.targets))
+    wall = time.monotonic() - start
+
+    merge(results, os.path.join(BUILD_ROOT, 'regress.xml'))
+    report(results, wall)
+    return 0 if all(r.status == 'PASS' for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
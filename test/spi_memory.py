@@ -0,0 +1,1003 @@
+import cocotb
+import mmap
+import os
+import random
+from cocotb.triggers import FallingEdge, RisingEdge, Edge, First
+from cocotb.handle import SimHandle
+from cocotb.utils import get_sim_time
+from cocotbext.spi import SpiSlaveBase, SpiFrameError, SpiConfig
+
+
+def find_tap(sclk):
+    """ Byte tap in spi_tap.v for the port sclk belongs to
+
+    :return: the tap, or None when the simulation was built without one
+    """
+    root = cocotb.simulator.get_root_handle('spi_tap')
+    if( root is None ):
+        return None
+    # spi0_clk is tapped by spi_tap.spi0
+    return getattr(SimHandle(root), sclk._name.rsplit('_', 1)[0], None)
+
+
+class SpiTimingError(SpiFrameError):
+    """ A drive was used faster than its datasheet allows """
+    pass
+
+
+class Fault:
+    """ Something wrong with a drive, handed to SpiMemory.inject()
+
+    A fault starts at sim time at (ns), or once the drive has seen after
+    frames, or when both have passed if both are given, and right away if
+    neither is. From then on it lasts duration ns or frames frames, or for
+    good. hits counts the bytes or frames it changed.
+    """
+
+    def __init__(self, at=None, after=None, duration=None, frames=None):
+        self.at = at
+        self.after = after
+        self.duration = duration
+        self.frames = frames
+        self.hits = 0
+        self._start = None
+
+    def active(self, now, frame):
+        if( self._start is None ):
+            if( (self.at is not None) and (now < self.at) ):
+                return False
+            if( (self.after is not None) and (frame < self.after) ):
+                return False
+            self._start = (now, frame)
+
+        start_time, start_frame = self._start
+        if( (self.duration is not None) and (now >= start_time + self.duration) ):
+            return False
+        if( (self.frames is not None) and (frame >= start_frame + self.frames) ):
+            return False
+        return True
+
+    # Hooks for the model, the base changes nothing
+
+    def frame(self, model, now):
+        """ Called at the start of each frame the fault is active for """
+        pass
+
+    def read(self, addr, data):
+        """ Byte read from addr, as it goes out on MISO """
+        return data
+
+    def miso(self):
+        """ Level MISO is held at, None to leave it alone """
+        return None
+
+    def drop(self):
+        """ Frame is ignored by the drive """
+        return False
+
+
+def _addr_set(addrs):
+    # A single address, or a range or any other collection of them
+    if( isinstance(addrs, int) ):
+        return (addrs,)
+    if( isinstance(addrs, range) ):
+        return addrs
+    return frozenset(addrs)
+
+
+class BitFlip(Fault):
+    """ Bits in mask read back flipped at the given addresses """
+
+    def __init__(self, addrs, mask=0x01, **when):
+        super().__init__(**when)
+        self.addrs = _addr_set(addrs)
+        self.mask = mask
+
+    def read(self, addr, data):
+        if( addr in self.addrs ):
+            self.hits += 1
+            return data ^ self.mask
+        return data
+
+
+class StuckAt(Fault):
+    """ Bits in mask read back as value at the given addresses, whatever
+    was written """
+
+    def __init__(self, addrs, mask=0xFF, value=0x00, **when):
+        super().__init__(**when)
+        self.addrs = _addr_set(addrs)
+        self.mask = mask
+        self.value = value
+
+    def read(self, addr, data):
+        if( addr in self.addrs ):
+            self.hits += 1
+            return (data & ~self.mask) | (self.value & self.mask)
+        return data
+
+
+class MisoStuck(Fault):
+    """ MISO held high or low, for data, status and ID alike """
+
+    def __init__(self, level=1, **when):
+        super().__init__(**when)
+        self.level = level
+
+    def frame(self, model, now):
+        self.hits += 1
+
+    def miso(self):
+        return self.level
+
+
+class DeadDrive(Fault):
+    """ Takes no commands and writes nothing, MISO floats to level """
+
+    def __init__(self, level=1, **when):
+        super().__init__(**when)
+        self.level = level
+
+    def frame(self, model, now):
+        self.hits += 1
+
+    def miso(self):
+        return self.level
+
+    def drop(self):
+        return True
+
+
+class LatencySpike(Fault):
+    """ Drive goes busy for hang ns, every every frames while active
+
+    Like a part doing its own housekeeping. Frames that start while it is
+    busy are lost, only a status read is answered, with write in progress
+    set. The controller never waits on that, so a spike shows up as missed
+    writes and bad reads on the one drive.
+    """
+
+    def __init__(self, hang, every=1, **when):
+        super().__init__(**when)
+        self.hang = hang
+        self.every = every
+
+    def frame(self, model, now):
+        if( (now >= model._hang_until) and ((model.frames - self._start[1]) % self.every == 0) ):
+            self.hits += 1
+            model._hang_until = now + self.hang
+
+
+class PagedMemory:
+    """ Sparse memory, a page only exists once something is written to it
+
+    Everything else reads as erased, so a large part that only has a few
+    pages touched stays small. Indexing works like a bytearray for single
+    bytes and plain slices.
+    """
+
+    def __init__(self, size, page_size=4096, erased=0xFF):
+        self.size = size
+        self.page_size = page_size
+        self.erased = erased
+        self.pages = {}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def pages_used(self):
+        return len(self.pages)
+
+    def _index(self, key):
+        if( key < 0 ):
+            key += self.size
+        if( (key < 0) or (key >= self.size) ):
+            raise IndexError('PagedMemory: Address %x out of range' % (key))
+        return key
+
+    def __getitem__(self, key):
+        if( isinstance(key, slice) ):
+            start, stop, step = key.indices(self.size)
+            if( step != 1 ):
+                return bytes( self[i] for i in range(start, stop, step) )
+            return self.read(start, max(0, stop - start))
+
+        key = self._index(key)
+        page = self.pages.get(key // self.page_size)
+        if( page is None ):
+            return self.erased
+        return page[key % self.page_size]
+
+    def __setitem__(self, key, value):
+        if( isinstance(key, slice) ):
+            start, stop, step = key.indices(self.size)
+            if( (step != 1) or (len(value) != max(0, stop - start)) ):
+                raise ValueError('PagedMemory: Only same size plain slices can be assigned')
+            self.write(start, value)
+            return
+
+        key = self._index(key)
+        n = key // self.page_size
+        page = self.pages.get(n)
+        if( page is None ):
+            if( value == self.erased ):
+                return
+            page = bytearray([self.erased]) * self.page_size
+            self.pages[n] = page
+        page[key % self.page_size] = value
+
+    def read(self, offset, length):
+        """ Bytes from offset, pages that don't exist read erased """
+        out = bytearray([self.erased]) * length
+        pos = 0
+        while( pos < length ):
+            n, start = divmod(offset + pos, self.page_size)
+            count = min(self.page_size - start, length - pos)
+            page = self.pages.get(n)
+            if( page is not None ):
+                out[pos:pos + count] = page[start:start + count]
+            pos += count
+        return bytes(out)
+
+    def write(self, offset, data):
+        """ Copy data in at offset. Erased runs don't create pages """
+        data = memoryview(data).cast('B')
+        if( offset + len(data) > self.size ):
+            raise ValueError('PagedMemory: %d bytes at %x go past the size of %x' % (len(data), offset, self.size))
+        pos = 0
+        while( pos < len(data) ):
+            n, start = divmod(offset + pos, self.page_size)
+            count = min(self.page_size - start, len(data) - pos)
+            chunk = data[pos:pos + count]
+            page = self.pages.get(n)
+            if( page is None ):
+                if( bytes(chunk).count(self.erased) == count ):
+                    pos += count
+                    continue
+                page = bytearray([self.erased]) * self.page_size
+                self.pages[n] = page
+            page[start:start + count] = chunk
+            pos += count
+
+    def copy(self):
+        """ Separate memory with the same contents """
+        other = PagedMemory(self.size, self.page_size, self.erased)
+        other.pages = { n: bytearray(page) for n, page in self.pages.items() }
+        return other
+
+    def erase(self, offset, length):
+        """ Set a range back to erased, whole pages are dropped """
+        end = offset + length
+        while( offset < end ):
+            n, start = divmod(offset, self.page_size)
+            count = min(self.page_size - start, end - offset)
+            if( count == self.page_size ):
+                self.pages.pop(n, None)
+            elif( n in self.pages ):
+                self.pages[n][start:start + count] = bytes([self.erased]) * count
+            offset += count
+
+
+class SpiMemory(SpiSlaveBase):
+    """ SPI memory part, FRAM or NOR flash
+
+    Parts are subclasses that set the class attributes below. FRAM takes
+    writes a byte at a time anywhere, and wraps at the end of the part.
+    NOR flash only clears bits when programmed, wraps within the program
+    page, and has to be erased to set them again.
+
+    Models run in one of two modes. The per bit mode follows every SPI clock
+    edge in Python. The fast mode is used whenever the simulation was built
+    with spi_tap.v, which shifts the bits in Verilog so the model is only
+    woken once a byte. Passing fast=False, or setting SPI_MODEL_SLOW=1, keeps
+    the per bit mode.
+
+    With timing=True the datasheet timing below is enforced. Anything
+    sooner than the part allows raises a SpiTimingError, or with
+    strict=False is logged and counted in violations. Busy times can be
+    stretched by up to jitter (0.1 is 10%) at random, per drive.
+    """
+
+    # Part size in bytes, and address bytes after the opcode
+    memsize = 2048
+    addr_bytes = 2
+
+    # Program page for NOR flash, a write wraps inside it. Zero for parts
+    # that write anywhere
+    page_size = 0
+
+    # Programming can only clear bits
+    program_and = False
+
+    # Bytes sent for RDID, None for a part without an ID
+    jedec_id = None
+
+    # Large parts are kept in sparse pages of this size
+    sparse_above = 0x10000
+    store_page = 4096
+
+    # Timing, in ns. The part takes no command until t_pu after power up
+    # (the model being created), or t_res after release from deep
+    # power-down. A write or erase keeps it busy for the given time, and
+    # only a status read is taken while it shows write in progress
+    f_sclk_max = 20e6       # Hz
+    t_csh = 60              # Chip select high between frames
+    t_pu = 0
+    t_res = 0
+    t_program = 0
+    t_erase_4k = 0
+    t_erase_64k = 0
+    t_erase_chip = 0
+
+    # Status register bits
+    STATUS_WIP  = 0x01
+    STATUS_WEL  = 0x02
+
+    # Opcode and the method handling it. Subclasses add to or replace these
+    opcodes = {
+        0x01: '_op_wrsr',
+        0x02: '_op_write',
+        0x03: '_op_read',
+        0x04: '_op_wrdi',
+        0x05: '_op_rdsr',
+        0x06: '_op_wren',
+        0x9F: '_op_rdid',
+        0xB9: '_op_dpd',
+        0xAB: '_op_rdpd',
+    }
+
+    def __init__(self, signals, spimode, dut, memsize=None, addr_bytes=None, page_size=None, sparse=None, fast=None,
+            timing=False, strict=True, jitter=0.0, seed=None):
+
+        self.name = type(self).__name__
+
+        # Geometry can be changed per instance, to see the address wrap or
+        # to run a part in another address mode
+        if( memsize is not None ):
+            self.memsize = memsize
+        if( addr_bytes is not None ):
+            self.addr_bytes = addr_bytes
+        if( page_size is not None ):
+            self.page_size = page_size
+
+        # Memory of device in 8 bit chunks, erased. Small parts are a plain
+        # bytearray, and can be swapped for any writable buffer with
+        # attach() or map_file()
+        if( sparse is None ):
+            sparse = self.memsize > self.sparse_above
+        if( sparse ):
+            self.mem = PagedMemory(self.memsize, self.store_page)
+        else:
+            self.mem = bytearray(b'\xFF') * self.memsize
+        self._image = None
+
+        # Opcodes as the model sees them. The first clock of a frame is gone
+        # by the time the transaction starts, so only the low 7 bits of the
+        # opcode come through
+        self._ops = {}
+        for op, method in self.opcodes.items():
+            if( (op & 0x7F) in self._ops ):
+                raise ValueError('%s: Opcode %02x clashes with another in its low 7 bits' % (self.name, op))
+            self._ops[op & 0x7F] = getattr(self, method)
+        self._op_rdpd_key = 0xAB & 0x7F
+        self._op_rdsr_key = 0x05
+
+        self.dut = dut
+
+        # Internal Registers
+        self.status = 0x00
+        self.wp = 0x00
+
+        # Timing state, all in ns of sim time
+        self.timing = timing
+        self.strict = strict
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self.violations = 0
+        self._ready_at = get_sim_time('ns') + self._jittered(self.t_pu)
+        self._busy_until = 0
+        self._frame_start_at = 0
+        self._dropped = False
+        self._frame_end_at = None
+        self._last_byte_at = None
+
+        # Deep power-down, counted so tests can see it
+        self.asleep = False
+        self.sleeps = 0
+        self.wakes = 0
+
+        # Transactions, and bytes moved by them
+        self.reads = 0
+        self.read_bytes = 0
+        self.writes = 0
+        self.write_bytes = 0
+
+        # Injected faults, and frames seen so they can be scheduled
+        self.faults = []
+        self.frames = 0
+        self._active = []
+        self._hang_until = 0
+        self._miso_fault = None
+
+        if( spimode == 0 ):
+            self._config = SpiConfig(
+                word_width = 32,
+                cpol = False,
+                cpha = False,
+                msb_first = True,
+                frame_spacing_ns = 10
+            )
+        elif( spimode == 3 ):
+            self._config = SpiConfig(
+                word_width = 32,
+                cpol = True,
+                cpha = True,
+                msb_first = True,
+                frame_spacing_ns = 10
+            )
+        else:
+            raise ValueError('%s Only supports spi modes 0 and 3, not %d' %(self.name, spimode))
+
+        # Byte tap, if there is one and it is wanted
+        if( fast is None ):
+            fast = os.environ.get('SPI_MODEL_SLOW', '0') == '0'
+        tap = find_tap(signals.sclk)
+        self._tap = tap if fast else None
+        if( (tap is not None) and not fast ):
+            # Left enabled by an earlier model on the port
+            tap.enable.value = 0
+        self._idle_byte = 0xFF if self._config.data_output_idle else 0x00
+
+        self.dut._log.info("Initialized %s, %d bytes%s" % (self.name, self.memsize, ", byte tap" if self._tap is not None else ""))
+        super().__init__(signals)
+
+        if( self._tap is not None ):
+            self._tap.tx.value = self._idle_byte
+            self._tap.enable.value = 1
+
+
+    def inject(self, fault):
+        """ Add a fault to the drive, from any test
+
+        Faults are checked at the start of every frame, so one scheduled by
+        time or frame count takes effect from the next frame on.
+
+        :return: the fault, to look at its hits later
+        """
+        self.faults.append(fault)
+        return fault
+
+
+    def clear_faults(self):
+        self.faults = []
+        self._hang_until = 0
+
+
+    def _read(self, addr):
+        # Byte at addr as the active faults have it
+        data = self.mem[addr]
+        for fault in self._active:
+            data = fault.read(addr, data)
+        return data
+
+
+    def _jittered(self, t):
+        return t * (1 + self.jitter * self._rng.random())
+
+
+    def _violation(self, msg):
+        self.violations += 1
+        if( self.strict ):
+            raise SpiTimingError('%s: %s' % (self.name, msg))
+        self.dut._log.warning('%s: %s' % (self.name, msg))
+
+
+    def _start_busy(self, t):
+        """ Write in progress for t ns from now """
+        self._busy_until = get_sim_time('ns') + self._jittered(t)
+
+
+    @property
+    def busy(self):
+        """ Write in progress, for timed parts """
+        now = get_sim_time('ns')
+        return (self.timing and (now < self._busy_until)) or (now < self._hang_until)
+
+
+    @property
+    def fast(self):
+        return self._tap is not None
+
+
+    def stop(self):
+        """ Take the part off the bus, so another model can go on the port """
+        self._run_coroutine_obj.kill()
+        if( self._tap is not None ):
+            self._tap.enable.value = 0
+
+
+    @property
+    def sparse(self):
+        return isinstance(self.mem, PagedMemory)
+
+
+    async def get_mem(self, addr):
+        await self.idle.wait()
+        # Check if address is ok
+        if( addr >= self.memsize ):
+            raise ValueError('%s: Address %04x is too large for memory size of %04x' %(self.name, addr, self.memsize))
+
+        return self.mem[addr]
+
+
+    # Backdoor access. None of these wait for the bus, the memory is changed
+    # or looked at right away, so only use them while the part is idle or
+    # when that doesn't matter
+
+    def load(self, data, offset=0):
+        """ Copy a buffer into memory at offset, in one go """
+        data = memoryview(data).cast('B')
+        if( offset + len(data) > self.memsize ):
+            raise ValueError('%s: %d bytes at %04x go past the memory size of %04x' %(self.name, len(data), offset, self.memsize))
+        if( self.sparse ):
+            self.mem.write(offset, data)
+        else:
+            memoryview(self.mem)[offset:offset + len(data)] = data
+
+
+    def dump(self, offset=0, length=None):
+        """ Memory from offset. A view of it for plain memory, sparse memory
+        has to be put together into a copy """
+        if( length is None ):
+            length = self.memsize - offset
+        if( self.sparse ):
+            return self.mem.read(offset, length)
+        return memoryview(self.mem)[offset:offset + length]
+
+
+    def load_file(self, path, offset=0):
+        """ Read an image file straight into memory at offset """
+        with open(path, 'rb') as f:
+            if( self.sparse ):
+                data = f.read(self.memsize - offset)
+                self.mem.write(offset, data)
+                return len(data)
+            return f.readinto(self.dump(offset))
+
+
+    def dump_file(self, path):
+        """ Write the whole memory out to an image file """
+        with open(path, 'wb') as f:
+            if( self.sparse ):
+                for offset in range(0, self.memsize, self.store_page):
+                    f.write(self.mem.read(offset, min(self.store_page, self.memsize - offset)))
+            else:
+                f.write(self.dump())
+
+
+    def attach(self, buffer):
+        """ Use buffer as the memory, without copying it
+
+        Anything writable and memsize bytes long will do, like a bytearray
+        shared with a golden model, or a memory mapped image.
+        """
+        view = memoryview(buffer).cast('B')
+        if( view.readonly or (len(view) != self.memsize) ):
+            raise ValueError('%s: Memory has to be %04x writable bytes' %(self.name, self.memsize))
+        self.close()
+        self.mem = view
+        self._image = buffer
+
+
+    def map_file(self, path):
+        """ Use an image file as the memory, so writes land in the file
+
+        A new or short file is filled out to memsize with erased bytes.
+        """
+        with open(path, 'a+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            if( size < self.memsize ):
+                f.write(b'\xFF' * (self.memsize - size))
+                f.flush()
+            image = mmap.mmap(f.fileno(), self.memsize)
+        self.attach(image)
+
+
+    def close(self):
+        """ Let go of an attached or mapped image """
+        if( isinstance(self._image, mmap.mmap) ):
+            # Keep the contents, the file goes away
+            data = bytearray(self.mem)
+            self.mem.release()
+            self._image.close()
+            self.mem = data
+        self._image = None
+
+
+    async def _shift_byte(self, tx_word=None):
+        """ Shift one byte in on MOSI, and tx_word out on MISO
+
+        The part carries on for as long as chip select is low, so the end of
+        the frame is only an error in the middle of a byte.
+
+        :return: the byte received, or None if chip select went up first
+        """
+        rx_word = 0
+        frame_end = RisingEdge(self._cs) if self._cs_active_low else FallingEdge(self._cs)
+
+        # The tap shifts the byte, only wait for it to be done
+        if( self._tap is not None ):
+            if( self._miso_fault is not None ):
+                tx_word = 0xFF if self._miso_fault else 0x00
+            self._tap.tx.value = self._idle_byte if tx_word is None else tx_word
+            if (await First(Edge(self._tap.nbytes), frame_end)) == frame_end or self._cs.value == 1:
+                if( self._tap.bits.value == 0 ):
+                    return None
+                raise SpiFrameError('%s: End of frame in the middle of a byte' % (self.name))
+            self._check_byte_time()
+            return int(self._tap.rx.value)
+
+        if( self._miso_fault is not None ):
+            tx_word = 0xFF if self._miso_fault else 0x00
+
+        for k in range(16):
+            if (await First(Edge(self._sclk), frame_end)) == frame_end or self._cs.value == 1:
+                if( k == 0 ):
+                    return None
+                raise SpiFrameError('%s: End of frame in the middle of a byte' % (self.name))
+
+            # Sample on the first edge of a bit for CPHA 0, the second for
+            # CPHA 1, and shift out on the other one
+            bit = 7 - (k // 2)
+            if( (k % 2) == int(self._config.cpha) ):
+                rx_word |= int(self._mosi.value.integer) << bit
+            elif( tx_word is not None ):
+                self._miso.value = bool(tx_word & (1 << bit))
+            else:
+                self._miso.value = self._config.data_output_idle
+
+        self._check_byte_time()
+        return rx_word
+
+
+    def _check_byte_time(self):
+        # Bytes in a frame come 8 clocks apart, so that is where the clock
+        # rate shows
+        if( not self.timing ):
+            return
+        now = get_sim_time('ns')
+        if( (self._last_byte_at is not None) and (now - self._last_byte_at < 8e9 / self.f_sclk_max) ):
+            self._violation('SCLK over %.0f Hz, byte took %.1f ns' % (self.f_sclk_max, now - self._last_byte_at))
+        self._last_byte_at = now
+
+
+    async def _shift_bits(self, num_bits):
+        """ Shift in a field of num_bits, whole bytes when there is a tap """
+        if( self._tap is None ):
+            return int( await self._shift(num_bits) )
+
+        rx_word = 0
+        for n in range(num_bits // 8):
+            data = await self._shift_byte()
+            if( data is None ):
+                raise SpiFrameError('%s: End of frame in the middle of a transaction' % (self.name))
+            rx_word = (rx_word << 8) | data
+        return rx_word
+
+
+    async def _shift_addr(self):
+        # Upper address bits past the end of the part are ignored
+        return await self._shift_bits(8 * self.addr_bytes) % self.memsize
+
+
+    def _next_write_addr(self, addr):
+        # NOR flash wraps inside the program page, the rest at the end
+        if( self.page_size ):
+            return (addr & ~(self.page_size - 1)) | ((addr + 1) & (self.page_size - 1))
+        return (addr + 1) % self.memsize
+
+
+    def _check_wel(self, what):
+        if( (self.status & SpiMemory.STATUS_WEL) != SpiMemory.STATUS_WEL ):
+            raise SpiFrameError('%s: Write enable latch was not set during this %s. Current status: %02x' %(self.name, what, self.status))
+
+
+    async def _transaction(self, frame_start, frame_end):
+        await frame_start
+        self.idle.clear()
+
+        now = get_sim_time('ns')
+        self._frame_start_at = now
+        self._last_byte_at = None
+        if( self.timing ):
+            if( (self._frame_end_at is not None) and (now - self._frame_end_at < self.t_csh) ):
+                self._violation('Chip select high for %.1f ns, needs %d ns' % (now - self._frame_end_at, self.t_csh))
+            if( now < self._ready_at ):
+                self._violation('Frame %.1f ns before the part is ready' % (self._ready_at - now))
+
+        # Faults for this frame
+        self._active = [ fault for fault in self.faults if fault.active(now, self.frames) ]
+        for fault in self._active:
+            fault.frame(self, now)
+        self.frames += 1
+        self._miso_fault = next( (fault.miso() for fault in self._active if fault.miso() is not None), None )
+        self._dropped = any( fault.drop() for fault in self._active )
+
+        try:
+            await self._command(frame_end)
+        finally:
+            self._frame_end_at = get_sim_time('ns')
+
+
+    async def _command(self, frame_end):
+        # Determine the incoming command. The tap gets the whole opcode,
+        # the per bit mode misses the first clock edge
+        if( self._tap is not None ):
+            cmd = await self._shift_byte()
+            if( cmd is None ):
+                return
+            cmd &= 0x7F
+        else:
+            cmd = int(await self._shift(7) )
+
+        # A dead or hung drive lets the frame go by, a hung one still
+        # answers a status read
+        hung = self._frame_start_at < self._hang_until
+        if( self._dropped or (hung and (cmd != self._op_rdsr_key)) ):
+            while( (await self._shift_byte()) is not None ):
+                pass
+            return
+
+        if( self.asleep and (cmd != self._op_rdpd_key) ):
+            raise SpiFrameError('%s: Opcode %02x while in deep power-down' % (self.name, cmd))
+
+        if( cmd not in self._ops ):
+            raise SpiFrameError('%s: Unknown opcode: %02x' % (self.name, cmd))
+
+        # Only the status can be read while a write is in progress
+        if( self.timing and (self._frame_start_at < self._busy_until) and (cmd != self._op_rdsr_key) ):
+            self._violation('Opcode %02x while busy for another %.1f ns' % (cmd, self._busy_until - self._frame_start_at))
+
+        await self._ops[cmd](frame_end)
+
+
+    # Opcode handlers, called once the opcode is in
+
+    async def _op_wrsr(self, frame_end):
+        self.dut._log.info("%s: Write Status Register command found" % (self.name))
+        val = await self._shift_bits(8)
+        # Write to status register with mask
+        self.status = self.status & ~(0x8C)
+        self.status = (val & 0x8C) | self.status # 1000 1100
+        await frame_end
+
+
+    async def _op_write(self, frame_end):
+        # Check if WEL is set
+        self.dut._log.info("%s: Write command found" % (self.name))
+        self._check_wel("write cycle")
+
+        addr = await self._shift_addr()
+
+        # Bytes go to following addresses until chip select goes up
+        count = 0
+        while True:
+            data = await self._shift_byte()
+            if( data is None ):
+                break
+            if( self.program_and ):
+                data &= self.mem[addr]
+            self.mem[addr] = data
+            addr = self._next_write_addr(addr)
+            count += 1
+
+        self.dut._log.info("%s: Wrote %d bytes ending at address %04x" % (self.name, count, addr))
+        self.writes += 1
+        self.write_bytes += count
+
+        # The latch is cleared once a write is done
+        if( count != 0 ):
+            self.status = self.status & ~SpiMemory.STATUS_WEL
+            self._start_busy(self.t_program)
+
+
+    async def _op_read(self, frame_end):
+        self.dut._log.info("%s: Read command found" % (self.name))
+        addr = await self._shift_addr()
+
+        # Following addresses are sent until chip select goes up, wrapping
+        # at the end of the part
+        count = 0
+        while( (await self._shift_byte(tx_word=self._read(addr))) is not None ):
+            addr = (addr + 1) % self.memsize
+            count += 1
+
+        self.dut._log.info("%s: Read %d bytes ending at address %04x" % (self.name, count, addr))
+        self.reads += 1
+        self.read_bytes += count
+
+
+    async def _op_wrdi(self, frame_end):
+        self.dut._log.info("%s: Write Disable command found" % (self.name))
+        self.status = self.status & ~SpiMemory.STATUS_WEL
+        await frame_end
+
+
+    async def _op_rdsr(self, frame_end):
+        # Sent for as long as chip select is low
+        self.dut._log.info("%s: Read Status Register Command Found" % (self.name))
+        while( (await self._shift_byte(tx_word=self.status | (SpiMemory.STATUS_WIP if self.busy else 0))) is not None ):
+            pass
+
+
+    async def _op_wren(self, frame_end):
+        self.dut._log.info("%s: Write Enable Latch command found" % (self.name))
+        self.status = self.status | SpiMemory.STATUS_WEL
+        await frame_end
+
+
+    async def _op_rdid(self, frame_end):
+        # A part without an ID holds MISO low, so the controller falls
+        # back to its defaults
+        jedec_id = self.jedec_id or b''
+        if( self.jedec_id is None ):
+            self.dut._log.info("%s: Read ID command found, no ID to send" % (self.name))
+        else:
+            self.dut._log.info("%s: Read ID command found" % (self.name))
+
+        n = 0
+        while( (await self._shift_byte(tx_word=(jedec_id[n] if n < len(jedec_id) else 0))) is not None ):
+            n += 1
+
+
+    # Deep power-down and release. Parts without a sleep mode still take
+    # them, and like the parts that do only take the release command until
+    # woken
+
+    async def _op_dpd(self, frame_end):
+        self.dut._log.info("%s: Deep power-down command found" % (self.name))
+        await frame_end
+        self.asleep = True
+        self.sleeps += 1
+
+
+    async def _op_rdpd(self, frame_end):
+        self.dut._log.info("%s: Release from deep power-down command found" % (self.name))
+        await frame_end
+        if( self.asleep ):
+            self.asleep = False
+            self.wakes += 1
+            self._ready_at = get_sim_time('ns') + self._jittered(self.t_res)
+
+
+    # NOR flash erase and address mode
+
+    async def _erase(self, frame_end, size, t):
+        self._check_wel("erase")
+        addr = await self._shift_addr()
+        await frame_end
+        start = addr & ~(size - 1)
+        self.dut._log.info("%s: Erased %d bytes at address %06x" % (self.name, size, start))
+        if( self.sparse ):
+            self.mem.erase(start, size)
+        else:
+            self.mem[start:start + size] = b'\xFF' * size
+        self.status = self.status & ~SpiMemory.STATUS_WEL
+        self._start_busy(t)
+
+    async def _op_erase_4k(self, frame_end):
+        await self._erase(frame_end, 4096, self.t_erase_4k)
+
+    async def _op_erase_64k(self, frame_end):
+        await self._erase(frame_end, 65536, self.t_erase_64k)
+
+    async def _op_erase_chip(self, frame_end):
+        self._check_wel("erase")
+        await frame_end
+        self.dut._log.info("%s: Chip erase" % (self.name))
+        if( self.sparse ):
+            self.mem.erase(0, self.memsize)
+        else:
+            self.load(b'\xFF' * self.memsize)
+        self.status = self.status & ~SpiMemory.STATUS_WEL
+        self._start_busy(self.t_erase_chip)
+
+    async def _op_en4b(self, frame_end):
+        await frame_end
+        self.addr_bytes = 4
+
+    async def _op_ex4b(self, frame_end):
+        await frame_end
+        self.addr_bytes = 3
+
+
+# FRAM parts
+
+class FM25V20A(SpiMemory):
+    # 256KB, 3 address bytes, ID has six continuation codes first
+    memsize = 0x40000
+    addr_bytes = 3
+    jedec_id = bytes.fromhex('7F7F7F7F7F7FC22508')
+
+    # Datasheet timing, sleep recovery is tREC
+    f_sclk_max = 40e6
+    t_csh = 40
+    t_pu = 250000
+    t_res = 400000
+
+
+# NOR flash parts
+
+# Typical program and erase times from the datasheets. Read (03h) is
+# limited to 50MHz on all of them
+
+NOR_OPCODES = {
+    **SpiMemory.opcodes,
+    0x20: '_op_erase_4k',
+    0xD8: '_op_erase_64k',
+    0xC7: '_op_erase_chip',
+    0x60: '_op_erase_chip',
+}
+
+
+class W25X20CL(SpiMemory):
+    # 256KB
+    memsize = 0x40000
+    addr_bytes = 3
+    page_size = 256
+    program_and = True
+    jedec_id = bytes.fromhex('EF3012')
+    opcodes = NOR_OPCODES
+
+    f_sclk_max = 50e6
+    t_csh = 50
+    t_pu = 10000
+    t_res = 3000
+    t_program = 800000
+    t_erase_4k = 30000000
+    t_erase_64k = 150000000
+    t_erase_chip = 1000000000
+
+
+class W25Q128JV(SpiMemory):
+    # 16MB
+    memsize = 0x1000000
+    addr_bytes = 3
+    page_size = 256
+    program_and = True
+    jedec_id = bytes.fromhex('EF4018')
+    opcodes = NOR_OPCODES
+
+    f_sclk_max = 50e6
+    t_csh = 50
+    t_pu = 20000
+    t_res = 3000
+    t_program = 700000
+    t_erase_4k = 45000000
+    t_erase_64k = 150000000
+    t_erase_chip = 40000000000
+
+
+class W25Q256JV(SpiMemory):
+    # 32MB, starts in 3 byte address mode and switches to 4
+    memsize = 0x2000000
+    addr_bytes = 3
+    page_size = 256
+    program_and = True
+    jedec_id = bytes.fromhex('EF4019')
+
+    f_sclk_max = 50e6
+    t_csh = 50
+    t_pu = 20000
+    t_res = 3000
+    t_program = 700000
+    t_erase_4k = 45000000
+    t_erase_64k = 150000000
+    t_erase_chip = 80000000000
+
+    opcodes = {
+        **NOR_OPCODES,
+        0xB7: '_op_en4b',
+        0xE9: '_op_ex4b',
+    }
@@ -0,0 +1,144 @@
+/* Byte taps on the drive SPI ports, for the fast drive models */
+`default_nettype none
+`timescale 1ns/1ns
+
+/* Simulation only. Waking the Python drive models on every SPI clock edge is
+* what takes most of the wall clock time in the tests, so each port gets a
+* shift register here and the model is only woken once a byte. MOSI is
+* sampled on the rising edge and MISO changed on the falling edge, which
+* covers SPI modes 0 and 3. A byte that has come in is left in rx and counted
+* in nbytes, the model waits on nbytes and puts the next byte to send in tx
+* before the following falling edge. The design is left alone: the ports are
+* reached by hierarchical name under SPI_TAP_TOP, and MISO is only forced
+* while a model has the tap enabled. Built as its own top with -s spi_tap. */
+
+`ifndef SPI_TAP_TOP
+`define SPI_TAP_TOP wb_spraid
+`endif
+
+module spi_tap_port (
+		input			sclk,
+		input			cs,
+		input			mosi,
+		output reg		miso
+	);
+
+	/* Set by the model */
+	reg				enable;
+	reg [7:0]		tx;			/* Byte being sent */
+
+	/* Read by the model */
+	reg [7:0]		rx;			/* Last byte received */
+	reg [31:0]		nbytes;		/* Bytes received, wakes the model */
+	reg [2:0]		bits;		/* Bits of the current byte */
+
+	reg [7:0]		shift;
+	reg				last_sclk;
+	reg				last_cs;
+
+	initial begin
+		enable = 0;
+		tx = 8'hFF;
+		rx = 0;
+		nbytes = 0;
+		bits = 0;
+		shift = 0;
+		miso = 1;
+		last_sclk = 0;
+		last_cs = 1;
+	end
+
+	always @(sclk or cs) begin
+		/* Chip select and the first clock edge can come in the same step, so
+		* let both settle before looking at them */
+		#0;
+		if( !cs ) begin
+			if( last_cs ) begin
+				bits = 0;
+			end
+
+			if( sclk && !last_sclk ) begin
+				shift = { shift[6:0], mosi };
+				bits = bits + 1;
+				if( bits == 0 ) begin
+					rx = shift;
+					nbytes = nbytes + 1;
+				end
+			end
+			else if( !sclk && last_sclk ) begin
+				miso = tx[7 - bits];
+			end
+		end
+		last_sclk = sclk;
+		last_cs = cs;
+	end
+
+endmodule
+
+
+module spi_tap;
+
+	spi_tap_port spi0 (
+		.sclk( `SPI_TAP_TOP.spi0_clk ),
+		.cs( `SPI_TAP_TOP.spi0_cs ),
+		.mosi( `SPI_TAP_TOP.spi0_mosi ),
+		.miso()
+	);
+
+	spi_tap_port spi1 (
+		.sclk( `SPI_TAP_TOP.spi1_clk ),
+		.cs( `SPI_TAP_TOP.spi1_cs ),
+		.mosi( `SPI_TAP_TOP.spi1_mosi ),
+		.miso()
+	);
+
+	spi_tap_port spi2 (
+		.sclk( `SPI_TAP_TOP.spi2_clk ),
+		.cs( `SPI_TAP_TOP.spi2_cs ),
+		.mosi( `SPI_TAP_TOP.spi2_mosi ),
+		.miso()
+	);
+
+	spi_tap_port spi3 (
+		.sclk( `SPI_TAP_TOP.spi3_clk ),
+		.cs( `SPI_TAP_TOP.spi3_cs ),
+		.mosi( `SPI_TAP_TOP.spi3_mosi ),
+		.miso()
+	);
+
+	always @(spi0.enable) begin
+		if( spi0.enable ) force `SPI_TAP_TOP.spi0_miso = spi0.miso;
+		else release `SPI_TAP_TOP.spi0_miso;
+	end
+
+	always @(spi1.enable) begin
+		if( spi1.enable ) force `SPI_TAP_TOP.spi1_miso = spi1.miso;
+		else release `SPI_TAP_TOP.spi1_miso;
+	end
+
+	always @(spi2.enable) begin
+		if( spi2.enable ) force `SPI_TAP_TOP.spi2_miso = spi2.miso;
+		else release `SPI_TAP_TOP.spi2_miso;
+	end
+
+	always @(spi3.enable) begin
+		if( spi3.enable ) force `SPI_TAP_TOP.spi3_miso = spi3.miso;
+		else release `SPI_TAP_TOP.spi3_miso;
+	end
+
+`ifndef SPI_TAP_NO_SPARE
+	/* Hot spare port */
+	spi_tap_port spi4 (
+		.sclk( `SPI_TAP_TOP.spi4_clk ),
+		.cs( `SPI_TAP_TOP.spi4_cs ),
+		.mosi( `SPI_TAP_TOP.spi4_mosi ),
+		.miso()
+	);
+
+	always @(spi4.enable) begin
+		if( spi4.enable ) force `SPI_TAP_TOP.spi4_miso = spi4.miso;
+		else release `SPI_TAP_TOP.spi4_miso;
+	end
+`endif
+
+endmodule
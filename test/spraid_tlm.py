@@ -0,0 +1,1264 @@
+""" Transaction level model of wb_spraid
+
+Driver code can be run against this instead of the RTL. A Wishbone access is
+one call, done straight on the drive memories, with the register map and RAID
+behaviour of wb_spraid.v and an estimate of the clock cycles the RTL takes
+for it. Drives are the parts from spi_memory.py, either new ones or the
+memories of models already on the SPI ports.
+
+Lockstep runs the model next to the RTL in a cocotb test and compares every
+access, so the model is checked against the design it stands in for.
+"""
+
+import zlib
+import numpy as np
+from cocotb.triggers import ClockCycles
+from cocotb.utils import get_sim_time
+from cocotbext.wishbone.driver import WBOp
+from .spi_memory import PagedMemory
+from .raid_model import RAID1, RAID0, RAID5, ECC, RAID10, HELD_LANES, stripe, ecc_decode
+
+# Register map, as in wb_spraid.v
+WB_ADDR_BASE            = 0x30000000
+SPRAID_MEM_SZ           = 0x7FF
+SPRAID_ADR_MAX          = WB_ADDR_BASE + SPRAID_MEM_SZ
+SPRAID_MEM_WORDS        = SPRAID_MEM_SZ + 1
+SPRAID_RAID_TYPE        = WB_ADDR_BASE + SPRAID_MEM_SZ + 1
+SPRAID_STATUS           = WB_ADDR_BASE + SPRAID_MEM_SZ + 2
+
+SPRAID_STREAM_ADDR      = WB_ADDR_BASE + SPRAID_MEM_SZ + 3
+SPRAID_STREAM_LEN       = WB_ADDR_BASE + SPRAID_MEM_SZ + 4
+SPRAID_STREAM_DATA      = WB_ADDR_BASE + SPRAID_MEM_SZ + 5
+
+SPRAID_OFFLOAD_ADDR     = WB_ADDR_BASE + SPRAID_MEM_SZ + 6
+SPRAID_OFFLOAD_LEN      = WB_ADDR_BASE + SPRAID_MEM_SZ + 7
+SPRAID_OFFLOAD_VALUE    = WB_ADDR_BASE + SPRAID_MEM_SZ + 8
+SPRAID_OFFLOAD_CMD      = WB_ADDR_BASE + SPRAID_MEM_SZ + 9
+SPRAID_OFFLOAD_RESULT   = WB_ADDR_BASE + SPRAID_MEM_SZ + 10
+SPRAID_OFFLOAD_MISMATCH = WB_ADDR_BASE + SPRAID_MEM_SZ + 11
+
+SPRAID_PERF_FULL_WR     = WB_ADDR_BASE + SPRAID_MEM_SZ + 12
+SPRAID_PERF_RMW_WR      = WB_ADDR_BASE + SPRAID_MEM_SZ + 13
+SPRAID_PERF_RCW_WR      = WB_ADDR_BASE + SPRAID_MEM_SZ + 14
+SPRAID_PERF_DRIVE_OPS   = WB_ADDR_BASE + SPRAID_MEM_SZ + 15
+
+SPRAID_MIGRATE_TARGET   = WB_ADDR_BASE + SPRAID_MEM_SZ + 16
+SPRAID_MIGRATE_LEN      = WB_ADDR_BASE + SPRAID_MEM_SZ + 17
+SPRAID_MIGRATE_THROTTLE = WB_ADDR_BASE + SPRAID_MEM_SZ + 18
+SPRAID_MIGRATE_MARK     = WB_ADDR_BASE + SPRAID_MEM_SZ + 19
+
+SPRAID_ECC_CORRECTED    = WB_ADDR_BASE + SPRAID_MEM_SZ + 20
+SPRAID_ECC_UNCORRECTED  = WB_ADDR_BASE + SPRAID_MEM_SZ + 21
+
+SPRAID_ARB_STAT         = WB_ADDR_BASE + SPRAID_MEM_SZ + 22
+
+SPRAID_HEALTH_THRESHOLD = WB_ADDR_BASE + SPRAID_MEM_SZ + 30
+SPRAID_HEALTH_DEGRADED  = WB_ADDR_BASE + SPRAID_MEM_SZ + 31
+SPRAID_HEALTH_EWMA      = WB_ADDR_BASE + SPRAID_MEM_SZ + 32
+SPRAID_HEALTH_MAX       = WB_ADDR_BASE + SPRAID_MEM_SZ + 36
+
+SPRAID_COALESCE_WINDOW  = WB_ADDR_BASE + SPRAID_MEM_SZ + 40
+SPRAID_COALESCE_WRITES  = WB_ADDR_BASE + SPRAID_MEM_SZ + 41
+SPRAID_COALESCE_BURSTS  = WB_ADDR_BASE + SPRAID_MEM_SZ + 42
+
+SPRAID_XIP_TIMEOUT      = WB_ADDR_BASE + SPRAID_MEM_SZ + 43
+SPRAID_XIP_READS        = WB_ADDR_BASE + SPRAID_MEM_SZ + 44
+
+SPRAID_DRIVE_ID         = WB_ADDR_BASE + SPRAID_MEM_SZ + 45
+SPRAID_DRIVE_CAPS       = WB_ADDR_BASE + SPRAID_MEM_SZ + 49
+SPRAID_GEOMETRY         = WB_ADDR_BASE + SPRAID_MEM_SZ + 53
+SPRAID_CAPACITY         = WB_ADDR_BASE + SPRAID_MEM_SZ + 54
+
+SPRAID_SPARE_CTRL       = WB_ADDR_BASE + SPRAID_MEM_SZ + 55
+SPRAID_SPARE_STATUS     = WB_ADDR_BASE + SPRAID_MEM_SZ + 56
+SPRAID_REBUILD_MARK     = WB_ADDR_BASE + SPRAID_MEM_SZ + 57
+
+SPRAID_POWER_CTRL       = WB_ADDR_BASE + SPRAID_MEM_SZ + 58
+SPRAID_WAKE_TIME        = WB_ADDR_BASE + SPRAID_MEM_SZ + 59
+SPRAID_WAKE_COUNT       = WB_ADDR_BASE + SPRAID_MEM_SZ + 63
+SPRAID_WAKE_STALL       = WB_ADDR_BASE + SPRAID_MEM_SZ + 67
+
+# Status register bits
+STATUS_BUSY         = 0x001
+STATUS_ERR          = 0x002
+STATUS_PARITY       = 0x004
+STATUS_STREAM       = 0x008
+STATUS_OFFLOAD      = 0x010
+STATUS_MISMATCH     = 0x020
+STATUS_MIGRATE      = 0x040
+STATUS_ECC_DOUBLE   = 0x080
+STATUS_DEGRADED     = 0x100
+STATUS_COALESCE     = 0x200
+STATUS_REBUILD      = 0x400
+
+# Offload commands, as in offload.v
+OFFLOAD_FILL        = 1
+OFFLOAD_COMPARE     = 2
+OFFLOAD_CRC32       = 3
+
+# Registers that follow how long things take, which the model only estimates
+APPROXIMATE = set(range(SPRAID_HEALTH_EWMA, SPRAID_HEALTH_MAX + 4)) | { SPRAID_XIP_READS } | \
+    set(range(SPRAID_WAKE_STALL, SPRAID_WAKE_STALL + 4)) | \
+    set( SPRAID_ARB_STAT + 4 * port + n for port in range(2) for n in (1, 2) )
+
+# Registers a running stream moves ahead of the host, prefetching or draining
+# its FIFO in the background. The model moves a word per data access
+STREAM_TIMED = { SPRAID_STREAM_ADDR, SPRAID_STREAM_LEN, SPRAID_PERF_FULL_WR, SPRAID_PERF_RMW_WR,
+    SPRAID_PERF_RCW_WR, SPRAID_PERF_DRIVE_OPS, SPRAID_ECC_CORRECTED, SPRAID_ECC_UNCORRECTED }
+
+# Registers that only take reads, the RTL never acks a write to them
+READ_ONLY = { SPRAID_STATUS, SPRAID_PERF_FULL_WR, SPRAID_PERF_RMW_WR, SPRAID_PERF_RCW_WR,
+    SPRAID_PERF_DRIVE_OPS, SPRAID_ECC_CORRECTED, SPRAID_ECC_UNCORRECTED, SPRAID_XIP_READS,
+    SPRAID_GEOMETRY, SPRAID_CAPACITY, SPRAID_OFFLOAD_RESULT, SPRAID_OFFLOAD_MISMATCH,
+    SPRAID_MIGRATE_MARK, SPRAID_COALESCE_WRITES, SPRAID_COALESCE_BURSTS, SPRAID_SPARE_STATUS,
+    SPRAID_REBUILD_MARK } | set(range(SPRAID_HEALTH_EWMA, SPRAID_HEALTH_EWMA + 4)) | \
+    set(range(SPRAID_DRIVE_ID, SPRAID_DRIVE_CAPS + 4))
+
+# Words the stream port holds, sync_fifo.v is full one short of its depth
+STREAM_FIFO_WORDS = 7
+
+# Part size used by flash_ctl.v when a drive has no ID, log2 bytes
+FLASH_ADDR_SZ = 11
+
+
+def _bits(n):
+    return bin(n).count("1")
+
+
+def _data_bytes(raid_type):
+    # Data bytes in each word of a layout
+    return { RAID0: 4, RAID5: 3, RAID10: 2, ECC: 3 }.get(raid_type & 0xF, 1)
+
+
+class TlmDrive:
+    """ One drive as the model sees it, the memory and what the probe finds
+
+    part is a SpiMemory subclass for a new erased part, or a model already on
+    an SPI port. The memory of a model is shared, so the model and the RTL
+    work on the same drive, unless copy is set, then the drive starts as a
+    copy of it. Faults injected into a model aren't seen here.
+    """
+
+    def __init__(self, part, copy=False):
+        if( isinstance(part, type) ):
+            self.name = part.__name__
+            if( part.memsize > part.sparse_above ):
+                self.mem = PagedMemory(part.memsize, part.store_page)
+            else:
+                self.mem = bytearray(b'\xFF') * part.memsize
+        else:
+            self.name = part.name
+            self.mem = part.mem
+            if( copy ):
+                self.mem = self.mem.copy() if isinstance(self.mem, PagedMemory) else bytearray(self.mem)
+
+        self.memsize = part.memsize
+        self.program_and = part.program_and
+
+        # The probe takes the first three ID bytes. A part without one holds
+        # MISO low, and an ID that makes no sense keeps the defaults
+        jedec_id = part.jedec_id if part.jedec_id is not None else b''
+        self.jedec_id = int.from_bytes((jedec_id + bytes(3))[:3], 'big')
+        capacity = self.jedec_id & 0xFF
+        valid = (self.jedec_id >> 16) not in (0x00, 0xFF)
+        if( valid and (capacity >= 8) and (capacity <= 31) ):
+            self.density = capacity & 0x1F
+        else:
+            self.density = FLASH_ADDR_SZ
+        self.addr_bytes = 4 if self.density > 24 else 3 if self.density > 16 else 2
+        self.addr_mask = 0xFFFF if self.density >= 16 else (1 << self.density) - 1
+
+        # Last byte clocked in, what the array sees from a drive it didn't use
+        self.dout = 0
+
+        # Open read stream, next address and when it went idle
+        self.xip_next = None
+        self.xip_idle_at = 0
+
+        # Deep power-down, and when the last operation was done
+        self.asleep = False
+        self.idle_at = 0
+
+        self.reads = 0
+        self.writes = 0
+
+    def addr(self, offset):
+        """ Byte address on the part for a window offset """
+        return (offset & self.addr_mask) % self.memsize
+
+    def read(self, offset):
+        self.reads += 1
+        self.dout = self.mem[self.addr(offset)]
+        return self.dout
+
+    def write(self, offset, data):
+        self.writes += 1
+        addr = self.addr(offset)
+        if( self.program_and ):
+            data &= self.mem[addr]
+        self.mem[addr] = data
+
+    def dump(self, offset=0, length=None):
+        """ Memory from offset, like SpiMemory.dump() """
+        if( length is None ):
+            length = self.memsize - offset
+        if( isinstance(self.mem, PagedMemory) ):
+            return self.mem.read(offset, length)
+        return memoryview(self.mem)[offset:offset + length]
+
+
+class SpraidTLM:
+    """ wb_spraid without the clock
+
+    read() and write() take the same addresses as the Wishbone bus and act
+    on the drives right away. Accesses to window offsets go through the RAID
+    layout picked in SPRAID_RAID_TYPE, with the same flags, counters and
+    degraded drive handling as raid.v. Accesses the RTL never acks raise
+    ValueError instead of hanging. Drives are sized from their JEDEC IDs, as
+    a build with DRIVE_PROBE set finds them.
+
+    The engines that run the array on their own, offload, migration and the
+    hot spare rebuild, run to the end in the access that starts them, which
+    is where the RTL is once it is done. The stream port moves a word per
+    data access, write coalescing holds full word writes and flushes them by
+    the same rules as coalesce.v, with its merge window timed on cycles, and
+    drives go to sleep after the power-down timeout the same way.
+
+    cycles counts the clock cycles the RTL would have taken, from the
+    estimates below, and last_cycles has those of the last access. Engines
+    add the cycles they run for. idle() moves the count on for time spent
+    elsewhere, which matters for read streams, merge windows and power-down
+    timing out. engine_runs counts engines run to the end.
+    """
+
+    # Estimated clock cycles. The SPI clock is a quarter of the system clock
+    # in spi32.v, and flash_ctl.v sends write enable before every write
+    cycles_byte = 34        # 8 SPI bits, and handing the next byte over
+    cycles_frame = 10       # Loading spi32, chip select either side
+    cycles_array = 6        # raid.v and spraid.v states and output registers
+    cycles_bus = 3          # Wishbone ack after the array is done
+    cycles_reg = 3          # Register access
+    cycles_arb = 2          # wb_arbiter grant and the idle cycle after it
+
+    def __init__(self, drives, copy=False, pipeline=0, spare=None, ports=0):
+        """
+        :param drives: four parts or SPI models, see TlmDrive
+        :param copy: start from copies of the models' memories
+        :param pipeline: RAID_PIPELINE of the RTL, adds to read latency
+        :param spare: part or model on the spare port, None without HOT_SPARE
+        :param ports: ports of wb_spraid_mp, 0 for wb_spraid on its own
+        """
+        if( len(drives) != 4 ):
+            raise ValueError('SpraidTLM: Needs 4 drives, not %d' % (len(drives)))
+        if( ports > 2 ):
+            raise ValueError('SpraidTLM: Counters of %d ports run into the health registers' % (ports))
+        self.phys = [ TlmDrive(part, copy) for part in drives ]
+        self.spare = TlmDrive(spare, copy) if spare is not None else None
+        self.pipeline = pipeline
+        self.ports = ports
+        self.reset()
+
+    def reset(self):
+        """ Registers as they are after wb_rst_i, drive contents are kept """
+        self.raid_type = RAID0
+        self.err = 0
+        self.parity = 0
+        self.ecc_double = 0
+
+        self.perf_full_writes = 0
+        self.perf_rmw_writes = 0
+        self.perf_rcw_writes = 0
+        self.perf_drive_ops = 0
+        self.ecc_corrected = 0
+        self.ecc_uncorrected = 0
+
+        self.xip_timeout = 0
+        self.xip_reads = 0
+
+        self.health_threshold = 0
+        self.degraded = 0
+        self.health_ewma = [0] * 4      # 4 fraction bits, like drive_health.v
+        self.health_max = [0] * 4
+
+        self.raid10_sel = 0
+
+        # stream_port.v
+        self.stream_addr = 0
+        self.stream_left = 0
+        self.stream_host_left = 0
+        self.stream_armed = False
+        self.stream_run = False
+        self.stream_dir_read = False
+        self.stream_fifo = []
+
+        # offload.v
+        self.offload_addr = 0
+        self.offload_len = 0
+        self.offload_value = 0
+        self.offload_cmd = 0
+        self.offload_result = 0
+        self.offload_mismatch_addr = 0xFFFFFFFF
+        self.offload_mismatch = 0
+
+        # migrate.v
+        self.migrate_target = 0
+        self.migrate_len = SPRAID_MEM_WORDS
+        self.migrate_throttle = 16
+        self.migrate_mark = 0
+        self.migrate_split = 0
+
+        # coalesce.v, the held run and when the last write joined it
+        self.coalesce_window = 0
+        self.coalesce_writes = 0
+        self.coalesce_bursts = 0
+        self.coalesce_base = 0
+        self.coalesce_words = []
+        self.coalesce_at = 0
+
+        # rebuild.v, and the slot the spare stands in for. Without the spare
+        # port it isn't there and its registers read as zero
+        self.spare_armed = 0
+        self.rebuild_throttle = 16 if self.spare is not None else 0
+        self.rebuild_mark = 0
+        self.spare_in = 0
+        self.spare_slot = 0
+        self.drives = list(self.phys)
+
+        # Deep power-down, per slot
+        self.pd_timeout = 0
+        self.keep_awake = 0
+        self.wake_time = [256] * 4
+        self.wake_count = [0] * 4
+        self.wake_stall = [0] * 4
+
+        # wb_arbiter.v counters, per port
+        self.arb_ops = [0] * self.ports
+        self.arb_total = [0] * self.ports
+        self.arb_max = [0] * self.ports
+
+        self.engine_runs = 0
+        self.cycles = 0
+        self.last_cycles = 0
+        for drive in self.phys + ([ self.spare ] if self.spare else []):
+            drive.xip_next = None
+            drive.asleep = False
+            drive.idle_at = 0
+
+    def idle(self, cycles):
+        """ Clock cycles without a bus access """
+        self.cycles += cycles
+
+    @property
+    def status(self):
+        """ SPRAID_STATUS. Nothing but the stream runs between accesses, so never busy """
+        return (self.err * STATUS_ERR) | (self.parity * STATUS_PARITY) | \
+            (STATUS_STREAM if self.stream_running else 0) | (self.offload_mismatch * STATUS_MISMATCH) | \
+            (self.ecc_double * STATUS_ECC_DOUBLE) | (STATUS_DEGRADED if self.degraded else 0) | \
+            (STATUS_COALESCE if self.coalesce_words else 0)
+
+    @property
+    def stream_running(self):
+        """ Stream port owns the array, window accesses wait for it """
+        return self.stream_armed or self.stream_run
+
+    @property
+    def min_density(self):
+        return min( drive.density for drive in self.drives )
+
+    @property
+    def word_bytes(self):
+        return _data_bytes(self.raid_type)
+
+    @property
+    def usable_words(self):
+        if( (self.min_density >= 16) or ((1 << self.min_density) > SPRAID_MEM_WORDS) ):
+            return SPRAID_MEM_WORDS
+        return 1 << self.min_density
+
+
+    # Bus side
+
+    def read(self, addr):
+        """ Wishbone read, the data the bus returns """
+        self._tick()
+        if( self._arb_stat(addr) ):
+            return self._arb_read(addr)
+
+        if( (addr >= WB_ADDR_BASE) and (addr < WB_ADDR_BASE + SPRAID_MEM_WORDS) ):
+            self._coalesce_read(addr - WB_ADDR_BASE)
+            data = self._window_read(addr - WB_ADDR_BASE)
+        else:
+            self._register()
+            data = self._register_read(addr)
+        self._arb_count()
+        self._rebuild()
+        return data
+
+    def write(self, addr, data, sel=0xF):
+        """ Wishbone write, sel picks the byte lanes of window writes """
+        self._tick()
+        if( self._arb_stat(addr) ):
+            self._arb_clear(addr)
+            return
+
+        if( (addr >= WB_ADDR_BASE) and (addr < WB_ADDR_BASE + SPRAID_MEM_WORDS) ):
+            if( not self._coalesce_take(addr - WB_ADDR_BASE, data, sel) ):
+                self._window_write(addr - WB_ADDR_BASE, data, sel)
+        else:
+            # Held writes go out before any register write
+            self._register()
+            self.flush()
+            self._register_write(addr, data)
+        self._arb_count()
+        self._rebuild()
+
+    def flush(self):
+        """ Write out the coalesced run held, if any """
+        if( len(self.coalesce_words) == 0 ):
+            return
+        self._array_burst(self.coalesce_base, self.coalesce_words)
+        self.coalesce_bursts += 1
+        self.coalesce_words = []
+
+    def _register(self):
+        # Register accesses take the same few cycles whatever they are
+        self.last_cycles = self.cycles_reg
+        self.cycles += self.cycles_reg
+
+    def _register_read(self, addr):
+        if( addr == SPRAID_RAID_TYPE ):
+            return self.raid_type
+        if( addr == SPRAID_STATUS ):
+            return self.status
+        if( addr == SPRAID_STREAM_ADDR ):
+            return self.stream_addr
+        if( addr == SPRAID_STREAM_LEN ):
+            return self.stream_left
+        if( addr == SPRAID_STREAM_DATA ):
+            return self._stream_read()
+        if( addr == SPRAID_OFFLOAD_ADDR ):
+            return self.offload_addr
+        if( addr == SPRAID_OFFLOAD_LEN ):
+            return self.offload_len
+        if( addr == SPRAID_OFFLOAD_VALUE ):
+            return self.offload_value
+        if( addr == SPRAID_OFFLOAD_CMD ):
+            return self.offload_cmd
+        if( addr == SPRAID_OFFLOAD_RESULT ):
+            return self.offload_result
+        if( addr == SPRAID_OFFLOAD_MISMATCH ):
+            return self.offload_mismatch_addr
+        if( addr == SPRAID_PERF_FULL_WR ):
+            return self.perf_full_writes & 0xFFFFFFFF
+        if( addr == SPRAID_PERF_RMW_WR ):
+            return self.perf_rmw_writes & 0xFFFFFFFF
+        if( addr == SPRAID_PERF_RCW_WR ):
+            return self.perf_rcw_writes & 0xFFFFFFFF
+        if( addr == SPRAID_PERF_DRIVE_OPS ):
+            return self.perf_drive_ops & 0xFFFFFFFF
+        if( addr == SPRAID_MIGRATE_TARGET ):
+            return (self.migrate_split << 30) | self.migrate_target
+        if( addr == SPRAID_MIGRATE_LEN ):
+            return self.migrate_len
+        if( addr == SPRAID_MIGRATE_THROTTLE ):
+            return self.migrate_throttle
+        if( addr == SPRAID_MIGRATE_MARK ):
+            return self.migrate_mark
+        if( addr == SPRAID_ECC_CORRECTED ):
+            return self.ecc_corrected & 0xFFFFFFFF
+        if( addr == SPRAID_ECC_UNCORRECTED ):
+            return self.ecc_uncorrected & 0xFFFFFFFF
+        if( addr == SPRAID_HEALTH_THRESHOLD ):
+            return self.health_threshold
+        if( addr == SPRAID_HEALTH_DEGRADED ):
+            return self.degraded
+        if( (addr >= SPRAID_HEALTH_EWMA) and (addr < SPRAID_HEALTH_EWMA + 4) ):
+            return (self.health_ewma[addr - SPRAID_HEALTH_EWMA] >> 4) & 0xFFFF
+        if( (addr >= SPRAID_HEALTH_MAX) and (addr < SPRAID_HEALTH_MAX + 4) ):
+            return self.health_max[addr - SPRAID_HEALTH_MAX]
+        if( addr == SPRAID_COALESCE_WINDOW ):
+            return self.coalesce_window
+        if( addr == SPRAID_COALESCE_WRITES ):
+            return self.coalesce_writes & 0xFFFFFFFF
+        if( addr == SPRAID_COALESCE_BURSTS ):
+            return self.coalesce_bursts & 0xFFFFFFFF
+        if( addr == SPRAID_XIP_TIMEOUT ):
+            return self.xip_timeout
+        if( addr == SPRAID_XIP_READS ):
+            return self.xip_reads & 0xFFFFFFFF
+        if( (addr >= SPRAID_DRIVE_ID) and (addr < SPRAID_DRIVE_ID + 4) ):
+            return self.drives[addr - SPRAID_DRIVE_ID].jedec_id
+        if( (addr >= SPRAID_DRIVE_CAPS) and (addr < SPRAID_DRIVE_CAPS + 4) ):
+            drive = self.drives[addr - SPRAID_DRIVE_CAPS]
+            return (0x03 << 24) | (drive.addr_bytes << 8) | drive.density
+        if( addr == SPRAID_GEOMETRY ):
+            return (self.min_density << 19) | (self.word_bytes << 16) | self.usable_words
+        if( addr == SPRAID_CAPACITY ):
+            return self.usable_words * self.word_bytes
+        if( addr == SPRAID_SPARE_CTRL ):
+            return (self.rebuild_throttle << 16) | self.spare_armed
+        if( addr == SPRAID_SPARE_STATUS ):
+            return ((self.spare is not None) << 8) | (self.spare_slot << 4) | (self.spare_in << 2) | \
+                self.spare_armed
+        if( addr == SPRAID_REBUILD_MARK ):
+            return self.rebuild_mark
+        if( addr == SPRAID_POWER_CTRL ):
+            asleep = sum( drive.asleep << n for n, drive in enumerate(self.drives) )
+            return (asleep << 20) | (self.keep_awake << 16) | self.pd_timeout
+        if( (addr >= SPRAID_WAKE_TIME) and (addr < SPRAID_WAKE_TIME + 4) ):
+            return self.wake_time[addr - SPRAID_WAKE_TIME]
+        if( (addr >= SPRAID_WAKE_COUNT) and (addr < SPRAID_WAKE_COUNT + 4) ):
+            return self.wake_count[addr - SPRAID_WAKE_COUNT] & 0xFFFFFFFF
+        if( (addr >= SPRAID_WAKE_STALL) and (addr < SPRAID_WAKE_STALL + 4) ):
+            return self.wake_stall[addr - SPRAID_WAKE_STALL] & 0xFFFFFFFF
+        raise ValueError('SpraidTLM: No register at %08x' % (addr))
+
+    def _register_write(self, addr, data):
+        if( addr == SPRAID_RAID_TYPE ):
+            self.raid_type = data & 0xFF
+            self.migrate_split = 0
+        elif( addr == SPRAID_STREAM_ADDR ):
+            if( not self.stream_running ):
+                self.stream_addr = data
+            self._wake_all()
+        elif( addr == SPRAID_STREAM_LEN ):
+            self._stream_start(data & 0xFFFF)
+        elif( addr == SPRAID_STREAM_DATA ):
+            self._stream_write(data)
+        elif( addr == SPRAID_OFFLOAD_ADDR ):
+            self.offload_addr = data
+            self._wake_all()
+        elif( addr == SPRAID_OFFLOAD_LEN ):
+            self.offload_len = data & 0xFFFF
+        elif( addr == SPRAID_OFFLOAD_VALUE ):
+            self.offload_value = data
+        elif( addr == SPRAID_OFFLOAD_CMD ):
+            if( (data & 0x3) and not self.stream_running ):
+                self._offload(data & 0x3)
+        elif( addr == SPRAID_MIGRATE_TARGET ):
+            if( not self.stream_running and not self.migrate_split ):
+                self._migrate(data & 0xF)
+        elif( addr == SPRAID_MIGRATE_LEN ):
+            self.migrate_len = data & 0xFFFF
+        elif( addr == SPRAID_MIGRATE_THROTTLE ):
+            self.migrate_throttle = data & 0xFFFF
+        elif( addr == SPRAID_HEALTH_THRESHOLD ):
+            self.health_threshold = data & 0xFFFF
+        elif( addr == SPRAID_HEALTH_DEGRADED ):
+            self.degraded = data & 0xF
+        elif( (addr >= SPRAID_HEALTH_MAX) and (addr < SPRAID_HEALTH_MAX + 4) ):
+            self.health_max[addr - SPRAID_HEALTH_MAX] = 0
+        elif( addr == SPRAID_COALESCE_WINDOW ):
+            self.coalesce_window = data & 0xFFFF
+        elif( addr == SPRAID_XIP_TIMEOUT ):
+            self.xip_timeout = data & 0xFFFF
+        elif( addr == SPRAID_SPARE_CTRL ):
+            # Without the spare port the engine isn't there, the write is
+            # only acked. Once in a slot the spare can't be disarmed
+            if( self.spare is not None ):
+                self.rebuild_throttle = (data >> 16) & 0xFFFF
+                if( not self.spare_in ):
+                    self.spare_armed = data & 1
+        elif( addr == SPRAID_POWER_CTRL ):
+            self.pd_timeout = data & 0xFFFF
+            self.keep_awake = (data >> 16) & 1
+            if( self.keep_awake ):
+                self._wake_all()
+        elif( (addr >= SPRAID_WAKE_TIME) and (addr < SPRAID_WAKE_TIME + 4) ):
+            self.wake_time[addr - SPRAID_WAKE_TIME] = data & 0xFFFF
+        elif( (addr >= SPRAID_WAKE_COUNT) and (addr < SPRAID_WAKE_STALL + 4) ):
+            # Either register clears both counters of the slot
+            n = (addr - SPRAID_WAKE_COUNT) % 4
+            self.wake_count[n] = 0
+            self.wake_stall[n] = 0
+        elif( addr in READ_ONLY ):
+            raise ValueError('SpraidTLM: Register at %08x is read only' % (addr))
+        else:
+            raise ValueError('SpraidTLM: No register at %08x' % (addr))
+
+
+    # Multi port front end, wb_arbiter.v. Only port 0 is used here
+
+    def _arb_stat(self, addr):
+        return (addr >= SPRAID_ARB_STAT) and (addr < SPRAID_ARB_STAT + 4 * self.ports)
+
+    def _arb_read(self, addr):
+        self.last_cycles = self.cycles_arb
+        self.cycles += self.last_cycles
+        port, n = divmod(addr - SPRAID_ARB_STAT, 4)
+        return ( self.arb_ops, self.arb_total, self.arb_max, [0] * self.ports )[n][port] & 0xFFFFFFFF
+
+    def _arb_clear(self, addr):
+        self.last_cycles = self.cycles_arb
+        self.cycles += self.last_cycles
+        port = (addr - SPRAID_ARB_STAT) >> 2
+        self.arb_ops[port] = 0
+        self.arb_total[port] = 0
+        self.arb_max[port] = 0
+
+    def _arb_count(self):
+        if( self.ports == 0 ):
+            return
+        self.last_cycles += self.cycles_arb
+        self.cycles += self.cycles_arb
+        self.arb_ops[0] += 1
+        self.arb_total[0] += self.last_cycles
+        self.arb_max[0] = max(self.arb_max[0], self.last_cycles)
+
+
+    # Engines
+
+    def _tick(self):
+        """ What happened on its own since the last access """
+        if( self.coalesce_words and ( (self.coalesce_window == 0) or
+                (self.cycles - self.coalesce_at >= self.coalesce_window) ) ):
+            # Merge window ran out, the run went out back then
+            now = self.cycles
+            self.cycles = self.coalesce_at + self.coalesce_window
+            self.flush()
+            self.cycles = max(now, self.cycles)
+        self._sleep()
+
+    def _stream_start(self, length):
+        if( self.stream_running ):
+            return
+        self.stream_left = length
+        self.stream_host_left = length
+        self.stream_fifo = []
+        self.stream_armed = (length != 0)
+        if( self.stream_armed ):
+            self._wake_all()
+
+    def _stream_end(self):
+        if( self.stream_run and (self.stream_left == 0) ):
+            self.stream_run = False
+            self.engine_runs += 1
+
+    def _stream_write(self, data):
+        # The direction is set by the first data access. Anything else is
+        # acked and dropped
+        if( self.stream_armed ):
+            self.stream_armed = False
+            self.stream_run = True
+            self.stream_dir_read = False
+        elif( not (self.stream_run and not self.stream_dir_read) ):
+            return
+        if( self.stream_host_left == 0 ):
+            return
+        self.stream_host_left -= 1
+        self._engine_write(self.stream_addr, data)
+        self.stream_addr = (self.stream_addr + 1) & 0xFFFFFFFF
+        self.stream_left -= 1
+        self._stream_end()
+
+    def _stream_read(self):
+        if( self.stream_armed ):
+            self.stream_armed = False
+            self.stream_run = True
+            self.stream_dir_read = True
+        if( not self.stream_dir_read ):
+            return 0
+        self._stream_prefetch()
+        if( len(self.stream_fifo) == 0 ):
+            return 0
+        data = self.stream_fifo.pop(0)
+        self._stream_prefetch()
+        return data
+
+    def _stream_prefetch(self):
+        # The RTL keeps its FIFO full while the stream runs
+        while( self.stream_run and (self.stream_left != 0) and (len(self.stream_fifo) < STREAM_FIFO_WORDS) ):
+            self.stream_fifo.append(self._engine_read(self.stream_addr))
+            self.stream_addr = (self.stream_addr + 1) & 0xFFFFFFFF
+            self.stream_left -= 1
+        self._stream_end()
+
+    def _offload(self, cmd):
+        self.offload_cmd = cmd
+        self.offload_result = 0
+        self.offload_mismatch = 0
+        self.offload_mismatch_addr = 0xFFFFFFFF
+        self._wake_all()
+
+        # Runs from copies, the range registers keep what was programmed
+        addr = self.offload_addr
+        crc = 0
+        for i in range(self.offload_len):
+            if( cmd == OFFLOAD_FILL ):
+                self._engine_write(addr, self.offload_value)
+            else:
+                data = self._engine_read(addr)
+                # Only the data bytes of the layout count
+                nbytes = _data_bytes(self._layout(addr))
+                mask = (1 << (8 * nbytes)) - 1
+                if( (cmd == OFFLOAD_COMPARE) and ((data ^ self.offload_value) & mask) ):
+                    self.offload_result = 1
+                    self.offload_mismatch = 1
+                    self.offload_mismatch_addr = addr
+                    break
+                if( cmd == OFFLOAD_CRC32 ):
+                    crc = zlib.crc32(data.to_bytes(4, 'little')[:nbytes], crc)
+                    self.cycles += nbytes
+            addr = (addr + 1) & 0xFFFFFFFF
+        else:
+            if( cmd == OFFLOAD_CRC32 ):
+                self.offload_result = crc
+        self.engine_runs += 1
+
+    def _migrate(self, target):
+        self.migrate_target = target
+        self._wake_all()
+
+        # Each word read back with the old layout and written with the new
+        self.migrate_mark = 0
+        while( self.migrate_mark != self.migrate_len ):
+            data = self._engine_read(self.migrate_mark)
+            self._engine_write(self.migrate_mark, data, target)
+            self.migrate_mark += 1
+            self.cycles += self.migrate_throttle
+
+        # Short of the whole window the array stays split at the mark
+        if( self.migrate_mark >= SPRAID_MEM_WORDS ):
+            self.raid_type = target
+        else:
+            self.migrate_split = int(self.migrate_mark != 0)
+        self.engine_runs += 1
+
+    def _layout(self, offset):
+        # RAID type the word at offset is held in
+        if( self.migrate_split and ((offset & 0x7FF) < self.migrate_mark) ):
+            return self.migrate_target
+        return self.raid_type
+
+    def _rebuild(self):
+        """ Spare takes over a single degraded drive, then it is rebuilt """
+        skip = self.degraded
+        if( (self.spare is None) or not self.spare_armed or self.spare_in or (skip == 0) or
+                (skip & (skip - 1)) or ((self.raid_type & 0xF) not in (RAID1, RAID5, RAID10)) or
+                self.stream_running or self.coalesce_words ):
+            return
+
+        slot = (skip & -skip).bit_length() - 1
+        self.spare_in = 1
+        self.spare_armed = 0
+        self.spare_slot = slot
+        self.health_ewma[slot] = 0
+        self.health_max[slot] = 0
+        self.drives[slot] = self.spare
+        self.spare.xip_next = None
+        self._wake_all()
+
+        # Read around the degraded slot, written back onto the spare with
+        # the rest of the stripe
+        self.rebuild_mark = 0
+        while( self.rebuild_mark != self.usable_words ):
+            data = self._engine_read(self.rebuild_mark)
+            self._engine_write(self.rebuild_mark, data)
+            self.rebuild_mark += 1
+            self.cycles += self.rebuild_throttle
+        self.degraded = 0
+        self.engine_runs += 1
+
+    def _engine_read(self, offset):
+        # Engine accesses run in the background, the bus access is the
+        # register one
+        last = self.last_cycles
+        data = self._array_read(offset & 0xFFFFFFFF)
+        self.last_cycles = last
+        return data
+
+    def _engine_write(self, offset, data, raid_type=None):
+        last = self.last_cycles
+        self._array_write(offset & 0xFFFFFFFF, data, 0xF, raid_type)
+        self.last_cycles = last
+
+    def _array_burst(self, offset, words):
+        # Every layout keeps word n at offset n on each drive, so a run is a
+        # single write command per drive, counted as one operation
+        raid_type = self._layout(offset) & 0xF
+        if( raid_type not in (RAID0, RAID1, RAID5, RAID10, ECC) ):
+            raise ValueError('SpraidTLM: RAID type %d hangs the array' % (raid_type))
+        if( raid_type == RAID5 ):
+            self.perf_full_writes += 1
+        b = stripe(raid_type, words)
+        self.cycles += self.cycles_array + self._drive_writes(0xF, offset, b[0], b[1:])
+
+
+    # Write coalescing, coalesce.v
+
+    def _coalesce_take(self, offset, data, sel):
+        """ Merge a window write into the held run
+
+        :return: True if it was taken
+        """
+        words = self.coalesce_words
+        in_run = (offset >= self.coalesce_base) and (offset < self.coalesce_base + len(words))
+        next_in_run = (offset == self.coalesce_base + len(words)) and (len(words) != 4)
+        if( (self.coalesce_window == 0) or (sel != 0xF) or self.stream_running or
+                not ( (len(words) == 0) or in_run or next_in_run ) ):
+            # Has to wait for the run to go out first
+            self.flush()
+            return False
+
+        if( len(words) == 0 ):
+            self.coalesce_base = offset
+        if( in_run ):
+            words[offset - self.coalesce_base] = data
+        else:
+            words.append(data)
+            self.coalesce_writes += 1
+        self._wake_all()
+
+        self.last_cycles = self.cycles_reg
+        self.cycles += self.last_cycles
+        self.coalesce_at = self.cycles
+        if( len(words) == 4 ):
+            # A full run goes out as soon as the bus lets go
+            self.flush()
+            self.engine_runs += 1
+        return True
+
+    def _coalesce_read(self, offset):
+        # A read of a held offset waits for the run to go out
+        if( (offset >= self.coalesce_base) and (offset < self.coalesce_base + len(self.coalesce_words)) ):
+            self.flush()
+
+
+    # Power management, flash_ctl.v
+
+    def _sleep(self):
+        """ Drives idle for the power-down timeout are asleep by now """
+        if( (self.pd_timeout == 0) or self.keep_awake or self.stream_running or self.coalesce_words ):
+            return
+        for drive in self.drives:
+            idle_at = drive.idle_at
+            if( drive.xip_next is not None ):
+                # An open read stream keeps the part awake until it times out
+                idle_at = max(idle_at, drive.xip_idle_at + self.xip_timeout)
+            if( not drive.asleep and
+                    (self.cycles >= idle_at + self.pd_timeout + self.cycles_frame + self.cycles_byte) ):
+                drive.asleep = True
+                drive.xip_next = None
+
+    def _wake(self, n, request):
+        """ Wake the drive in slot n
+
+        :return: cycles a request waits for it
+        """
+        drive = self.drives[n]
+        if( not drive.asleep ):
+            return 0
+        drive.asleep = False
+        self.wake_count[n] += 1
+        cycles = self.cycles_frame + self.cycles_byte + self.wake_time[n]
+        if( not request ):
+            drive.idle_at = self.cycles + cycles
+            return 0
+        self.wake_stall[n] += cycles
+        return cycles
+
+    def _wake_all(self):
+        for n in range(4):
+            self._wake(n, False)
+
+
+    # Drives
+
+    def _skip(self):
+        # Only a single degraded drive is read around
+        return self.degraded if (self.degraded & (self.degraded - 1)) == 0 else 0
+
+    def _health(self, latency):
+        """ drive_health.v, for the busy cycles of each drive in an operation """
+        over = 0
+        for n, cycles in latency.items():
+            cycles = min(cycles, 0xFFFF)
+            ewma = self.health_ewma[n]
+            ewma = (ewma - (ewma >> 3) + (cycles << 1)) & 0xFFFFF
+            self.health_ewma[n] = ewma
+            self.health_max[n] = max(self.health_max[n], cycles)
+            if( (self.health_threshold != 0) and ((ewma >> 4) > self.health_threshold) ):
+                over |= 1 << n
+        if( (self.degraded == 0) and (over != 0) ):
+            # Lowest numbered drive over the threshold
+            self.degraded = over & -over
+
+    def _drive_reads(self, en, offset):
+        """ Read offset on the drives in en
+
+        :return: the byte from every drive, stale for drives not in en, and
+            the cycles until the slowest one is done
+        """
+        latency = {}
+        for n, drive in enumerate(self.drives):
+            if( not (en >> n) & 1 ):
+                continue
+            wake = self._wake(n, True)
+            addr = drive.addr(offset)
+            if( (self.xip_timeout != 0) and (drive.xip_next == addr) and
+                    (self.cycles - drive.xip_idle_at < self.xip_timeout) ):
+                # Stream carries on, one more byte
+                self.xip_reads += 1
+                cycles = self.cycles_frame + self.cycles_byte
+            elif( drive.addr_bytes > 2 ):
+                # Command and address frame, then the data byte
+                cycles = 2 * self.cycles_frame + 5 * self.cycles_byte
+            else:
+                cycles = self.cycles_frame + 4 * self.cycles_byte
+            cycles += wake
+            drive.read(offset)
+            drive.xip_next = ((addr + 1) & drive.addr_mask) if self.xip_timeout != 0 else None
+            drive.xip_idle_at = self.cycles + cycles
+            drive.idle_at = self.cycles + cycles
+            latency[n] = cycles
+        self.perf_drive_ops += _bits(en)
+        self._health(latency)
+        return [ drive.dout for drive in self.drives ], max(latency.values(), default=0)
+
+    def _drive_writes(self, en, offset, data, burst=()):
+        """ Write byte data[n] at offset on drive n, for the drives in en,
+        and the bytes of each of burst at the offsets after it in the same
+        command
+
+        :return: the cycles until the slowest one is done
+        """
+        # Write enable frame, the command and address frame, and with 3
+        # address bytes the data byte in a frame of its own
+        cycles = 2 * self.cycles_frame + (5 + len(burst)) * self.cycles_byte
+        latency = {}
+        for n, drive in enumerate(self.drives):
+            if( not (en >> n) & 1 ):
+                continue
+            latency[n] = cycles + self._wake(n, True)
+            drive.write(offset, int(data[n]))
+            for i, more in enumerate(burst):
+                drive.write(offset + 1 + i, int(more[n]))
+            drive.xip_next = None
+            if( drive.addr_bytes > 2 ):
+                latency[n] += self.cycles_frame + self.cycles_byte
+            drive.idle_at = self.cycles + latency[n]
+        self.perf_drive_ops += _bits(en)
+        self._health(latency)
+        return max(latency.values(), default=0)
+
+
+    # Array, raid.v
+
+    def _window_read(self, offset):
+        if( self.stream_running ):
+            raise ValueError('SpraidTLM: Window read at %d waits for the stream port forever' % (offset))
+        return self._array_read(offset)
+
+    def _window_write(self, offset, data, sel):
+        if( self.stream_running ):
+            raise ValueError('SpraidTLM: Window write at %d waits for the stream port forever' % (offset))
+        self._array_write(offset, data, sel)
+
+    def _array_read(self, offset, raid_type=None):
+        raid_type = (self._layout(offset) if raid_type is None else raid_type) & 0xF
+        skip = self._skip()
+
+        if( raid_type == RAID10 ):
+            # Reads alternate between the halves of the mirrors, unless one
+            # half has a degraded drive
+            if( skip & 0b0101 ):
+                en = 0b1010
+                self.raid10_sel = 0
+            elif( skip & 0b1010 ):
+                en = 0b0101
+                self.raid10_sel = 1
+            else:
+                en = 0b1010 if self.raid10_sel else 0b0101
+                self.raid10_sel ^= 1
+        elif( (raid_type == RAID1) or (raid_type == RAID5) ):
+            en = ~skip & 0xF
+        elif( (raid_type == RAID0) or (raid_type == ECC) ):
+            en = 0xF
+        else:
+            raise ValueError('SpraidTLM: RAID type %d hangs the array' % (raid_type))
+
+        b, cycles = self._drive_reads(en, offset)
+        self.last_cycles = self.cycles_bus + self.cycles_array + self.pipeline + cycles
+        self.cycles += self.last_cycles
+        raw = b[0] | (b[1] << 8) | (b[2] << 16) | (b[3] << 24)
+
+        if( raid_type == RAID0 ):
+            return raw
+
+        if( raid_type == RAID1 ):
+            # Drives read are compared against the first one read
+            ref = b[1] if skip & 1 else b[0]
+            if( all( (skip >> n) & 1 or b[n] == ref for n in range(4) ) ):
+                return ref
+            self.err = 1
+            return 0xFFFFFFFF
+
+        if( raid_type == RAID5 ):
+            # A degraded data drive is rebuilt from the others and parity
+            d = b[0:3]
+            for n in range(3):
+                if( (skip >> n) & 1 ):
+                    d[n] = b[0] ^ b[1] ^ b[2] ^ b[3] ^ b[n]
+            self.parity = int( (skip == 0) and ((b[0] ^ b[1] ^ b[2] ^ b[3]) != 0) )
+            return d[0] | (d[1] << 8) | (d[2] << 16)
+
+        if( raid_type == RAID10 ):
+            if( self.raid10_sel ):
+                return b[0] | (b[2] << 8)
+            return b[1] | (b[3] << 8)
+
+        data, single, double = ecc_decode(raw)
+        self.ecc_double = int(double)
+        self.ecc_corrected += int(single)
+        self.ecc_uncorrected += int(double)
+        return int(data)
+
+    def _array_write(self, offset, data, sel, raid_type=None):
+        raid_type = (self._layout(offset) if raid_type is None else raid_type) & 0xF
+        if( raid_type not in (RAID0, RAID1, RAID5, RAID10, ECC) ):
+            raise ValueError('SpraidTLM: RAID type %d hangs the array' % (raid_type))
+
+        # Only the drives holding the lanes written, none of them and the
+        # drives are left alone
+        en = 0xF
+        if( (sel & HELD_LANES[raid_type]) == 0 ):
+            self.last_cycles = self.cycles_bus + self.cycles_array
+            self.cycles += self.last_cycles
+            return
+        elif( raid_type == RAID0 ):
+            en = sel
+        elif( raid_type == RAID10 ):
+            en = (0b0011 if sel & 1 else 0) | (0b1100 if sel & 2 else 0)
+        elif( raid_type == RAID5 ):
+            lanes = sel & 0x7
+            if( (lanes != 0) and (lanes != 0x7) ):
+                self._raid5_partial(offset, data, lanes)
+                return
+            self.perf_full_writes += 1
+        elif( (raid_type == ECC) and ((sel & 0x7) != 0x7) ):
+            self._ecc_partial(offset, data, sel & 0x7)
+            return
+
+        cycles = self._drive_writes(en, offset, stripe(raid_type, data)[0])
+        self.last_cycles = self.cycles_bus + self.cycles_array + cycles
+        self.cycles += self.last_cycles
+
+    def _raid5_partial(self, offset, data, lanes):
+        # Read-modify-write reads the lanes written and parity, reconstruct-
+        # write the other lanes. Fewer reads wins, read-modify-write on a
+        # tie, and neither reads a degraded drive if it can help it
+        skip = self._skip()
+        touched = _bits(lanes)
+        rmw_avoid = (skip & 0x8) or (skip & lanes & 0x7)
+        rcw_avoid = skip & ~lanes & 0x7
+        if( rmw_avoid ):
+            use_rmw = False
+        elif( rcw_avoid ):
+            use_rmw = True
+        else:
+            use_rmw = touched + 1 <= 3 - touched
+
+        if( use_rmw ):
+            pre = 0x8 | lanes
+            self.perf_rmw_writes += 1
+        else:
+            pre = ~lanes & 0x7
+            self.perf_rcw_writes += 1
+        old, read_cycles = self._drive_reads(pre, offset)
+
+        new = [ (data >> (8 * n)) & 0xFF for n in range(3) ]
+        if( use_rmw ):
+            parity = old[3]
+            for n in range(3):
+                if( (lanes >> n) & 1 ):
+                    parity ^= old[n] ^ new[n]
+        else:
+            parity = 0
+            for n in range(3):
+                parity ^= new[n] if (lanes >> n) & 1 else old[n]
+
+        write_cycles = self._drive_writes(0x8 | lanes, offset, new + [parity])
+        self.last_cycles = self.cycles_bus + 2 * self.cycles_array + read_cycles + write_cycles
+        self.cycles += self.last_cycles
+
+    def _ecc_partial(self, offset, data, lanes):
+        # The codeword covers every lane, so it is read back and decoded,
+        # counted like any ECC read, and the new lanes merged in
+        b, read_cycles = self._drive_reads(0xF, offset)
+        old, single, double = ecc_decode(b[0] | (b[1] << 8) | (b[2] << 16) | (b[3] << 24))
+        self.ecc_double = int(double)
+        self.ecc_corrected += int(single)
+        self.ecc_uncorrected += int(double)
+
+        mask = sum( 0xFF << (8 * n) for n in range(3) if (lanes >> n) & 1 )
+        merged = (int(old) & ~mask) | (data & mask)
+        write_cycles = self._drive_writes(0xF, offset, stripe(ECC, merged)[0])
+        self.last_cycles = self.cycles_bus + 2 * self.cycles_array + read_cycles + write_cycles
+        self.cycles += self.last_cycles
+
+
+class LockstepError(Exception):
+    """ The RTL and the TLM disagree """
+    pass
+
+
+class Lockstep:
+    """ The RTL and the TLM side by side, in a cocotb test
+
+    Every access goes to wb_spraid over Wishbone and then to the TLM, and
+    what is read back has to match. The TLM starts with copies of the drive
+    models' memories, check_drives() compares them afterwards.
+
+    Engines run to the end on the TLM in the access that starts them, so
+    after such an access settle() polls the RTL status until it is done as
+    well. Some values depend on timing the TLM only estimates and aren't
+    compared: registers in APPROXIMATE, the busy bit of the status and the
+    drives asleep in SPRAID_POWER_CTRL, the registers in STREAM_TIMED and the
+    flags the stream's array accesses set while a stream runs, and the held
+    writes bit while write coalescing is on.
+
+    The TLM's cycle count is set from sim time before each access, so idle
+    time is the same on both, and the cycles each access took on the RTL are
+    kept next to the estimate. A mismatch raises a LockstepError, or with
+    strict=False is logged and counted in mismatches.
+    """
+
+    # Status bits of engines still running on the RTL
+    ENGINES = STATUS_STREAM | STATUS_OFFLOAD | STATUS_MIGRATE | STATUS_COALESCE | STATUS_REBUILD
+
+    # Cycles between status polls, and polls before giving up
+    settle_poll = 64
+    settle_limit = 1 << 16
+
+    def __init__(self, dut, wbs, models, period=10000, strict=True, pipeline=0, spare=None):
+        """
+        :param wbs: WishboneMaster on the RTL
+        :param models: SPI models on ports 0-3
+        :param period: wb_clk_i period in ns
+        :param spare: SPI model on the spare port, with HOT_SPARE set
+        """
+        self.dut = dut
+        self.wbs = wbs
+        self.models = models
+        self.spare = spare
+        self.period = period
+        self.strict = strict
+        self.tlm = SpraidTLM(models, copy=True, pipeline=pipeline, spare=spare)
+        self.mismatches = 0
+
+        # (estimated, RTL) cycles of each access, by kind
+        self.latency = { 'read': [], 'write': [], 'reg': [] }
+
+    def _now(self):
+        return int(get_sim_time('ns') // self.period)
+
+    def _mismatch(self, msg):
+        self.mismatches += 1
+        if( self.strict ):
+            raise LockstepError(msg)
+        self.dut._log.warning(msg)
+
+    def _kind(self, addr, is_read):
+        if( (addr >= WB_ADDR_BASE) and (addr < WB_ADDR_BASE + SPRAID_MEM_SZ) ):
+            return 'read' if is_read else 'write'
+        return 'reg'
+
+    def _mask(self, addr):
+        """ Bits of a register that are compared """
+        if( addr == SPRAID_STATUS ):
+            mask = ~STATUS_BUSY
+            if( self.tlm.stream_running ):
+                mask &= ~(STATUS_STREAM | STATUS_ERR | STATUS_PARITY | STATUS_ECC_DOUBLE)
+            if( self.tlm.coalesce_window != 0 ):
+                mask &= ~STATUS_COALESCE
+            return mask
+        if( addr == SPRAID_POWER_CTRL ):
+            return ~0xF00000
+        if( (addr in APPROXIMATE) or (self.tlm.stream_running and (addr in STREAM_TIMED)) ):
+            return 0
+        return ~0
+
+    async def read(self, addr):
+        start = self._now()
+        results = await self.wbs.send_cycle([WBOp(addr)])
+        rtl = int(results[0].datrd)
+        measured = self._now() - start
+
+        # Masked on the state before the access, a stream ended by it has
+        # run ahead on the RTL until now
+        mask = self._mask(addr)
+        runs = self.tlm.engine_runs
+        self.tlm.cycles = start
+        tlm = self.tlm.read(addr)
+        self.latency[self._kind(addr, True)].append( (self.tlm.last_cycles, measured) )
+
+        if( (rtl & mask) != (tlm & mask) ):
+            self._mismatch('Lockstep: Read of %08x is %08x on the RTL, %08x on the TLM' % (addr, rtl, tlm))
+        if( self.tlm.engine_runs != runs ):
+            await self.settle()
+        return rtl
+
+    async def write(self, addr, data, sel=0xF):
+        start = self._now()
+        self.dut.wb_we_i.value = 1
+        await self.wbs.send_cycle([WBOp(addr, data, 0, sel)])
+        self.dut.wb_we_i.value = 0
+        measured = self._now() - start
+
+        runs = self.tlm.engine_runs
+        self.tlm.cycles = start
+        self.tlm.write(addr, data, sel)
+        self.latency[self._kind(addr, False)].append( (self.tlm.last_cycles, measured) )
+        if( self.tlm.engine_runs != runs ):
+            await self.settle()
+
+    async def settle(self, flush=False):
+        """ Wait until the engines the TLM has run are done on the RTL too
+
+        The status polls go to both. With flush, coalesced writes held on
+        the TLM are written out, and the RTL waited on until its merge
+        window runs out too.
+        """
+        if( flush ):
+            self.tlm.flush()
+        for i in range(self.settle_limit):
+            start = self._now()
+            results = await self.wbs.send_cycle([WBOp(SPRAID_STATUS)])
+            self.tlm.cycles = start
+            self.tlm.read(SPRAID_STATUS)
+            running = int(results[0].datrd) & self.ENGINES & ~self.tlm.status
+            if( running == 0 ):
+                return
+            await ClockCycles(self.dut.wb_clk_i, self.settle_poll)
+        self._mismatch('Lockstep: Status engines %03x still running on the RTL' % (running))
+
+    def check_drives(self, length=SPRAID_MEM_SZ):
+        """ Compare the drives of the RTL and the TLM over the window, the
+        spare last. Held coalesced writes have to be settled first
+
+        :return: list of (drive, offset, rtl, tlm) for every byte that differs
+        """
+        pairs = list(zip(self.models, self.tlm.phys))
+        if( self.spare is not None ):
+            pairs.append( (self.spare, self.tlm.spare) )
+
+        mismatches = []
+        for n, (model, drive) in enumerate(pairs):
+            count = min(length, model.memsize)
+            rtl = np.frombuffer(bytes(model.dump(0, count)), dtype=np.uint8)
+            tlm = np.frombuffer(bytes(drive.dump(0, count)), dtype=np.uint8)
+            for offset in np.flatnonzero(rtl != tlm):
+                mismatches.append( (n, int(offset), int(rtl[offset]), int(tlm[offset])) )
+        for mismatch in mismatches[:8]:
+            self._mismatch('Lockstep: Drive %d offset %d is %02x on the RTL, %02x on the TLM' % mismatch)
+        return mismatches
+
+    def report(self):
+        """ Log how close the cycle estimates were, as RTL over estimate """
+        for kind, pairs in self.latency.items():
+            if( len(pairs) == 0 ):
+                continue
+            estimated = sum( p[0] for p in pairs )
+            measured = sum( p[1] for p in pairs )
+            self.dut._log.info("Lockstep %s: %d accesses, %.1f cycles estimated, %.1f on the RTL, ratio %.2f" %
+                (kind, len(pairs), estimated / len(pairs), measured / len(pairs), measured / max(estimated, 1)))
@@ -0,0 +1,120 @@
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles, Timer
+from cocotbext.spi import SpiSignals
+from .FM25C160B import FM25C160B
+
+
+# Same LFSR and seed as bench_top
+LFSR_SEED = 0xACE12345
+
+def lfsr_next(value):
+    return (value >> 1) ^ (0x80200003 if (value & 1) else 0)
+
+
+# Start a run and wait for it to finish
+async def bench_run(dut, raid_type, random, read_mix):
+    dut.cfg_raid_type.value = raid_type
+    dut.cfg_random.value = random
+    dut.cfg_read_mix.value = read_mix
+    dut.start.value = 1
+    await ClockCycles(dut.clk, 2)
+    dut.start.value = 0
+    await RisingEdge(dut.done)
+    await ClockCycles(dut.clk, 1)
+
+    cycles = dut.cycles.value.integer
+    ops = dut.ops.value.integer
+    reads = dut.reads.value.integer
+    writes = dut.writes.value.integer
+    cycles_per_op = dut.cycles_per_op.value.integer
+    dut._log.info("RAID type %d, random %d, read mix %d: %d cycles, %d ops (%d reads, %d writes), %d cycles per op"
+        % (raid_type, random, read_mix, cycles, ops, reads, writes, cycles_per_op))
+    return ( cycles, ops, reads, writes, cycles_per_op )
+
+
+@cocotb.test()
+async def test_bench_top(dut):
+
+    # raid type definitions
+    raid0 = 0x00000001
+    raid1 = 0x00000000
+    raid5 = 0x00000005
+
+    # Built with OPS_LOG2 = 5
+    nops = 32
+
+    # Setup FRAM models, SPI mode 0
+    flash = []
+    for i in range(4):
+        spi = SpiSignals(
+            sclk = getattr(dut, "spi%d_clk" % i),
+            mosi = getattr(dut, "spi%d_mosi" % i),
+            miso = getattr(dut, "spi%d_miso" % i),
+            cs   = getattr(dut, "spi%d_cs" % i)
+        )
+        flash.append( FM25C160B( spi, 0, dut ) )
+
+    # Start clock
+    clock = Clock(dut.clk, 10, units="us")
+    clk_thread = cocotb.start_soon(clock.start())
+
+    dut.spi0_miso.value = 0
+    dut.spi1_miso.value = 0
+    dut.spi2_miso.value = 0
+    dut.spi3_miso.value = 0
+    dut.start.value = 0
+    dut.cfg_raid_type.value = 0
+    dut.cfg_random.value = 0
+    dut.cfg_read_mix.value = 0
+    dut.reset.value = 1
+    await ClockCycles(dut.clk, 5)
+    dut.reset.value = 0
+    await ClockCycles(dut.clk, 5)
+
+    assert( dut.running.value == 0 )
+
+    # Sequential writes, RAID0 puts one byte of each word on each drive
+    dut._log.info("Sequential writes, RAID0")
+    cycles, ops, reads, writes, cycles_per_op = await bench_run(dut, raid0, 0, 0)
+    assert( ops == nops )
+    assert( writes == nops )
+    assert( reads == 0 )
+    assert( cycles_per_op == cycles // nops )
+
+    lfsr = LFSR_SEED
+    for i in range(nops):
+        expected = ((lfsr << 16) | (lfsr >> 16)) & 0xFFFFFFFF
+        word = 0
+        for drive in range(4):
+            word |= flash[drive].mem[i] << (8 * drive)
+        assert( word == expected )
+        lfsr = lfsr_next(lfsr)
+
+    # Sequential reads of the same words
+    dut._log.info("Sequential reads, RAID0")
+    cycles, ops, reads, writes, cycles_per_op = await bench_run(dut, raid0, 0, 8)
+    assert( ops == nops )
+    assert( reads == nops )
+    assert( writes == 0 )
+
+    # Random mixed traffic on the other levels
+    dut._log.info("Random half reads, RAID1")
+    cycles, ops, reads, writes, cycles_per_op = await bench_run(dut, raid1, 1, 4)
+    assert( ops == nops )
+    assert( reads + writes == nops )
+    assert( reads > 0 and writes > 0 )
+
+    dut._log.info("Random three quarters reads, RAID5")
+    cycles, ops, reads, writes, cycles_per_op = await bench_run(dut, raid5, 1, 6)
+    assert( ops == nops )
+    assert( reads + writes == nops )
+    assert( reads > writes )
+
+    # Same seed, so the same run gives the same counts
+    dut._log.info("Repeat of the RAID5 run")
+    repeat = await bench_run(dut, raid5, 1, 6)
+    assert( repeat[2] == reads )
+    assert( repeat[3] == writes )
+
+    await ClockCycles(dut.clk, 5)
@@ -32,6 +32,12 @@ async def test_flash_ctl(dut):
     dut.write.value = 0
     dut.addr.value = 0
     dut.din.value = 0
+    dut.burst.value = 0
+    dut.din_burst.value = 0
+    dut.xip_timeout.value = 0
+    dut.pd_timeout.value = 0
+    dut.wake_time.value = 0
+    dut.wake.value = 0
     dut.spi_miso.value = 0
 
     # Reset device before continuing
@@ -1,10 +1,21 @@
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles
+from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles, Timer
+from cocotb.utils import get_sim_time
 from cocotbext.spi import SpiMaster, SpiSignals, SpiConfig
 from .FM25C160B import FM25C160B
+from .spi_memory import W25Q128JV, W25X20CL, find_tap
+from .spi_memory import BitFlip, StuckAt, MisoStuck, DeadDrive, LatencySpike
+from .raid_model import Scoreboard, RAID1, RAID0, RAID5, ECC, RAID10
+from .spraid_tlm import Lockstep, SpraidTLM
+from .spraid_tlm import OFFLOAD_FILL, OFFLOAD_COMPARE, OFFLOAD_CRC32
+from . import spraid_tlm as reg
 from cocotbext.wishbone.driver import WishboneMaster, WBOp
 import random
+import os
+import tempfile
+import time
+import numpy as np
 from array import *
 
 # Read and write operations for wishbone 
@@ -24,6 +35,7 @@ async def reset(dut):
     dut.spi1_miso.value = 0
     dut.spi2_miso.value = 0
     dut.spi3_miso.value = 0
+    dut.spi4_miso.value = 0
     dut.wb_rst_i.value = 1
 #    dut.wb_lock_i.value = 0
 #    dut.wb_rty_o.value = 0
@@ -31,6 +43,46 @@ async def reset(dut):
     dut.wb_rst_i.value = 0
     await ClockCycles(dut.wb_clk_i, 10)
 
+
+# Wishbone signal names on wb_spraid
+signals_dict = {
+    "cyc": "wb_cyc_i",
+    "stb": "wb_stb_i",
+    "we": "wb_we_i",
+    "adr": "wb_adr_i",
+    "datwr" : "wb_dat_i",
+    "datrd" : "wb_dat_o",
+    "sel" : "wb_sel_i",
+    "ack" : "wb_ack_o"
+}
+
+
+# SPI signals of each drive port
+def drive_ports(dut, ndrives=4):
+    return [ SpiSignals(
+        sclk = getattr(dut, "spi%d_clk" % i),
+        mosi = getattr(dut, "spi%d_mosi" % i),
+        miso = getattr(dut, "spi%d_miso" % i),
+        cs   = getattr(dut, "spi%d_cs" % i)
+    ) for i in range(ndrives) ]
+
+
+# Start the clock, and the Wishbone master
+def start(dut):
+    clock = Clock(dut.wb_clk_i, 10, units="us")
+    cocotb.start_soon(clock.start())
+    return WishboneMaster( dut, "", dut.wb_clk_i, width=32, timeout=10000, signals_dict=signals_dict)
+
+
+# A model of part on each drive port, clock and Wishbone master, then reset.
+# Returns the master and the drive models
+async def setup(dut, part=FM25C160B, **kwargs):
+    flash = [ part( spi, 0, dut, **kwargs ) for spi in drive_ports(dut) ]
+    wbs = start(dut)
+    await reset(dut)
+    return wbs, flash
+
+
 @cocotb.test()
 async def test_flash_model(dut):
 
@@ -92,6 +144,7 @@ async def test_flash_model(dut):
         "adr": "wb_adr_i",
         "datwr" : "wb_dat_i",
         "datrd" : "wb_dat_o",
+        "sel" : "wb_sel_i",
         "ack" : "wb_ack_o"
     }
 
@@ -152,3 +205,546 @@ async def test_flash_model(dut):
 
     await ClockCycles(dut.wb_clk_i, 5)
 
+
+@cocotb.test()
+async def test_flash_model_bulk(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    coalesce_window_reg = 0x30000827
+    coalesce_bursts_reg = 0x30000829
+    xip_timeout_reg = 0x3000082A
+
+    raid0 = 0x00000001
+
+    # Setup FRAM models, SPI mode 0. Half size parts, so the top of the
+    # window wraps around on the drives
+    wbs, flash = await setup(dut, memsize=1024)
+
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+    await wb_write(dut, wbs, coalesce_window_reg, 64 )
+    await wb_write(dut, wbs, xip_timeout_reg, 100 )
+
+    # Four merged words go to each drive as one 4 byte write
+    dut._log.info("Burst write")
+    data = [ random.getrandbits(32) for i in range(4) ]
+    writes = [ flash[i].writes for i in range(4) ]
+    for i in range(4):
+        await wb_write(dut, wbs, base_addr + 0x10 + i, data[i] )
+    await ClockCycles(dut.wb_clk_i, 300)
+    assert( await wb_read( wbs, coalesce_bursts_reg ) == 1 )
+    for drive in range(4):
+        assert( flash[drive].writes == writes[drive] + 1 )
+        assert( flash[drive].write_bytes == 4 )
+        assert( (flash[drive].status & FM25C160B.STATUS_WEL) == 0 )
+        for i in range(4):
+            assert( flash[drive].mem[0x10 + i] == (data[i] >> (8*drive)) & 0xFF )
+
+    # Reading them back in order is one read on each drive
+    dut._log.info("Continuous read")
+    reads = [ flash[i].reads for i in range(4) ]
+    for i in range(4):
+        assert( await wb_read( wbs, base_addr + 0x10 + i ) == data[i] )
+    await ClockCycles(dut.wb_clk_i, 300)
+    for drive in range(4):
+        assert( flash[drive].reads == reads[drive] + 1 )
+        assert( flash[drive].read_bytes == 4 )
+
+    # Both directions carry on past the end of the part from address 0
+    dut._log.info("Address wrap")
+    data = [ random.getrandbits(32) for i in range(2) ]
+    await wb_write(dut, wbs, base_addr + 0x3FF, data[0] )
+    await wb_write(dut, wbs, base_addr + 0x400, data[1] )
+    await ClockCycles(dut.wb_clk_i, 300)
+    for drive in range(4):
+        assert( flash[drive].mem[0x3FF] == (data[0] >> (8*drive)) & 0xFF )
+        assert( flash[drive].mem[0] == (data[1] >> (8*drive)) & 0xFF )
+    for i in range(2):
+        assert( await wb_read( wbs, base_addr + 0x3FF + i ) == data[i] )
+    assert( await wb_read( wbs, base_addr ) == data[1] )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_flash_model_image(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+
+    raid0 = 0x00000001
+    nwords = 0x7FF
+
+    # Setup FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+
+    # Whole RAID0 array preloaded through the backdoor, a byte lane per drive
+    image = random.randbytes(4 * nwords)
+    for drive in range(4):
+        flash[drive].load( image[drive::4] )
+    for i in random.sample(range(nwords), 16):
+        expected = int.from_bytes(image[4*i : 4*i + 4], "little")
+        assert( await wb_read( wbs, base_addr + i ) == expected )
+
+    # Bus writes show up in the dumped lanes
+    data = random.getrandbits(32)
+    await wb_write(dut, wbs, base_addr + 0x123, data )
+    await ClockCycles(dut.wb_clk_i, 50)
+    lanes = bytes( flash[drive].dump(0x123, 1)[0] for drive in range(4) )
+    assert( int.from_bytes(lanes, "little") == data )
+    assert( flash[1].dump(0, 0x123) == image[1:4*0x123:4] )
+
+    # A memory mapped image keeps bus writes in the file
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "drive0.bin")
+        flash[0].dump_file(path)
+        flash[0].map_file(path)
+        await wb_write(dut, wbs, base_addr + 0x10, 0x000000A5 )
+        await ClockCycles(dut.wb_clk_i, 50)
+        flash[0].close()
+        with open(path, "rb") as f:
+            saved = f.read()
+        assert( len(saved) == FM25C160B.memsize )
+        assert( saved[0x10] == 0xA5 )
+        assert( saved[0x123] == data & 0xFF )
+
+        # Loaded back into a plain copy
+        flash[1].load_file(path)
+        assert( flash[1].mem[0x10] == 0xA5 )
+        flash[1].load( image[1::4] )
+
+    assert( await wb_read( wbs, base_addr + 0x11 ) == int.from_bytes(image[0x44 : 0x48], "little") )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_flash_model_large(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    drive_id_reg = 0x3000082C
+    drive_caps_reg = 0x30000830
+
+    raid5 = 0x00000005
+
+    # 16MB NOR flash parts, kept in sparse pages. SPI mode 0
+    wbs, flash = await setup(dut, W25Q128JV)
+    for drive in range(4):
+        assert( flash[drive].sparse )
+    await wb_write(dut, wbs, raid_type_addr, raid5 )
+
+    # Probe reads the ID, 16MB with 3 address bytes
+    for i in range(4):
+        assert( await wb_read( wbs, drive_id_reg + i ) == 0xEF4018 )
+        assert( await wb_read( wbs, drive_caps_reg + i ) == 0x03000318 )
+
+    # Each offset written once, so programming only has to clear bits
+    offsets = random.sample(range(0x7FF), 16)
+    data = [ random.getrandbits(24) for i in range(16) ]
+    for i in range(16):
+        await wb_write(dut, wbs, base_addr + offsets[i], data[i] )
+    for i in range(16):
+        assert( await wb_read( wbs, base_addr + offsets[i] ) == data[i] )
+
+    # Parity lane has the other three XORed
+    for i in range(16):
+        lanes = [ flash[drive].mem[offsets[i]] for drive in range(4) ]
+        assert( lanes[0] ^ lanes[1] ^ lanes[2] ^ lanes[3] == 0 )
+
+    # Only the start of each part was touched
+    for drive in range(4):
+        assert( flash[drive].mem.pages_used == 1 )
+        assert( flash[drive].mem[flash[drive].memsize - 1] == 0xFF )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_flash_model_speed(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+
+    raid0 = 0x00000001
+    nwords = 64
+
+    # Needs the byte taps, built in by the test_flash_model target
+    if( find_tap(dut.spi0_clk) is None ):
+        dut._log.info("No byte taps in this build, nothing to compare")
+        return
+
+    spis = drive_ports(dut)
+    taps = [ find_tap(spi.sclk) for spi in spis ]
+    wbs = start(dut)
+
+    # Same traffic with per bit models, then with the byte taps. The taps
+    # count bytes either way, so both runs are measured the same
+    rate = {}
+    for fast in (False, True):
+        flash = [ FM25C160B( spi, 0, dut, fast=fast ) for spi in spis ]
+        await reset(dut)
+        await wb_write(dut, wbs, raid_type_addr, raid0 )
+
+        offsets = random.sample(range(0x7FF), nwords)
+        data = [ random.getrandbits(32) for i in range(nwords) ]
+        start_bytes = sum( int(tap.nbytes.value) for tap in taps )
+        start = time.perf_counter()
+
+        for i in range(nwords):
+            await wb_write(dut, wbs, base_addr + offsets[i], data[i] )
+        for i in range(nwords):
+            assert( await wb_read( wbs, base_addr + offsets[i] ) == data[i] )
+
+        elapsed = time.perf_counter() - start
+        bits = 8 * (sum( int(tap.nbytes.value) for tap in taps ) - start_bytes)
+        rate[fast] = bits / elapsed
+        dut._log.info("%s models: %d SPI bits in %.2f s, %.0f bits/s" % (
+            "Byte tap" if fast else "Per bit", bits, elapsed, rate[fast]))
+
+        for drive in range(4):
+            assert( flash[drive].fast == fast )
+            flash[drive].stop()
+
+    dut._log.info("Byte taps are %.1fx faster" % (rate[True] / rate[False]))
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_flash_model_timing(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+
+    raid0 = 0x00000001
+    nwords = 8
+
+    spis = drive_ports(dut)
+    wbs = start(dut)
+
+    # FRAM writes at bus speed, so once it has powered up nothing the
+    # controller does is too fast for it. Any violation fails the test
+    flash = [ FM25C160B( spi, 0, dut, timing=True ) for spi in spis ]
+    dut.wb_rst_i.value = 1
+    await Timer(FM25C160B.t_pu, units="ns")
+    await reset(dut)
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+
+    offsets = random.sample(range(0x7FF), nwords)
+    data = [ random.getrandbits(32) for i in range(nwords) ]
+    for i in range(nwords):
+        await wb_write(dut, wbs, base_addr + offsets[i], data[i] )
+    for i in range(nwords):
+        assert( await wb_read( wbs, base_addr + offsets[i] ) == data[i] )
+    for drive in range(4):
+        assert( flash[drive].violations == 0 )
+        flash[drive].stop()
+
+    # NOR flash is busy programming long after the write frame. The
+    # controller doesn't poll for it, so back to back writes run into the
+    # busy time. Logged rather than raised, the data still gets through
+    flash = [ W25X20CL( spi, 0, dut, timing=True, strict=False, jitter=0.2, seed=i )
+        for i, spi in enumerate(spis) ]
+    await reset(dut)
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+
+    for i in range(nwords):
+        await wb_write(dut, wbs, base_addr + offsets[i], data[i] )
+    await Timer(2 * W25X20CL.t_program, units="ns")
+    assert( not any( flash[drive].busy for drive in range(4) ) )
+    for i in range(nwords):
+        assert( await wb_read( wbs, base_addr + offsets[i] ) == data[i] )
+    for drive in range(4):
+        assert( flash[drive].violations >= nwords - 1 )
+        flash[drive].stop()
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+async def timed_reads( wbs, addrs ):
+    # Read each address, and the average time per read in us
+    start = get_sim_time("us")
+    data = [ await wb_read( wbs, addr ) for addr in addrs ]
+    return data, (get_sim_time("us") - start) / len(addrs)
+
+
+@cocotb.test()
+async def test_flash_model_faults(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    degraded_reg = 0x3000081E
+
+    raid1 = 0x00000000
+    raid5 = 0x00000005
+    nwords = 8
+
+    # Setup FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+    addrs = [ base_addr + i for i in range(nwords) ]
+
+    # RAID1 mismatch, one bit flipped on one mirror
+    dut._log.info("RAID1 bit flip")
+    await wb_write(dut, wbs, raid_type_addr, raid1 )
+    image = [ random.getrandbits(8) for i in range(nwords) ]
+    for i in range(nwords):
+        await wb_write(dut, wbs, addrs[i], image[i] )
+    data, clean = await timed_reads( wbs, addrs )
+    assert( data == image )
+
+    # Mismatched mirrors read as all ones and set the error bit
+    flip = flash[1].inject( BitFlip( 3, mask=0x10 ) )
+    data, faulty = await timed_reads( wbs, addrs[3:4] * nwords )
+    assert( data == [0xFFFFFFFF] * nwords )
+    assert( (await wb_read( wbs, stat_addr )) & 0x2 )
+    assert( flip.hits == nwords )
+    assert( await wb_read( wbs, addrs[2] ) == image[2] )
+    flash[1].clear_faults()
+    dut._log.info("RAID1 read %.1f us clean, %.1f us with a mismatch" % (clean, faulty))
+
+    # RAID5 parity errors from a parity byte stuck at zero
+    dut._log.info("RAID5 stuck parity")
+    await wb_write(dut, wbs, raid_type_addr, raid5 )
+    image = [ random.getrandbits(24) | 0x000001 for i in range(nwords) ]
+    for i in range(nwords):
+        await wb_write(dut, wbs, addrs[i], image[i] )
+    parity = [ (w ^ (w >> 8) ^ (w >> 16)) & 0xFF for w in image ]
+    bad = [ i for i in range(nwords) if parity[i] != 0 ]
+    stuck = flash[3].inject( StuckAt( range(nwords), mask=0xFF, value=0x00 ) )
+    for i in range(nwords):
+        await wb_read( wbs, addrs[i] )
+        err = (await wb_read( wbs, stat_addr )) & 0x4
+        assert( bool(err) == (i in bad) )
+    assert( stuck.hits == nwords )
+    flash[3].clear_faults()
+
+    # MISO held low for one frame, only the next read sees it
+    dut._log.info("RAID5 MISO stuck low")
+    flash[0].inject( MisoStuck( level=0, after=flash[0].frames, frames=1 ) )
+    await wb_read( wbs, addrs[0] )
+    assert( (await wb_read( wbs, stat_addr )) & 0x4 )
+    assert( await wb_read( wbs, addrs[0] ) == image[0] )
+    assert( ((await wb_read( wbs, stat_addr )) & 0x4) == 0 )
+    flash[0].clear_faults()
+
+    # Drive 1 dies, reads go around it once it is marked degraded
+    dut._log.info("RAID5 dead drive")
+    data, clean = await timed_reads( wbs, addrs )
+    assert( data == image )
+    flash[1].inject( DeadDrive() )
+    await wb_write(dut, wbs, degraded_reg, 0x2 )
+    data, degraded = await timed_reads( wbs, addrs )
+    assert( data == image )
+    writes = flash[1].writes
+    await wb_write(dut, wbs, addrs[0], image[0] ^ 0x00FF00 )
+    assert( await wb_read( wbs, addrs[0] ) == image[0] ^ 0x00FF00 )
+    assert( flash[1].writes == writes )
+    await wb_write(dut, wbs, addrs[0], image[0] )
+    flash[1].clear_faults()
+    await wb_write(dut, wbs, degraded_reg, 0 )
+    dut._log.info("RAID5 read %.1f us clean, %.1f us degraded" % (clean, degraded))
+
+    # A drive going busy on its own loses the writes sent meanwhile
+    dut._log.info("Latency spike")
+    spike = flash[2].inject( LatencySpike( 10000000, after=flash[2].frames, frames=1 ) )
+    await wb_write(dut, wbs, addrs[1], image[1] ^ 0xFF0000 )
+    assert( spike.hits == 1 )
+    assert( flash[2].busy )
+    assert( flash[2].mem[1] == (image[1] >> 16) & 0xFF )
+    flash[2].clear_faults()
+    assert( not flash[2].busy )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_flash_model_scoreboard(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+
+    nwords = 128
+    nwrites = 192
+
+    # FRAM parts, so words can be written over
+    wbs, flash = await setup(dut)
+
+    # Random writes for every layout, offsets repeat so later writes have to
+    # win. Any lane select, layouts that ignore some or all of it still have
+    # to write what the scoreboard expects
+    for raid_type in [ RAID1, RAID0, RAID5, ECC, RAID10 ]:
+        dut._log.info("Scoreboard RAID type %d" % (raid_type))
+        await wb_write(dut, wbs, raid_type_addr, raid_type )
+        board = Scoreboard( raid_type, nwords )
+
+        # Start from a consistent image, put in through the backdoor
+        board.write( 0, [ random.getrandbits(32) for i in range(nwords) ] )
+        images, offsets = board.images()
+        for d in range(4):
+            flash[d].load( np.ascontiguousarray(images[:, d]) )
+
+        # Recorded as one batch, so the scoreboard has to apply repeats in
+        # order. The first few hit the same word with one lane at a time
+        writes = [ (3, random.getrandbits(32), 1 << (i % 4)) for i in range(8) ]
+        writes += [ (random.randrange(nwords), random.getrandbits(32), random.randrange(16))
+                    for i in range(nwrites) ]
+        for offset, data, sel in writes:
+            dut.wb_we_i.value = 1
+            await wbs.send_cycle([WBOp(base_addr + offset, data, 0, sel)])
+            dut.wb_we_i.value = 0
+        board.write( *[ np.array(column) for column in zip(*writes) ] )
+
+        # Every drive image at once
+        mismatches = board.check( flash )
+        for mismatch in mismatches[:8]:
+            dut._log.info("Drive %d offset %d expected %02x got %02x" % mismatch)
+        assert( len(mismatches) == 0 )
+
+        # And what the host reads back
+        words, offsets = board.expected()
+        for i in range(len(offsets)):
+            assert( await wb_read( wbs, base_addr + int(offsets[i]) ) == int(words[i]) )
+        assert( await wb_read( wbs, stat_addr ) & 0x86 == 0 )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_flash_model_lockstep(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    perf_drive_ops_reg = 0x3000080E
+    ecc_corrected_reg = 0x30000813
+    degraded_reg = 0x3000081E
+    xip_timeout_reg = 0x3000082A
+    geometry_reg = 0x30000834
+
+    nwords = 64
+    naccesses = 400
+
+    wbs, flash = await setup(dut)
+
+    # Every access goes to both, and has to read back the same
+    step = Lockstep( dut, wbs, flash, period=10000 )
+    await step.read( geometry_reg )
+
+    for raid_type in [ RAID1, RAID0, RAID5, ECC, RAID10 ]:
+        dut._log.info("Lockstep RAID type %d" % (raid_type))
+        await step.write( raid_type_addr, raid_type )
+        for i in range(nwords):
+            await step.write( base_addr + i, random.getrandbits(32) )
+
+        for i in range(naccesses):
+            offset = random.randrange(nwords)
+            what = random.randrange(8)
+            if( what < 3 ):
+                await step.write( base_addr + offset, random.getrandbits(32), random.randrange(16) )
+            elif( what < 6 ):
+                await step.read( base_addr + offset )
+            elif( what == 6 ):
+                # A bit flipped behind the controller's back, on both
+                drive = random.randrange(4)
+                bit = 1 << random.randrange(8)
+                flash[drive].mem[offset] ^= bit
+                step.tlm.drives[drive].mem[offset] ^= bit
+                await step.read( base_addr + offset )
+            else:
+                await step.write( degraded_reg, random.choice([ 0, 0, 1, 2, 4, 8, 3 ]) )
+            await step.read( stat_addr )
+
+        await step.write( degraded_reg, 0 )
+        await step.read( perf_drive_ops_reg )
+        await step.read( ecc_corrected_reg )
+
+    # Read streams, sequential reads only clock one byte in
+    await step.write( raid_type_addr, RAID0 )
+    await step.write( xip_timeout_reg, 64 )
+    for i in range(nwords):
+        await step.read( base_addr + i )
+    await step.write( xip_timeout_reg, 0 )
+
+    # Stream port, a word per data access on the TLM, ahead of that on the RTL
+    await step.write( reg.SPRAID_STREAM_ADDR, 8 )
+    await step.write( reg.SPRAID_STREAM_LEN, 16 )
+    for i in range(16):
+        await step.write( reg.SPRAID_STREAM_DATA, random.getrandbits(32) )
+    await step.write( reg.SPRAID_STREAM_ADDR, 4 )
+    await step.write( reg.SPRAID_STREAM_LEN, 24 )
+    for i in range(24):
+        await step.read( reg.SPRAID_STREAM_DATA )
+    await step.read( reg.SPRAID_STREAM_ADDR )
+    await step.read( reg.SPRAID_STREAM_LEN )
+    await step.read( stat_addr )
+
+    # Offload engine, the last compare stops at the word cleared
+    await step.write( reg.SPRAID_OFFLOAD_ADDR, 16 )
+    await step.write( reg.SPRAID_OFFLOAD_LEN, 32 )
+    await step.write( reg.SPRAID_OFFLOAD_VALUE, 0x5A5AA5A5 )
+    for cmd in [ OFFLOAD_CRC32, OFFLOAD_FILL, OFFLOAD_COMPARE ]:
+        await step.write( reg.SPRAID_OFFLOAD_CMD, cmd )
+        await step.read( reg.SPRAID_OFFLOAD_RESULT )
+    await step.write( base_addr + 20, 0 )
+    await step.write( reg.SPRAID_OFFLOAD_CMD, OFFLOAD_COMPARE )
+    for addr in range(reg.SPRAID_OFFLOAD_ADDR, reg.SPRAID_OFFLOAD_MISMATCH + 1):
+        await step.read( addr )
+    await step.read( stat_addr )
+
+    # Migration to RAID5 over the words written, which leaves the array
+    # split at the mark for everything after this
+    await step.write( reg.SPRAID_MIGRATE_LEN, nwords )
+    await step.write( reg.SPRAID_MIGRATE_THROTTLE, 4 )
+    await step.write( reg.SPRAID_MIGRATE_TARGET, RAID5 )
+    for addr in range(reg.SPRAID_MIGRATE_TARGET, reg.SPRAID_MIGRATE_MARK + 1):
+        await step.read( addr )
+    await step.read( raid_type_addr )
+    for i in range(nwords + 2):
+        await step.read( base_addr + i )
+
+    # Write coalescing, a full run, and a run flushed by reading it
+    await step.write( reg.SPRAID_COALESCE_WINDOW, 2000 )
+    for i in range(4):
+        await step.write( base_addr + 32 + i, random.getrandbits(32) )
+    for i in range(2):
+        await step.write( base_addr + 40 + i, random.getrandbits(32) )
+    await step.read( base_addr + 41 )
+    for addr in range(reg.SPRAID_COALESCE_WINDOW, reg.SPRAID_COALESCE_BURSTS + 1):
+        await step.read( addr )
+    await step.write( reg.SPRAID_COALESCE_WINDOW, 0 )
+
+    # No spare port on this build, its registers read as zero
+    await step.write( reg.SPRAID_SPARE_CTRL, 0x00100001 )
+    for addr in range(reg.SPRAID_SPARE_CTRL, reg.SPRAID_REBUILD_MARK + 1):
+        await step.read( addr )
+
+    # Power-down, every drive goes to sleep and a read wakes them again
+    await step.write( reg.SPRAID_WAKE_TIME + 1, 64 )
+    await step.write( reg.SPRAID_POWER_CTRL, 200 )
+    await ClockCycles( dut.wb_clk_i, 2000 )
+    await step.read( reg.SPRAID_POWER_CTRL )
+    await step.read( base_addr )
+    for n in range(4):
+        await step.read( reg.SPRAID_WAKE_TIME + n )
+        await step.read( reg.SPRAID_WAKE_COUNT + n )
+    await step.write( reg.SPRAID_POWER_CTRL, 0 )
+    await step.read( perf_drive_ops_reg )
+
+    await step.settle( flush=True )
+    assert( step.check_drives() == [] )
+    assert( step.mismatches == 0 )
+    step.report()
+
+    await ClockCycles(dut.wb_clk_i, 5)
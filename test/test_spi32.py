@@ -27,6 +27,7 @@ async def test_spi32(dut):
     dut.read.value = 0
     dut.write.value = 0
     dut.nbytes.value = 0
+    dut.hold.value = 0
 
     # Reset device before continuing
     await reset(dut)
@@ -2,8 +2,13 @@ import cocotb
 from cocotb.clock import Clock
 from cocotb.binary import BinaryValue
 from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles, Timer
+from cocotb.utils import get_sim_time
 import random
+import struct
+import zlib
 from cocotbext.wishbone.driver import WishboneMaster, WBOp
+from cocotbext.spi import SpiSignals
+from .FM25C160B import FM25C160B
 
 
 
@@ -32,6 +37,45 @@ async def reset(dut):
     await ClockCycles(dut.wb_clk_i, 10)
 
 
+# Wishbone signal names on wb_spraid
+signals_dict = {
+    "cyc": "wb_cyc_i",
+    "stb": "wb_stb_i",
+    "we": "wb_we_i",
+    "adr": "wb_adr_i",
+    "datwr" : "wb_dat_i",
+    "datrd" : "wb_dat_o",
+    "sel" : "wb_sel_i",
+    "ack" : "wb_ack_o"
+}
+
+
+# Drive models on the SPI ports, clock and Wishbone master, then reset.
+# Returns the master and the drive models
+async def setup(dut, ndrives=4):
+    flash = []
+    for i in range(ndrives):
+        spi = SpiSignals(
+            sclk = getattr(dut, "spi%d_clk" % i),
+            mosi = getattr(dut, "spi%d_mosi" % i),
+            miso = getattr(dut, "spi%d_miso" % i),
+            cs   = getattr(dut, "spi%d_cs" % i)
+        )
+        flash.append( FM25C160B( spi, 0, dut ) )
+
+    clock = Clock(dut.wb_clk_i, 10, units="us")
+    cocotb.start_soon(clock.start())
+    wbs = WishboneMaster( dut, "", dut.wb_clk_i, width=32, timeout=10000, signals_dict=signals_dict)
+
+    for i in range(5):
+        getattr(dut, "spi%d_miso" % i).value = 0
+    dut.wb_rst_i.value = 1
+    await ClockCycles(dut.wb_clk_i, 5)
+    dut.wb_rst_i.value = 0
+    await ClockCycles(dut.wb_clk_i, 10)
+    return wbs, flash
+
+
 
 @cocotb.test()
 async def test_wb_spraid(dut):
@@ -58,6 +102,7 @@ async def test_wb_spraid(dut):
         "adr": "wb_adr_i",
         "datwr" : "wb_dat_i",
         "datrd" : "wb_dat_o",
+        "sel" : "wb_sel_i",
         "ack" : "wb_ack_o"
     }
 
@@ -110,3 +155,756 @@ async def test_wb_spraid(dut):
 
     await ClockCycles(dut.wb_clk_i, 5)
 
+
+
+@cocotb.test()
+async def test_stream_port(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    stream_addr_reg = 0x30000802
+    stream_len_reg = 0x30000803
+    stream_data_reg = 0x30000804
+
+    raid0 = 0x00000001
+    nwords = 16
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+
+    # Per word window writes
+    start = get_sim_time(units="us")
+    for i in range(nwords):
+        await wb_write(dut, wbs, base_addr + 0x100 + i, 0x11110000 + i )
+    window_write_time = get_sim_time(units="us") - start
+
+    # Stream writes, time includes draining to the array
+    start = get_sim_time(units="us")
+    await wb_write(dut, wbs, stream_addr_reg, 0x200 )
+    await wb_write(dut, wbs, stream_len_reg, nwords )
+    for i in range(nwords):
+        await wb_write(dut, wbs, stream_data_reg, 0x22220000 + i )
+    bus_write_time = get_sim_time(units="us") - start
+
+    # Bit 3 of status is set while the stream runs
+    while( (await wb_read( wbs, stat_addr )) & 0x08 ):
+        await ClockCycles(dut.wb_clk_i, 10)
+    stream_write_time = get_sim_time(units="us") - start
+
+    dut._log.info("Window write: %d us, stream write: %d us (bus free after %d us)"
+            % (window_write_time, stream_write_time, bus_write_time))
+
+    # Stream data shares storage with the window
+    for i in range(nwords):
+        result = await wb_read( wbs, base_addr + 0x200 + i )
+        assert( result == 0x22220000 + i )
+
+    # Per word window reads
+    start = get_sim_time(units="us")
+    for i in range(nwords):
+        result = await wb_read( wbs, base_addr + 0x100 + i )
+        assert( result == 0x11110000 + i )
+    window_read_time = get_sim_time(units="us") - start
+
+    # Stream reads
+    start = get_sim_time(units="us")
+    await wb_write(dut, wbs, stream_addr_reg, 0x100 )
+    await wb_write(dut, wbs, stream_len_reg, nwords )
+    for i in range(nwords):
+        result = await wb_read( wbs, stream_data_reg )
+        assert( result == 0x11110000 + i )
+    stream_read_time = get_sim_time(units="us") - start
+
+    dut._log.info("Window read: %d us, stream read: %d us"
+            % (window_read_time, stream_read_time))
+
+    # Stream finished, address advanced past the last word
+    assert( await wb_read( wbs, stream_len_reg ) == 0 )
+    assert( await wb_read( wbs, stream_addr_reg ) == 0x100 + nwords )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_offload(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    offload_addr_reg = 0x30000805
+    offload_len_reg = 0x30000806
+    offload_value_reg = 0x30000807
+    offload_cmd_reg = 0x30000808
+    offload_result_reg = 0x30000809
+    offload_mismatch_reg = 0x3000080A
+
+    # Offload commands
+    cmd_fill = 1
+    cmd_compare = 2
+    cmd_crc32 = 3
+
+    raid0 = 0x00000001
+    raid10 = 0x0000000A
+    fill_value = 0xA5A55A5A
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+
+    # Command register bit 31 is set while the engine runs
+    async def run_offload(cmd, addr, nwords):
+        await wb_write(dut, wbs, offload_addr_reg, addr )
+        await wb_write(dut, wbs, offload_len_reg, nwords )
+        await wb_write(dut, wbs, offload_cmd_reg, cmd )
+        while( (await wb_read( wbs, offload_cmd_reg )) & 0x80000000 ):
+            await ClockCycles(dut.wb_clk_i, 10)
+
+    # Fill
+    dut._log.info("Offload fill")
+    await wb_write(dut, wbs, offload_value_reg, fill_value )
+    await run_offload(cmd_fill, 0x40, 12)
+    for i in range(12):
+        assert( await wb_read( wbs, base_addr + 0x40 + i ) == fill_value )
+
+    # Compare, whole range matches
+    dut._log.info("Offload compare")
+    await run_offload(cmd_compare, 0x40, 12)
+    assert( await wb_read( wbs, offload_result_reg ) == 0 )
+    assert( await wb_read( wbs, offload_mismatch_reg ) == 0xFFFFFFFF )
+
+    # Compare, break one word
+    await wb_write(dut, wbs, base_addr + 0x47, 0x12345678 )
+    await run_offload(cmd_compare, 0x40, 12)
+    assert( await wb_read( wbs, offload_result_reg ) == 1 )
+    assert( await wb_read( wbs, offload_mismatch_reg ) == 0x47 )
+    assert( (await wb_read( wbs, stat_addr )) & 0x20 )
+
+    # CRC32 over an image, same as zlib over the little endian words
+    dut._log.info("Offload CRC32")
+    image = [ random.getrandbits(32) for i in range(6) ]
+    for i in range(len(image)):
+        await wb_write(dut, wbs, base_addr + 0x100 + i, image[i] )
+    await run_offload(cmd_crc32, 0x100, len(image))
+    expected = zlib.crc32( b''.join( struct.pack('<I', word) for word in image ) )
+    result = await wb_read( wbs, offload_result_reg )
+    dut._log.info("CRC32: %08x expected %08x" % (result, expected))
+    assert( result == expected )
+
+    # The range registers keep what was programmed, so the same command can
+    # be issued again on its own
+    assert( await wb_read( wbs, offload_addr_reg ) == 0x100 )
+    assert( await wb_read( wbs, offload_len_reg ) == len(image) )
+    await wb_write(dut, wbs, offload_cmd_reg, cmd_crc32 )
+    while( (await wb_read( wbs, offload_cmd_reg )) & 0x80000000 ):
+        assert( await wb_read( wbs, offload_addr_reg ) == 0x100 )
+        assert( await wb_read( wbs, offload_len_reg ) == len(image) )
+        await ClockCycles(dut.wb_clk_i, 10)
+    assert( await wb_read( wbs, offload_result_reg ) == expected )
+
+    # RAID10 keeps 2 data bytes a word, the upper bytes read back as zero and
+    # take no part in compare or CRC
+    dut._log.info("Offload RAID10")
+    await wb_write(dut, wbs, raid_type_addr, raid10 )
+    await wb_write(dut, wbs, offload_value_reg, fill_value )
+    await run_offload(cmd_fill, 0x40, 12)
+    for i in range(12):
+        assert( await wb_read( wbs, base_addr + 0x40 + i ) == fill_value & 0xFFFF )
+    await run_offload(cmd_compare, 0x40, 12)
+    assert( await wb_read( wbs, offload_result_reg ) == 0 )
+    assert( await wb_read( wbs, offload_mismatch_reg ) == 0xFFFFFFFF )
+
+    for i in range(len(image)):
+        await wb_write(dut, wbs, base_addr + 0x100 + i, image[i] )
+    await run_offload(cmd_crc32, 0x100, len(image))
+    expected = zlib.crc32( b''.join( struct.pack('<H', word & 0xFFFF) for word in image ) )
+    result = await wb_read( wbs, offload_result_reg )
+    dut._log.info("CRC32: %08x expected %08x" % (result, expected))
+    assert( result == expected )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_raid5_partial_write(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    perf_full_reg = 0x3000080B
+    perf_rmw_reg = 0x3000080C
+    perf_rcw_reg = 0x3000080D
+    perf_drive_ops_reg = 0x3000080E
+
+    raid5 = 0x00000005
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    await wb_write(dut, wbs, raid_type_addr, raid5 )
+
+    # Full stripe writes, no old data needed
+    stripes = [ random.getrandbits(24) for i in range(4) ]
+    for i in range(len(stripes)):
+        await wb_write(dut, wbs, base_addr + 0x30 + i, stripes[i] )
+    assert( await wb_read( wbs, perf_full_reg ) == len(stripes) )
+    assert( await wb_read( wbs, perf_drive_ops_reg ) == 4 * len(stripes) )
+
+    # Every partial lane select. One lane reads old data and parity, two
+    # lanes read the remaining data lane instead
+    rmw = 0
+    rcw = 0
+    for sel in range(1, 7):
+        for i in range(len(stripes)):
+            data = random.getrandbits(24)
+            dut.wb_we_i.value = 1
+            await wbs.send_cycle([WBOp(base_addr + 0x30 + i, data, 0, sel)])
+            dut.wb_we_i.value = 0
+            mask = 0
+            for lane in range(3):
+                if( sel & (1 << lane) ):
+                    mask = mask | (0xFF << (8 * lane))
+            stripes[i] = (stripes[i] & ~mask) | (data & mask)
+            if( bin(sel).count("1") == 1 ):
+                rmw = rmw + 1
+            else:
+                rcw = rcw + 1
+
+    assert( await wb_read( wbs, perf_rmw_reg ) == rmw )
+    assert( await wb_read( wbs, perf_rcw_reg ) == rcw )
+
+    # Two reads and two writes per partial write either way
+    drive_ops = await wb_read( wbs, perf_drive_ops_reg )
+    dut._log.info("RMW %d RCW %d drive ops %d" % (rmw, rcw, drive_ops))
+    assert( drive_ops == 4 * len(stripes) + 4 * (rmw + rcw) )
+
+    # Merged data reads back with good parity
+    for i in range(len(stripes)):
+        assert( await wb_read( wbs, base_addr + 0x30 + i ) == stripes[i] )
+        assert( ((await wb_read( wbs, stat_addr )) & 0x4) == 0 )
+
+    # A store to byte 3 alone, which RAID5 doesn't keep, completes without
+    # touching the drives
+    drive_ops = await wb_read( wbs, perf_drive_ops_reg )
+    dut.wb_we_i.value = 1
+    await wbs.send_cycle([WBOp(base_addr + 0x30, random.getrandbits(32), 0, 0x8)])
+    dut.wb_we_i.value = 0
+    assert( await wb_read( wbs, perf_drive_ops_reg ) == drive_ops )
+    assert( await wb_read( wbs, perf_full_reg ) == len(stripes) )
+    assert( await wb_read( wbs, base_addr + 0x30 ) == stripes[0] )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_migrate(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    migrate_target_reg = 0x3000080F
+    migrate_len_reg = 0x30000810
+    migrate_throttle_reg = 0x30000811
+    migrate_mark_reg = 0x30000812
+
+    raid0 = 0x00000001
+    raid10 = 0x0000000A
+    nwords = 16
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    # Length defaults to the whole window, last word included
+    assert( await wb_read( wbs, migrate_len_reg ) == 0x800 )
+
+    # Fill the start of the array as RAID0, a word past the range too
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+    image = [ random.getrandbits(32) for i in range(nwords + 1) ]
+    for i in range(nwords + 1):
+        await wb_write(dut, wbs, base_addr + i, image[i] )
+
+    # Migrate the start to RAID10, which only holds the low 16 bits
+    dut._log.info("Migrating RAID0 to RAID10")
+    await wb_write(dut, wbs, migrate_len_reg, nwords )
+    await wb_write(dut, wbs, migrate_throttle_reg, 4 )
+    await wb_write(dut, wbs, migrate_target_reg, raid10 )
+    assert( (await wb_read( wbs, stat_addr )) & 0x40 )
+
+    # Host keeps using the array, layout picked by the high water mark
+    i = 0
+    while( (await wb_read( wbs, stat_addr )) & 0x40 ):
+        mark = await wb_read( wbs, migrate_mark_reg )
+        data = await wb_read( wbs, base_addr + i )
+        if( i < mark ):
+            assert( data == (image[i] & 0xFFFF) )
+        else:
+            # Mark can move between the two reads
+            assert( (data == image[i]) or (data == (image[i] & 0xFFFF)) )
+        i = (i + 5) % nwords
+
+    # Only part of the window moved, so the array stays split at the mark:
+    # the type is unchanged, the range holds the converted data and the
+    # word past it is still RAID0
+    assert( await wb_read( wbs, raid_type_addr ) == raid0 )
+    assert( await wb_read( wbs, migrate_target_reg ) == (0x40000000 | raid10) )
+    assert( await wb_read( wbs, migrate_mark_reg ) == nwords )
+    for i in range(nwords):
+        assert( await wb_read( wbs, base_addr + i ) == (image[i] & 0xFFFF) )
+        assert( flash[0].mem[i] == flash[1].mem[i] )
+        assert( flash[2].mem[i] == flash[3].mem[i] )
+    assert( await wb_read( wbs, base_addr + nwords ) == image[nwords] )
+
+    # Writes land in the layout of their side of the mark
+    await wb_write(dut, wbs, base_addr + 2, 0x12345678 )
+    await wb_write(dut, wbs, base_addr + nwords, 0x9ABCDEF0 )
+    assert( await wb_read( wbs, base_addr + 2 ) == 0x5678 )
+    assert( await wb_read( wbs, base_addr + nwords ) == 0x9ABCDEF0 )
+
+    # No new migration from a split array
+    await wb_write(dut, wbs, migrate_target_reg, raid0 )
+    assert( (await wb_read( wbs, stat_addr )) & 0x40 == 0 )
+    assert( await wb_read( wbs, migrate_target_reg ) == (0x40000000 | raid10) )
+
+    # Writing the type puts the whole window back in one layout
+    await wb_write(dut, wbs, raid_type_addr, raid10 )
+    assert( await wb_read( wbs, migrate_target_reg ) == raid10 )
+    assert( await wb_read( wbs, base_addr + 2 ) == 0x5678 )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_ecc(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    ecc_corrected_reg = 0x30000813
+    ecc_uncorrected_reg = 0x30000814
+
+    ecc = 0x00000006
+    nwords = 8
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    await wb_write(dut, wbs, raid_type_addr, ecc )
+    image = [ random.getrandbits(24) for i in range(nwords) ]
+    for i in range(nwords):
+        await wb_write(dut, wbs, base_addr + i, image[i] )
+
+    # Flip one bit of each codeword on a different drive, all corrected
+    dut._log.info("ECC single bit errors")
+    for i in range(nwords):
+        bit = (i * 7) % 30
+        flash[bit // 8].mem[i] ^= 1 << (bit % 8)
+        assert( await wb_read( wbs, base_addr + i ) == image[i] )
+        assert( ((await wb_read( wbs, stat_addr )) & 0x80) == 0 )
+    assert( await wb_read( wbs, ecc_corrected_reg ) == nwords )
+    assert( await wb_read( wbs, ecc_uncorrected_reg ) == 0 )
+
+    # A second bit in the same word can only be detected
+    dut._log.info("ECC double bit error")
+    flash[2].mem[3] ^= 0x01
+    await wb_read( wbs, base_addr + 3 )
+    assert( (await wb_read( wbs, stat_addr )) & 0x80 )
+    assert( await wb_read( wbs, ecc_uncorrected_reg ) == 1 )
+
+    # Byte stores read the codeword back, fix the bit still flipped there
+    # and merge the lanes written, the rest of the word is kept
+    dut._log.info("ECC partial writes")
+    for i, sel in [ (5, 0x2), (6, 0x5) ]:
+        data = random.getrandbits(32)
+        dut.wb_we_i.value = 1
+        await wbs.send_cycle([WBOp(base_addr + i, data, 0, sel)])
+        dut.wb_we_i.value = 0
+        mask = (0xFF if sel & 1 else 0) | (0xFF00 if sel & 2 else 0) | (0xFF0000 if sel & 4 else 0)
+        image[i] = (image[i] & ~mask) | (data & mask)
+    assert( await wb_read( wbs, ecc_corrected_reg ) == nwords + 2 )
+    for i in [ 5, 6 ]:
+        assert( await wb_read( wbs, base_addr + i ) == image[i] )
+    assert( await wb_read( wbs, ecc_corrected_reg ) == nwords + 2 )
+    assert( ((await wb_read( wbs, stat_addr )) & 0x80) == 0 )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_drive_health(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    threshold_reg = 0x3000081D
+    degraded_reg = 0x3000081E
+    ewma_reg = 0x3000081F
+    max_reg = 0x30000823
+
+    raid1 = 0x00000000
+    raid5 = 0x00000005
+    nwords = 8
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    # Some RAID1 traffic so every drive has latency figures, a byte is copied
+    # to every drive
+    await wb_write(dut, wbs, raid_type_addr, raid1 )
+    image = [ random.getrandbits(8) for i in range(nwords) ]
+    for i in range(nwords):
+        await wb_write(dut, wbs, base_addr + i, image[i] )
+    for i in range(nwords):
+        assert( await wb_read( wbs, base_addr + i ) == image[i] )
+
+    for drive in range(4):
+        ewma = await wb_read( wbs, ewma_reg + drive )
+        worst = await wb_read( wbs, max_reg + drive )
+        dut._log.info("Drive %d: average %d, worst %d busy cycles" % (drive, ewma, worst))
+        assert( ewma > 0 )
+        assert( worst >= ewma )
+    assert( await wb_read( wbs, degraded_reg ) == 0 )
+
+    # Writing a worst case register clears it
+    await wb_write(dut, wbs, max_reg + 1, 0 )
+    assert( await wb_read( wbs, max_reg + 1 ) == 0 )
+
+    # Take drive 2 out by hand, RAID1 reads ignore it
+    dut._log.info("RAID1 with drive 2 degraded")
+    await wb_write(dut, wbs, degraded_reg, 0x4 )
+    assert( (await wb_read( wbs, stat_addr )) & 0x100 )
+    flash[2].mem[3] ^= 0xFF
+    assert( await wb_read( wbs, base_addr + 3 ) == image[3] )
+    assert( ((await wb_read( wbs, stat_addr )) & 0x2) == 0 )
+    flash[2].mem[3] ^= 0xFF
+
+    # RAID5 rebuilds the degraded drive's byte from parity
+    dut._log.info("RAID5 with drive 1 degraded")
+    await wb_write(dut, wbs, raid_type_addr, raid5 )
+    image = [ random.getrandbits(24) for i in range(nwords) ]
+    for i in range(nwords):
+        await wb_write(dut, wbs, base_addr + i, image[i] )
+    await wb_write(dut, wbs, degraded_reg, 0x2 )
+    for i in range(nwords):
+        flash[1].mem[i] ^= 0x5A
+    for i in range(nwords):
+        assert( await wb_read( wbs, base_addr + i ) == image[i] )
+        assert( ((await wb_read( wbs, stat_addr )) & 0x4) == 0 )
+    for i in range(nwords):
+        flash[1].mem[i] ^= 0x5A
+
+    # A threshold below the normal latency demotes the first drive
+    dut._log.info("Automatic demotion")
+    await wb_write(dut, wbs, degraded_reg, 0 )
+    await wb_write(dut, wbs, raid_type_addr, raid1 )
+    await wb_write(dut, wbs, threshold_reg, 1 )
+    for i in range(4):
+        await wb_read( wbs, base_addr + i )
+    assert( await wb_read( wbs, degraded_reg ) == 0x1 )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_coalesce(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    window_reg = 0x30000827
+    writes_reg = 0x30000828
+    bursts_reg = 0x30000829
+
+    raid0 = 0x00000001
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+
+    # Off until a window is set
+    assert( await wb_read( wbs, window_reg ) == 0 )
+    await wb_write(dut, wbs, base_addr, 0x01020304 )
+    assert( await wb_read( wbs, writes_reg ) == 0 )
+    await wb_write(dut, wbs, window_reg, 64 )
+    assert( await wb_read( wbs, window_reg ) == 64 )
+
+    # Rewrites of a held word are merged in place, a read of it flushes
+    # the run first
+    data = [ random.getrandbits(32) for i in range(2) ]
+    await wb_write(dut, wbs, base_addr + 1, data[0] )
+    assert( (await wb_read( wbs, stat_addr )) & 0x200 )
+    await wb_write(dut, wbs, base_addr + 1, data[1] )
+    assert( await wb_read( wbs, base_addr + 1 ) == data[1] )
+    assert( ((await wb_read( wbs, stat_addr )) & 0x200) == 0 )
+    assert( await wb_read( wbs, writes_reg ) == 1 )
+    assert( await wb_read( wbs, bursts_reg ) == 1 )
+    for i in range(4):
+        assert( flash[i].mem[1] == (data[1] >> (8*i)) & 0xFF )
+
+    # A held word goes out on its own once the window runs out
+    await wb_write(dut, wbs, base_addr + 7, data[0] )
+    await ClockCycles(dut.wb_clk_i, 1000)
+    assert( ((await wb_read( wbs, stat_addr )) & 0x200) == 0 )
+    assert( await wb_read( wbs, bursts_reg ) == 2 )
+    for i in range(4):
+        assert( flash[i].mem[7] == (data[0] >> (8*i)) & 0xFF )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_xip(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    xip_timeout_reg = 0x3000082A
+    xip_reads_reg = 0x3000082B
+
+    raid0 = 0x00000001
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+    data = [ random.getrandbits(32) for i in range(4) ]
+    for i in range(4):
+        await wb_write(dut, wbs, base_addr + i, data[i] )
+
+    # Off until a timeout is set
+    assert( await wb_read( wbs, xip_timeout_reg ) == 0 )
+    for i in range(4):
+        assert( await wb_read( wbs, base_addr + i ) == data[i] )
+    assert( await wb_read( wbs, xip_reads_reg ) == 0 )
+
+    # In order reads carry on one read command per drive
+    reads = [ flash[i].reads for i in range(4) ]
+    await wb_write(dut, wbs, xip_timeout_reg, 100 )
+    assert( await wb_read( wbs, xip_timeout_reg ) == 100 )
+    for i in range(4):
+        assert( await wb_read( wbs, base_addr + i ) == data[i] )
+    assert( await wb_read( wbs, xip_reads_reg ) == 3 * 4 )
+
+    # The timeout ends the stream, the next read starts a new one
+    await ClockCycles(dut.wb_clk_i, 300)
+    for i in range(4):
+        assert( flash[i].reads == reads[i] + 1 )
+    assert( await wb_read( wbs, base_addr + 2 ) == data[2] )
+    assert( ((await wb_read( wbs, stat_addr )) & 0x6) == 0 )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_drive_info(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    drive_id_reg = 0x3000082C
+    drive_caps_reg = 0x30000830
+    geometry_reg = 0x30000834
+    capacity_reg = 0x30000835
+
+    raid1 = 0x00000000
+    raid0 = 0x00000001
+    raid5 = 0x00000005
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    # First access waits for the probe, on builds with one. The FRAM has no
+    # ID, so either way each drive keeps the 2KB, 2 address byte defaults
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+    for i in range(4):
+        assert( await wb_read( wbs, drive_id_reg + i ) == 0 )
+        assert( await wb_read( wbs, drive_caps_reg + i ) == 0x0300020B )
+
+    # Whole window usable, 2048 words
+    assert( await wb_read( wbs, geometry_reg ) == ((11 << 19) | (4 << 16) | 0x800) )
+    assert( await wb_read( wbs, capacity_reg ) == 0x800 * 4 )
+    await wb_write(dut, wbs, raid_type_addr, raid5 )
+    assert( await wb_read( wbs, capacity_reg ) == 0x800 * 3 )
+    await wb_write(dut, wbs, raid_type_addr, raid1 )
+    assert( await wb_read( wbs, capacity_reg ) == 0x800 )
+
+    # Last word of the window goes to the drives and reads back
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+    data = random.getrandbits(32)
+    await wb_write(dut, wbs, base_addr + 0x7FF, data )
+    assert( await wb_read( wbs, base_addr + 0x7FF ) == data )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_hot_spare(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    stat_addr = 0x30000801
+    degraded_reg = 0x3000081E
+    spare_ctrl_reg = 0x30000836
+    spare_stat_reg = 0x30000837
+    rebuild_mark_reg = 0x30000838
+
+    raid1 = 0x00000000
+    raid0 = 0x00000001
+    nwords = 8
+
+    # FRAM models, SPI mode 0, the fifth one is the spare
+    wbs, flash = await setup(dut, ndrives=5)
+
+    # Only built in with HOT_SPARE set, test_wb_spraid does, the pipelined
+    # build keeps the default and checks the spare registers read as zero
+    if( not (await wb_read( wbs, spare_stat_reg )) & 0x100 ):
+        dut._log.info("No spare port, skipping")
+        await wb_write(dut, wbs, spare_ctrl_reg, (16 << 16) | 1 )
+        assert( await wb_read( wbs, spare_ctrl_reg ) == 0 )
+        assert( await wb_read( wbs, spare_stat_reg ) == 0 )
+        return
+
+    await wb_write(dut, wbs, raid_type_addr, raid1 )
+    image = [ random.getrandbits(8) for i in range(nwords) ]
+    for i in range(nwords):
+        await wb_write(dut, wbs, base_addr + i, image[i] )
+    last = random.getrandbits(8)
+    await wb_write(dut, wbs, base_addr + 0x7FF, last )
+
+    # Spare fitted, nothing armed yet
+    assert( await wb_read( wbs, spare_stat_reg ) == 0x100 )
+    assert( await wb_read( wbs, spare_ctrl_reg ) == (16 << 16) )
+
+    # RAID0 can't be rebuilt, an armed spare stays put
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+    await wb_write(dut, wbs, spare_ctrl_reg, (16 << 16) | 1 )
+    await wb_write(dut, wbs, degraded_reg, 0x4 )
+    await ClockCycles(dut.wb_clk_i, 20)
+    assert( await wb_read( wbs, spare_stat_reg ) == 0x101 )
+
+    # RAID1 takes the spare into slot 2 and starts copying
+    dut._log.info("RAID1 rebuild of drive 2")
+    await wb_write(dut, wbs, raid_type_addr, raid1 )
+    await ClockCycles(dut.wb_clk_i, 20)
+    status = await wb_read( wbs, spare_stat_reg )
+    assert( status == (0x100 | (2 << 4) | 0x4 | 0x2) )
+    assert( (await wb_read( wbs, stat_addr )) & 0x400 )
+
+    # Type can't change under a rebuild, host access still works
+    await wb_write(dut, wbs, raid_type_addr, raid0 )
+    assert( await wb_read( wbs, raid_type_addr ) == raid1 )
+    for i in range(nwords):
+        assert( await wb_read( wbs, base_addr + i ) == image[i] )
+
+    # Wait for the first few words to reach the spare
+    while( await wb_read( wbs, rebuild_mark_reg ) < nwords ):
+        await ClockCycles(dut.wb_clk_i, 500)
+    for i in range(nwords):
+        assert( flash[4].mem[i] == image[i] )
+
+    # Spare can't be disarmed while it holds a slot
+    await wb_write(dut, wbs, spare_ctrl_reg, 16 << 16 )
+    assert( (await wb_read( wbs, spare_stat_reg )) & 0x4 )
+
+    # Rebuild runs to the last word of the window. RAID1 reads compare every
+    # drive, the spare included
+    while( (await wb_read( wbs, stat_addr )) & 0x400 ):
+        await ClockCycles(dut.wb_clk_i, 20000)
+    assert( await wb_read( wbs, rebuild_mark_reg ) == 0x800 )
+    assert( flash[4].mem[0x7FF] == last )
+    assert( await wb_read( wbs, base_addr + 0x7FF ) == last )
+    assert( (await wb_read( wbs, stat_addr )) & 0x6 == 0 )
+
+    await ClockCycles(dut.wb_clk_i, 5)
+
+
+@cocotb.test()
+async def test_power_down(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    coalesce_window_reg = 0x30000827
+    power_ctrl_reg = 0x30000839
+    wake_time_reg = 0x3000083A
+    wake_count_reg = 0x3000083E
+    wake_stall_reg = 0x30000842
+
+    raid5 = 0x00000005
+    nwords = 8
+    wake_time = 50
+
+    # FRAM models, SPI mode 0
+    wbs, flash = await setup(dut)
+
+    await wb_write(dut, wbs, raid_type_addr, raid5 )
+    image = [ random.getrandbits(24) for i in range(nwords) ]
+    for i in range(nwords):
+        await wb_write(dut, wbs, base_addr + i, image[i] )
+    for i in range(4):
+        await wb_write(dut, wbs, wake_time_reg + i, wake_time )
+        assert( await wb_read( wbs, wake_time_reg + i ) == wake_time )
+
+    # Idle drives go to sleep
+    await wb_write(dut, wbs, power_ctrl_reg, 100 )
+    await ClockCycles(dut.wb_clk_i, 300)
+    for i in range(4):
+        assert( flash[i].asleep )
+    assert( ((await wb_read( wbs, power_ctrl_reg )) >> 20) == 0xF )
+
+    # First access wakes them and waits out the wake up time
+    for i in range(nwords):
+        assert( await wb_read( wbs, base_addr + i ) == image[i] )
+    for i in range(4):
+        assert( flash[i].wakes == 1 )
+        assert( await wb_read( wbs, wake_count_reg + i ) == 1 )
+        assert( await wb_read( wbs, wake_stall_reg + i ) >= wake_time )
+
+    # Writes wake them too
+    await ClockCycles(dut.wb_clk_i, 300)
+    image[2] = random.getrandbits(24)
+    await wb_write(dut, wbs, base_addr + 2, image[2] )
+    assert( await wb_read( wbs, base_addr + 2 ) == image[2] )
+    assert( await wb_read( wbs, wake_count_reg ) == 2 )
+
+    # Writes held for a flush wake the drives ahead of it, so nothing waits
+    await wb_write(dut, wbs, coalesce_window_reg, 500 )
+    await ClockCycles(dut.wb_clk_i, 300)
+    assert( flash[0].asleep )
+    stall = await wb_read( wbs, wake_stall_reg )
+    image[4] = random.getrandbits(24)
+    await wb_write(dut, wbs, base_addr + 4, image[4] )
+    await ClockCycles(dut.wb_clk_i, 700)
+    assert( await wb_read( wbs, wake_stall_reg ) == stall )
+    assert( await wb_read( wbs, base_addr + 4 ) == image[4] )
+    await wb_write(dut, wbs, coalesce_window_reg, 0 )
+
+    # Keep awake brings them up and holds them there
+    await ClockCycles(dut.wb_clk_i, 300)
+    assert( flash[0].asleep )
+    await wb_write(dut, wbs, power_ctrl_reg, 100 | (1 << 16) )
+    await ClockCycles(dut.wb_clk_i, 500)
+    for i in range(4):
+        assert( not flash[i].asleep )
+    assert( await wb_read( wbs, wake_stall_reg ) == stall )
+
+    # Counters clear on write
+    await wb_write(dut, wbs, power_ctrl_reg, 0 )
+    await wb_write(dut, wbs, wake_count_reg, 0 )
+    await wb_write(dut, wbs, wake_stall_reg, 0 )
+    assert( await wb_read( wbs, wake_count_reg ) == 0 )
+    assert( await wb_read( wbs, wake_stall_reg ) == 0 )
+
+    await ClockCycles(dut.wb_clk_i, 5)
@@ -0,0 +1,120 @@
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles, Timer
+from cocotb.utils import get_sim_time
+import random
+from cocotbext.wishbone.driver import WishboneMaster, WBOp
+from cocotbext.spi import SpiSignals
+from .FM25C160B import FM25C160B
+
+
+# Read and write operations for wishbone
+async def wb_write( wbs, addr, data ):
+    await wbs.send_cycle([WBOp(addr, data)])
+
+
+async def wb_read( wbs, addr ):
+    results = await wbs.send_cycle([WBOp(addr)])
+    data = [entry.datrd for entry in results]
+    return data[0]
+
+
+# One Wishbone master per port
+def port_master(dut, port):
+    signals_dict = {
+        "cyc": "wb%d_cyc_i" % port,
+        "stb": "wb%d_stb_i" % port,
+        "we": "wb%d_we_i" % port,
+        "adr": "wb%d_adr_i" % port,
+        "datwr" : "wb%d_dat_i" % port,
+        "datrd" : "wb%d_dat_o" % port,
+        "sel" : "wb%d_sel_i" % port,
+        "ack" : "wb%d_ack_o" % port
+    }
+    return WishboneMaster( dut, "", dut.wb_clk_i, width=32, timeout=10000, signals_dict=signals_dict)
+
+
+@cocotb.test()
+async def test_wb_spraid_mp(dut):
+
+    # Register map
+    base_addr = 0x30000000
+    raid_type_addr = 0x30000800
+    arb_stat_addr = 0x30000815
+
+    raid0 = 0x00000001
+
+    # Setup FRAM models, SPI mode 0
+    flash = []
+    for i in range(4):
+        spi = SpiSignals(
+            sclk = getattr(dut, "spi%d_clk" % i),
+            mosi = getattr(dut, "spi%d_mosi" % i),
+            miso = getattr(dut, "spi%d_miso" % i),
+            cs   = getattr(dut, "spi%d_cs" % i)
+        )
+        flash.append( FM25C160B( spi, 0, dut ) )
+
+    # Start clock
+    clock = Clock(dut.wb_clk_i, 10, units="us")
+    clk_thread = cocotb.start_soon(clock.start())
+
+    wbs0 = port_master(dut, 0)
+    wbs1 = port_master(dut, 1)
+
+    dut.spi0_miso.value = 0
+    dut.spi1_miso.value = 0
+    dut.spi2_miso.value = 0
+    dut.spi3_miso.value = 0
+    dut.wb_rst_i.value = 1
+    await ClockCycles(dut.wb_clk_i, 5)
+    dut.wb_rst_i.value = 0
+    await ClockCycles(dut.wb_clk_i, 10)
+
+    await wb_write( wbs0, raid_type_addr, raid0 )
+
+    # Port 0 runs a long burst, port 1 a short one at the same time
+    burst0 = [ random.getrandbits(32) for i in range(24) ]
+    burst1 = [ random.getrandbits(32) for i in range(6) ]
+    finish = {}
+
+    async def run_port(wbs, port, offset, data):
+        for i in range(len(data)):
+            await wb_write( wbs, base_addr + offset + i, data[i] )
+        for i in range(len(data)):
+            assert( await wb_read( wbs, base_addr + offset + i ) == data[i] )
+        finish[port] = get_sim_time(units="us")
+
+    dut._log.info("Running both ports")
+    port0 = cocotb.start_soon( run_port(wbs0, 0, 0x000, burst0) )
+    port1 = cocotb.start_soon( run_port(wbs1, 1, 0x200, burst1) )
+    await port0
+    await port1
+
+    # Round robin interleaves operations, so the short burst is not stuck
+    # behind the long one
+    dut._log.info("Port 0 done at %d us, port 1 done at %d us" % (finish[0], finish[1]))
+    assert( finish[1] < finish[0] )
+
+    # Latency counters, readable from either port
+    ops0 = await wb_read( wbs1, arb_stat_addr + 0 )
+    total0 = await wb_read( wbs1, arb_stat_addr + 1 )
+    max0 = await wb_read( wbs1, arb_stat_addr + 2 )
+    ops1 = await wb_read( wbs0, arb_stat_addr + 4 )
+    total1 = await wb_read( wbs0, arb_stat_addr + 5 )
+    max1 = await wb_read( wbs0, arb_stat_addr + 6 )
+    dut._log.info("Port 0: %d ops, %d cycles, worst %d" % (ops0, total0, max0))
+    dut._log.info("Port 1: %d ops, %d cycles, worst %d" % (ops1, total1, max1))
+    assert( ops0 == 1 + 2 * len(burst0) )
+    assert( ops1 == 2 * len(burst1) )
+    assert( max0 <= total0 )
+    assert( max1 <= total1 )
+
+    # Waiting on the other port at most doubles the worst case
+    assert( max1 <= 2 * max0 + 8 )
+
+    # Writing clears a port's counters
+    await wb_write( wbs1, arb_stat_addr + 4, 0 )
+    assert( await wb_read( wbs1, arb_stat_addr + 4 ) == 0 )
+
+    await ClockCycles(dut.wb_clk_i, 5)
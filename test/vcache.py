@@ -0,0 +1,251 @@
+""" Compile cache for the simulation builds
+
+Wraps the iverilog call in the Makefile. The compiler version, its arguments,
+so the tops, defines and parameters, and the contents of every source file
+and anything it includes are hashed, and a .vvp already built from the same
+inputs is copied out of the cache instead of compiling again. Command files
+given with -c or -f are read for the files they name, and library files and
+every file in a library directory that iverilog could pick a module from are
+hashed as well.
+
+    python -m test.vcache --cache .vcache -o sim_build/sim.vvp -- iverilog -s raid -g2012 src/raid.v
+
+Entries are written under a temporary name and renamed into place, so
+targets running side by side can share the cache. The least recently used
+are dropped once there are more than --keep.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+INCLUDE = re.compile(rb'`include\s+"([^"]+)"')
+VARIABLE = re.compile(r'\$\((\w+)\)')
+
+# Options whose value is the next argument
+_VALUE_OPTS = ( '-o', '-s', '-g', '-D', '-P', '-I', '-c', '-f', '-y', '-Y', '-l', '-M', '-m', '-p', '-T', '-W', '-B', '-N' )
+
+# Of those, the ones naming something read, also taken joined to the value
+_INPUT_OPTS = ( '-I', '-c', '-f', '-y', '-Y', '-l' )
+
+
+class _Inputs:
+    """ Files and directories a compile reads """
+
+    def __init__(self):
+        self.sources = []       # Sources, library files and command files
+        self.incdirs = []
+        self.libdirs = []
+        self.libexts = []
+        self.cmdfiles = set()
+
+    def option(self, opt, value):
+        if( opt == '-I' ):
+            self.incdirs.append(value)
+        elif( opt in ( '-c', '-f' ) ):
+            self.sources.append(value)
+            self.command_file(value)
+        elif( opt == '-y' ):
+            self.libdirs.append(value)
+        elif( opt == '-Y' ):
+            self.libexts.append(value)
+        elif( opt in ( '-l', '-v' ) ):
+            self.sources.append(value)
+
+    def command_file(self, path):
+        """ Read a command file, one or more names or options a line """
+        path = os.path.normpath(path)
+        if( (path in self.cmdfiles) or not os.path.exists(path) ):
+            return
+        self.cmdfiles.add(path)
+        with open(path) as f:
+            text = f.read()
+
+        words = []
+        for line in text.splitlines():
+            line = line.split('//', 1)[0].split('#', 1)[0]
+            line = VARIABLE.sub(lambda m: os.environ.get(m.group(1), ''), line)
+            words += line.split()
+
+        i = 0
+        while( i < len(words) ):
+            word = words[i]
+            plus = word.split('+')
+            if( word.startswith('+incdir+') ):
+                self.incdirs += [ d for d in plus[2:] if d ]
+            elif( word.startswith('+libdir+') or word.startswith('+libdir-nocase+') ):
+                self.libdirs += [ d for d in plus[2:] if d ]
+            elif( word.startswith('+libext+') ):
+                self.libexts += [ e for e in plus[2:] if e ]
+            elif( word.startswith('+') ):
+                # Defines, parameters and the like, in the file's own hash
+                pass
+            elif( word in ( '-c', '-f', '-l', '-v', '-y', '-Y' ) ):
+                if( i + 1 < len(words) ):
+                    self.option(word, words[i + 1])
+                i += 1
+            elif( not word.startswith('-') ):
+                self.sources.append(word)
+            i += 1
+
+    def libraries(self):
+        """ Files in the library directories, in a fixed order """
+        exts = tuple(self.libexts) or ( '.v', )
+        for d in self.libdirs:
+            if( not os.path.isdir(d) ):
+                yield d, None
+                continue
+            for name in sorted(os.listdir(d)):
+                if( name.endswith(exts) and os.path.isfile(os.path.join(d, name)) ):
+                    yield d, os.path.join(d, name)
+
+
+def _sources(args):
+    """ What the command line names, with command files read """
+    inputs = _Inputs()
+    i = 0
+    while( i < len(args) ):
+        arg = args[i]
+        if( arg in _VALUE_OPTS ):
+            if( i + 1 < len(args) ):
+                inputs.option(arg, args[i + 1])
+            i += 2
+            continue
+        if( arg[:2] in _INPUT_OPTS ):
+            inputs.option(arg[:2], arg[2:])
+        elif( not arg.startswith('-') ):
+            inputs.sources.append(arg)
+        i += 1
+    return inputs
+
+
+def _hash_file(h, path, incdirs, seen):
+    """ Add a file and, in turn, whatever it includes """
+    path = os.path.normpath(path)
+    if( path in seen ):
+        return
+    seen.add(path)
+
+    h.update(b'file\0' + path.encode() + b'\0')
+    with open(path, 'rb') as f:
+        data = f.read()
+    h.update(hashlib.sha256(data).digest())
+
+    for name in INCLUDE.findall(data):
+        name = name.decode()
+        for d in [ os.path.dirname(path) ] + incdirs + [ '.' ]:
+            candidate = os.path.join(d, name)
+            if( os.path.exists(candidate) ):
+                _hash_file(h, candidate, incdirs, seen)
+                break
+        else:
+            # Not found here, iverilog will say so, but keep it in the key
+            h.update(b'missing\0' + name.encode() + b'\0')
+
+
+def _version(compiler):
+    try:
+        out = subprocess.run([ compiler, '-V' ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    except OSError:
+        return b''
+    return out.splitlines()[0] if out else b''
+
+
+def key(command):
+    """ Hash of everything the output of command depends on """
+    h = hashlib.sha256()
+    h.update(_version(command[0]) + b'\0')
+    for arg in command[1:]:
+        h.update(arg.encode() + b'\0')
+
+    inputs = _sources(command[1:])
+    seen = set()
+    for path in inputs.sources:
+        if( os.path.exists(path) ):
+            _hash_file(h, path, inputs.incdirs, seen)
+        else:
+            h.update(b'missing\0' + path.encode() + b'\0')
+
+    # Any of these can end up in the build, so a file added, removed or
+    # changed in a library directory is a different build
+    for d, path in inputs.libraries():
+        if( path is None ):
+            h.update(b'missing\0' + d.encode() + b'\0')
+        else:
+            _hash_file(h, path, inputs.incdirs, seen)
+    return h.hexdigest()
+
+
+def _prune(cache, keep):
+    entries = [ os.path.join(cache, e) for e in os.listdir(cache) if e.endswith('.vvp') ]
+    if( len(entries) <= keep ):
+        return
+    entries.sort(key=lambda e: os.stat(e).st_mtime)
+    for e in entries[:len(entries) - keep]:
+        try:
+            os.remove(e)
+        except OSError:
+            pass
+
+
+def _run(command):
+    try:
+        return subprocess.call(command)
+    except OSError as e:
+        print('vcache: %s: %s' % (command[0], e.strerror), file=sys.stderr)
+        return 127
+
+
+def build(command, out, cache, keep=32):
+    """ Build out with command, or copy it from the cache
+
+    :return: compiler exit code, 0 on a cache hit
+    """
+    if( not cache ):
+        return _run(command + [ '-o', out ])
+
+    os.makedirs(cache, exist_ok=True)
+    entry = os.path.join(cache, key(command) + '.vvp')
+    if( os.path.exists(entry) ):
+        # Touch it so it counts as recently used
+        os.utime(entry)
+        shutil.copyfile(entry, out)
+        print('vcache: hit %s' % (os.path.basename(entry)[:16]))
+        return 0
+
+    fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=cache)
+    os.close(fd)
+    try:
+        rc = _run(command + [ '-o', tmp ])
+        if( rc == 0 ):
+            shutil.copyfile(tmp, out)
+            os.replace(tmp, entry)
+            print('vcache: miss %s' % (os.path.basename(entry)[:16]))
+            _prune(cache, keep)
+        return rc
+    finally:
+        if( os.path.exists(tmp) ):
+            os.remove(tmp)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cached iverilog compile')
+    parser.add_argument('-o', dest='out', required=True, help='output .vvp')
+    parser.add_argument('--cache', default='.vcache', help='cache directory, empty to always compile')
+    parser.add_argument('--keep', type=int, default=32, help='entries to keep')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='-- compiler and its arguments, without -o')
+    args = parser.parse_args(argv)
+
+    command = args.command[1:] if args.command[:1] == [ '--' ] else args.command
+    if( not command ):
+        parser.error('no compiler command')
+    return build(command, args.out, args.cache, args.keep)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+/* Two port wb_spraid_mp with one set of named signals per port, so each can
+* be driven by its own WishboneMaster */
+`default_nettype none
+`timescale 1ns/1ns
+
+module wb_spraid_2port #(
+		parameter ARB_MODE = `ARB_ROUND_ROBIN
+	)
+	(
+	input			wb_clk_i,
+	input			wb_rst_i,
+
+	/* Port 0 */
+	input			wb0_cyc_i,
+	input			wb0_stb_i,
+	input			wb0_we_i,
+	input  [31:0]	wb0_adr_i,
+	input  [31:0]	wb0_dat_i,
+	input  [3:0]	wb0_sel_i,
+	output [31:0]	wb0_dat_o,
+	output			wb0_ack_o,
+	output			wb0_stall_o,
+
+	/* Port 1 */
+	input			wb1_cyc_i,
+	input			wb1_stb_i,
+	input			wb1_we_i,
+	input  [31:0]	wb1_adr_i,
+	input  [31:0]	wb1_dat_i,
+	input  [3:0]	wb1_sel_i,
+	output [31:0]	wb1_dat_o,
+	output			wb1_ack_o,
+	output			wb1_stall_o,
+
+	/* SPI0 */
+	output 			spi0_clk,
+	output 			spi0_cs,
+	output 			spi0_mosi,
+	input  			spi0_miso,
+
+	/* SPI1 */
+	output 			spi1_clk,
+	output 			spi1_cs,
+	output 			spi1_mosi,
+	input			spi1_miso,
+
+	/* SPI2 */
+	output 			spi2_clk,
+	output 			spi2_cs,
+	output 			spi2_mosi,
+	input			spi2_miso,
+
+	/* SPI3 */
+	output 			spi3_clk,
+	output 			spi3_cs,
+	output 			spi3_mosi,
+	input			spi3_miso
+);
+
+	wb_spraid_mp #(
+		.NPORTS( 2 ),
+		.ARB_MODE( ARB_MODE )
+	) spraid (
+		.wb_clk_i( wb_clk_i ),
+		.wb_rst_i( wb_rst_i ),
+
+		.wb_cyc_i( { wb1_cyc_i, wb0_cyc_i } ),
+		.wb_stb_i( { wb1_stb_i, wb0_stb_i } ),
+		.wb_we_i( { wb1_we_i, wb0_we_i } ),
+		.wb_adr_i( { wb1_adr_i, wb0_adr_i } ),
+		.wb_dat_i( { wb1_dat_i, wb0_dat_i } ),
+		.wb_sel_i( { wb1_sel_i, wb0_sel_i } ),
+		.wb_dat_o( { wb1_dat_o, wb0_dat_o } ),
+		.wb_ack_o( { wb1_ack_o, wb0_ack_o } ),
+		.wb_stall_o( { wb1_stall_o, wb0_stall_o } ),
+		.wb_err_o(),
+		.wb_rty_o(),
+
+		.spi0_clk(spi0_clk),
+		.spi0_cs(spi0_cs),
+		.spi0_mosi(spi0_mosi),
+		.spi0_miso(spi0_miso),
+
+		.spi1_clk(spi1_clk),
+		.spi1_cs(spi1_cs),
+		.spi1_mosi(spi1_mosi),
+		.spi1_miso(spi1_miso),
+
+		.spi2_clk(spi2_clk),
+		.spi2_cs(spi2_cs),
+		.spi2_mosi(spi2_mosi),
+		.spi2_miso(spi2_miso),
+
+		.spi3_clk(spi3_clk),
+		.spi3_cs(spi3_cs),
+		.spi3_mosi(spi3_mosi),
+		.spi3_miso(spi3_miso)
+	);
+
+endmodule